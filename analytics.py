@@ -0,0 +1,285 @@
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+
+from session_store import SessionStore
+from textnorm import detect_language, query_key
+
+# ---------------- Streaming Log Analytics ----------------
+# يقرأ سجلات الجلسات (data_shopping.json، all_chats_unified.json/.jsonl، data_shopping.db) سجلًا سجلًا
+# بمحلل JSON تدريجي، ويجمع الأعمدة في مصفوفات NumPy بحجم ثابت (ANALYTICS_CHUNK_ROWS) تُدمج في
+# هيستوغرامات ثابتة الحدود، فالذاكرة محدودة مهما كبر الملف والنسب المئوية تُحسب من الهيستوغرام.
+ANALYTICS_CHUNK_ROWS = int(os.getenv("ANALYTICS_CHUNK_ROWS", "4096"))
+ANALYTICS_READ_BYTES = int(os.getenv("ANALYTICS_READ_BYTES", str(1 << 16)))
+ANALYTICS_TOP_QUERIES = int(os.getenv("ANALYTICS_TOP_QUERIES", "20"))
+ANALYTICS_QUERY_CAPACITY = int(os.getenv("ANALYTICS_QUERY_CAPACITY", "10000"))  # أسئلة مميزة تُعدّ في الذاكرة
+
+SCORE_FIELDS = ("faithfulness", "relevance", "completeness", "total")
+SCORE_BINS = 101  # درجات 0..100 بدقة 1
+# زمن الاستجابة بالمللي ثانية: حدود لوغاريتمية 1ms..10min (دقة ~4%)، والخانة الأولى لما دون 1ms
+LATENCY_EDGES = np.geomspace(1.0, 600000.0, 321)
+LATENCY_BINS = len(LATENCY_EDGES) + 1
+LATENCY_VALUES = np.concatenate(([0.5], np.sqrt(LATENCY_EDGES[:-1] * LATENCY_EDGES[1:]), [LATENCY_EDGES[-1]]))
+PERCENTILES = (50, 90, 95, 99)
+UNKNOWN_DAY = "unknown"
+
+# ---------------- Incremental JSON Parser ----------------
+# مصفوفة JSON كبيرة ([{...}, {...}]) أو قيم متتالية (JSONL) تُقرأ على أجزاء بـ raw_decode،
+# ولا يبقى في الذاكرة إلا الجزء الذي لم يُحلَّل بعد.
+class JSONStreamError(ValueError):
+    pass
+
+_decoder = json.JSONDecoder()
+_WHITESPACE = " \t\r\n"
+
+def iter_json_records(f, read_size=ANALYTICS_READ_BYTES):
+    buf, pos, eof = "", 0, False
+    in_array = None
+
+    def fill():
+        nonlocal buf, pos, eof
+        chunk = f.read(read_size)
+        if not chunk:
+            eof = True
+        buf = buf[pos:] + chunk
+        pos = 0
+
+    while True:
+        while pos < len(buf) and buf[pos] in _WHITESPACE:
+            pos += 1
+        if pos >= len(buf):
+            if eof:
+                if in_array:
+                    raise JSONStreamError("Unexpected end of file inside a JSON array")
+                return
+            fill()
+            continue
+
+        if in_array is None:
+            in_array = buf[pos] == "["
+            if in_array:
+                pos += 1
+            continue
+        if in_array and buf[pos] == ",":
+            pos += 1
+            continue
+        if in_array and buf[pos] == "]":
+            return
+
+        try:
+            value, end = _decoder.raw_decode(buf, pos)
+        except json.JSONDecodeError as e:
+            if eof:
+                raise JSONStreamError(f"Invalid JSON near offset {e.pos}: {e.msg}")
+            fill()
+            continue
+        # رقم أو نص قد يكون مقطوعًا عند نهاية الجزء: نقرأ المزيد ونعيد المحاولة
+        if end == len(buf) and not eof:
+            fill()
+            continue
+        pos = end
+        yield value
+
+def iter_file(path, read_size=ANALYTICS_READ_BYTES):
+    with open(path, "r", encoding="utf-8") as f:
+        try:
+            yield from iter_json_records(f, read_size)
+        except JSONStreamError as e:
+            # سطر أخير ناقص بعد توقف مفاجئ: نكتفي بما قُرئ
+            print(f"Stopped reading {path}: {e}")
+
+# ---------------- Columnar Aggregation ----------------
+# الأعمدة لكل سجل: مجموعة (المصدر، اللغة، اليوم)، الدرجات الأربع، الزمن الكلي؛ NaN = غير موجود
+class LogAggregator:
+    def __init__(self, chunk_rows=ANALYTICS_CHUNK_ROWS, query_capacity=ANALYTICS_QUERY_CAPACITY):
+        self.chunk_rows = chunk_rows
+        self.query_capacity = query_capacity
+        self.groups = {}  # (source, language, day) -> رقم المجموعة
+        self.score_hist = np.zeros((0, len(SCORE_FIELDS), SCORE_BINS), dtype=np.int64)
+        self.score_sum = np.zeros((0, len(SCORE_FIELDS)))
+        self.latency_hist = np.zeros((0, LATENCY_BINS), dtype=np.int64)
+        self.latency_sum = np.zeros(0)
+        self.records = 0
+        self.query_counts = {}
+        self._group_col = np.empty(chunk_rows, dtype=np.int32)
+        self._score_col = np.empty((chunk_rows, len(SCORE_FIELDS)), dtype=np.float64)
+        self._latency_col = np.empty(chunk_rows, dtype=np.float64)
+        self._rows = 0
+
+    def _group(self, key):
+        gid = self.groups.get(key)
+        if gid is None:
+            gid = self.groups[key] = len(self.groups)
+            self.score_hist = np.concatenate([self.score_hist, np.zeros((1, len(SCORE_FIELDS), SCORE_BINS), dtype=np.int64)])
+            self.score_sum = np.concatenate([self.score_sum, np.zeros((1, len(SCORE_FIELDS)))])
+            self.latency_hist = np.concatenate([self.latency_hist, np.zeros((1, LATENCY_BINS), dtype=np.int64)])
+            self.latency_sum = np.concatenate([self.latency_sum, np.zeros(1)])
+        return gid
+
+    # عدّ تقريبي بذاكرة ثابتة (Misra-Gries): الأسئلة الأكثر تكرارًا تبقى، والنادرة تُحذف
+    def _count_query(self, query):
+        key = query_key(query)
+        if not key:
+            return
+        if key in self.query_counts or len(self.query_counts) < self.query_capacity:
+            self.query_counts[key] = self.query_counts.get(key, 0) + 1
+            return
+        for k in list(self.query_counts):
+            self.query_counts[k] -= 1
+            if self.query_counts[k] <= 0:
+                del self.query_counts[k]
+
+    def add(self, session, source):
+        query = session.get("query") or ""
+        self._count_query(query)
+        # يوم طرح السؤال: updated_at يتغير أيضًا عند كتابة التقييم (rescore.py --write-back)
+        timestamp = session.get("last_asked_at") or session.get("created_at")
+        day = time.strftime("%Y-%m-%d", time.gmtime(timestamp)) if isinstance(timestamp, (int, float)) else UNKNOWN_DAY
+
+        scores = session.get("evaluation_score")
+        scores = scores if isinstance(scores, dict) else {}
+        latency = (session.get("timings") or {}).get("total")
+
+        row = self._rows
+        self._group_col[row] = self._group((source, detect_language(query), day))
+        for i, field in enumerate(SCORE_FIELDS):
+            value = scores.get(field)
+            self._score_col[row, i] = value if isinstance(value, (int, float)) else np.nan
+        self._latency_col[row] = latency if isinstance(latency, (int, float)) else np.nan
+        self._rows += 1
+        self.records += 1
+        if self._rows == self.chunk_rows:
+            self.flush()
+
+    # دمج الجزء الحالي في الهيستوغرامات: bincount على (مجموعة × خانة) بدل حلقة لكل سجل
+    def flush(self):
+        n = self._rows
+        if not n:
+            return
+        groups = self._group_col[:n]
+        scores = self._score_col[:n]
+        for i in range(len(SCORE_FIELDS)):
+            column = scores[:, i]
+            present = ~np.isnan(column)
+            bins = np.clip(np.rint(column[present]), 0, SCORE_BINS - 1).astype(np.int64)
+            flat = groups[present].astype(np.int64) * SCORE_BINS + bins
+            counts = np.bincount(flat, minlength=len(self.groups) * SCORE_BINS)
+            self.score_hist[:, i, :] += counts.reshape(len(self.groups), SCORE_BINS)
+            np.add.at(self.score_sum[:, i], groups[present], column[present])
+
+        latency = self._latency_col[:n]
+        present = ~np.isnan(latency)
+        bins = np.searchsorted(LATENCY_EDGES, latency[present], side="right")
+        flat = groups[present].astype(np.int64) * LATENCY_BINS + bins
+        self.latency_hist += np.bincount(flat, minlength=len(self.groups) * LATENCY_BINS).reshape(len(self.groups), LATENCY_BINS)
+        np.add.at(self.latency_sum, groups[present], latency[present])
+        self._rows = 0
+
+    def consume(self, sessions, source):
+        for session in sessions:
+            if isinstance(session, dict):
+                self.add(session, source)
+        self.flush()
+
+    # ---------------- Report ----------------
+    def _by(self, dimension):
+        index = {"source": 0, "language": 1, "day": 2}[dimension]
+        buckets = {}
+        for key, gid in self.groups.items():
+            buckets.setdefault(key[index], []).append(gid)
+        return dict(sorted(buckets.items()))
+
+    def report(self, top=ANALYTICS_TOP_QUERIES):
+        self.flush()
+        scores, latency = {}, {}
+        for dimension in ("language", "day", "source"):
+            scores[dimension], latency[dimension] = {}, {}
+            for value, gids in self._by(dimension).items():
+                hist = self.score_hist[gids].sum(axis=0)
+                sums = self.score_sum[gids].sum(axis=0)
+                scores[dimension][value] = {
+                    field: summarize_hist(hist[i], sums[i], np.arange(SCORE_BINS))
+                    for i, field in enumerate(SCORE_FIELDS)
+                }
+                latency[dimension][value] = summarize_hist(
+                    self.latency_hist[gids].sum(axis=0), self.latency_sum[gids].sum(), LATENCY_VALUES
+                )
+        ranked = sorted(self.query_counts.items(), key=lambda kv: kv[1], reverse=True)[:top]
+        return {
+            "records": self.records,
+            "scores": scores,
+            "latency_ms": latency,
+            # حد أدنى للعدد الحقيقي (العدّ التقريبي يطرح من الكل عند الامتلاء)
+            "top_queries": [{"query": q, "count": c} for q, c in ranked],
+        }
+
+def summarize_hist(hist, total, values):
+    count = int(hist.sum())
+    if not count:
+        return {"count": 0}
+    cumulative = np.cumsum(hist)
+    ranks = np.ceil(np.array(PERCENTILES) / 100 * count)
+    picked = values[np.searchsorted(cumulative, ranks)]
+    summary = {"count": count, "mean": round(float(total) / count, 2)}
+    summary.update({f"p{p}": round(float(v), 2) for p, v in zip(PERCENTILES, picked)})
+    return summary
+
+# ---------------- Sources ----------------
+def analyze(json_paths=(), db_path=None, chunk_rows=ANALYTICS_CHUNK_ROWS, top=ANALYTICS_TOP_QUERIES,
+            read_size=ANALYTICS_READ_BYTES):
+    aggregator = LogAggregator(chunk_rows=chunk_rows)
+    for path in json_paths:
+        aggregator.consume(iter_file(path, read_size), os.path.basename(path))
+    if db_path:
+        store = SessionStore(db_path)
+        try:
+            aggregator.consume(store.iter_sessions(with_times=True), os.path.basename(db_path))
+        finally:
+            store.close()
+    return aggregator.report(top)
+
+def print_report(report):
+    print(f"records: {report['records']}")
+    for dimension, values in report["scores"].items():
+        print(f"\nevaluation scores by {dimension}:")
+        print(f"  {'':<24}{'field':<14}{'count':>7}{'mean':>8}{'p50':>7}{'p90':>7}{'p99':>7}")
+        for value, fields in values.items():
+            for field, s in fields.items():
+                if s["count"]:
+                    print(f"  {value:<24}{field:<14}{s['count']:>7}{s['mean']:>8}{s['p50']:>7}{s['p90']:>7}{s['p99']:>7}")
+    for dimension, values in report["latency_ms"].items():
+        print(f"\nlatency (ms) by {dimension}:")
+        for value, s in values.items():
+            if s["count"]:
+                print(f"  {value:<24}count={s['count']:<7} mean={s['mean']:<10} p50={s['p50']:<10} p95={s['p95']:<10} p99={s['p99']}")
+    print("\ntop queries:")
+    for row in report["top_queries"]:
+        print(f"  {row['count']:>6}  {row['query']}")
+
+# ---------------- CLI ----------------
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Stream the session/evaluation logs and report score and latency statistics")
+    parser.add_argument("paths", nargs="*",
+                        help="JSON array or JSONL logs (default: data_shopping.json, all_chats_unified.json(l) if present)")
+    parser.add_argument("--db", default=os.getenv("SESSION_DB", "data_shopping.db"), help="session store ('' to skip)")
+    parser.add_argument("--top", type=int, default=ANALYTICS_TOP_QUERIES)
+    parser.add_argument("--chunk-rows", type=int, default=ANALYTICS_CHUNK_ROWS)
+    parser.add_argument("--output", help="write the JSON report here")
+    args = parser.parse_args(argv)
+
+    paths = args.paths or [
+        p for p in ("data_shopping.json", "all_chats_unified.json", "all_chats_unified.jsonl") if os.path.exists(p)
+    ]
+    db_path = args.db if args.db and os.path.exists(args.db) else None
+    report = analyze(paths, db_path, chunk_rows=args.chunk_rows, top=args.top)
+    print_report(report)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+
+if __name__ == "__main__":
+    main()
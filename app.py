@@ -1,24 +1,108 @@
 import os
-import requests
 import uuid
+import copy
+import contextlib
 import json
+import math
+import time
+from concurrent.futures import ThreadPoolExecutor
 from urllib.parse import urljoin
-from fastapi import FastAPI, Query
+from fastapi import FastAPI, Header, HTTPException, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from dotenv import load_dotenv
 
 # ---------------- Load Environment ----------------
 load_dotenv(r"C:\Users\SarahAlqahtani\Documents\SerpAPI_Research\serpapi_shopping\.env")
 
 SERPAPI_KEY = os.getenv("SERPAPI_KEY")
+SERPAPI_URL = os.getenv("SERPAPI_URL", "https://serpapi.com/search.json")
 GROQ_KEY = os.getenv("GROQ_KEY")
 GROQ_URL = os.getenv("GROQ_URL")
 GROQ_MODEL = os.getenv("GROQ_MODEL")
 
-ALL_CHATS_FILE = "data_shopping.json"
+# يُستورد بعد load_dotenv لأن إعدادات المجمع تُقرأ من البيئة
+from upstream import serpapi_client, groq_client, image_client, upstream_stats, CLIENTS
+from governor import UpstreamUnavailable
+from cache import TTLCache, SqliteCache, TieredCache, make_cache_key, content_hash
+from session_store import SessionStore
+from evaluation_worker import EvaluationQueue, DONE, PENDING
+from ranker import rank_products
+from textnorm import detect_language, normalize_text, query_key, STOPWORDS
+from metrics import REGISTRY, SEARCH_REQUESTS, SEARCH_COALESCED, FAST_MODE_RESULTS, CATALOG_LOOKUPS, RequestTimings
+from singleflight import SingleFlight
+from query_planner import plan_query
+from catalog import Catalog
+from fast_mode import build_fast_messages, parse_fast_response, FastModeError, FAST_EXTRA_TOKENS
+from prompt_builder import (
+    build_context, build_grouped_context, fill_context, estimate_messages_tokens, CONTEXT_SLOT,
+    PROMPT_INPUT_TOKENS, REPLY_MAX_TOKENS, FILTER_MAX_TOKENS, EVAL_MAX_TOKENS,
+)
+from conversation import ConversationStore, is_follow_up
+from response_format import FieldSelectionError, compact_session, dumps, encode_body, parse_fields, select_fields
+from cache_warmer import (
+    CacheWarmer, CACHE_WARMER_ENABLED, CACHE_WARMER_REFRESH_AHEAD, CACHE_WARMER_REPLIES, CACHE_WARMER_MAX_TOKENS,
+)
+from pagination import (
+    CursorError, decode_cursor, first_page_cursors, next_page, SEARCH_PAGE_SIZE, PRODUCTS_PAGE_SIZE,
+)
+from image_proxy import (
+    ImageProxy, ImageProxyError, DiskImageCache, proxy_url, verify_signature, IMAGE_CACHE_MAX_AGE, IMAGE_PROXY_SECRET,
+)
+
+# سجل الجلسات (يحل محل data_shopping.json؛ للترحيل: python session_store.py migrate)
+SESSION_DB = os.getenv("SESSION_DB", "data_shopping.db")
+session_store = SessionStore(SESSION_DB)
+
+# حالة المحادثة لكل session_id (في الذاكرة): الأسئلة السابقة ومنتجات آخر بحث
+conversations = ConversationStore()
+
+# أقصى عدد من العناصر التي تتم معالجتها بالتوازي في طلب واحد
+SEARCH_MAX_CONCURRENCY = int(os.getenv("SEARCH_MAX_CONCURRENCY", "4"))
+
+# ---------------- SerpAPI Results Cache ----------------
+SERP_CACHE_TTL = float(os.getenv("SERP_CACHE_TTL", "900"))
+SERP_CACHE_MAX_ENTRIES = int(os.getenv("SERP_CACHE_MAX_ENTRIES", "1024"))
+SERP_CACHE_DB = os.getenv("SERP_CACHE_DB")  # اختياري: طبقة على القرص تبقى بعد إعادة التشغيل
+SERP_CACHE_PURGE_EVERY = int(os.getenv("SERP_CACHE_PURGE_EVERY", "256"))  # حذف المنتهي من القرص كل N كتابة
+
+serp_cache = TieredCache(
+    TTLCache(max_entries=SERP_CACHE_MAX_ENTRIES, ttl=SERP_CACHE_TTL),
+    SqliteCache(SERP_CACHE_DB, ttl=SERP_CACHE_TTL, purge_every=SERP_CACHE_PURGE_EVERY) if SERP_CACHE_DB else None,
+)
+
+# ---------------- Local Product Catalog ----------------
+# اختياري: كل نتائج SerpAPI تُفهرس محليًا (FTS5) وتُستخدم للأسئلة المشابهة ما دامت حديثة
+CATALOG_DB = os.getenv("CATALOG_DB")
+catalog = Catalog(CATALOG_DB) if CATALOG_DB else None
+
+# ---------------- Groq Response Cache ----------------
+# نفس (model, messages) = نفس الرد: مفتاح المحتوى hash، مع حد للحجم بالبايت
+GROQ_CACHE_TTL = float(os.getenv("GROQ_CACHE_TTL", "3600"))
+GROQ_CACHE_MAX_ENTRIES = int(os.getenv("GROQ_CACHE_MAX_ENTRIES", "10000"))
+GROQ_CACHE_MAX_BYTES = int(os.getenv("GROQ_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+
+groq_cache = TTLCache(max_entries=GROQ_CACHE_MAX_ENTRIES, ttl=GROQ_CACHE_TTL, max_bytes=GROQ_CACHE_MAX_BYTES)
+
+def groq_cache_key(messages, max_tokens=None, json_mode=False):
+    return content_hash({"model": GROQ_MODEL, "messages": messages, "max_tokens": max_tokens, "json": json_mode})
+
+# ---------------- Image Proxy ----------------
+# روابط الصور في الاستجابة تشير إلى /img (صورة مصغرة من كاش على القرص) بدل موقع التاجر
+IMAGE_PROXY_ENABLED = os.getenv("IMAGE_PROXY_ENABLED", "1") == "1"
+if IMAGE_PROXY_ENABLED and not IMAGE_PROXY_SECRET:
+    raise RuntimeError("IMAGE_PROXY_SECRET is required when IMAGE_PROXY_ENABLED=1 (or set IMAGE_PROXY_ENABLED=0)")
+image_proxy = ImageProxy(image_client, DiskImageCache())
 
 # ---------------- FastAPI Setup ----------------
-app = FastAPI(title="Shopping Chat Assistant (LLM Accuracy Evaluation Mode)")
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    if CACHE_WARMER_ENABLED:
+        cache_warmer.start()
+    yield
+    cache_warmer.stop()
+
+app = FastAPI(title="Shopping Chat Assistant (LLM Accuracy Evaluation Mode)", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -27,10 +111,11 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# ---------------- Language Detection ----------------
-def detect_language(text):
-    arabic_chars = sum([1 for c in text if "\u0600" <= c <= "\u06FF"])
-    return "ar" if arabic_chars > 0 else "en"
+# الخدمة الخارجية متوقفة مؤقتًا (قاطع مفتوح / تجاوز الحصة): 503 فوري بدل 500
+@app.exception_handler(UpstreamUnavailable)
+def upstream_unavailable_handler(request, exc):
+    headers = {"Retry-After": str(math.ceil(exc.retry_after))} if exc.retry_after else None
+    return JSONResponse(status_code=503, content={"detail": str(exc)}, headers=headers)
 
 def get_system_prompt(role="assistant", user_lang="en"):
     if user_lang == "ar":
@@ -39,67 +124,173 @@ def get_system_prompt(role="assistant", user_lang="en"):
         return f"You are a smart assistant in English. Your role: {role}."
 
 # ---------------- SerpAPI Function ----------------
-def fetch_products_serpapi(query, limit=5):
-    if not SERPAPI_KEY:
-        raise RuntimeError("Missing SERPAPI_KEY")
+def format_product(item):
+    # تصحيح روابط الصور إذا كانت غير مكتملة
+    image_url = item.get("thumbnail") or (item.get("images")[0] if item.get("images") else None)
+    if image_url:
+        if image_url.startswith("//"):
+            image_url = "https:" + image_url
+        elif not image_url.startswith("http"):
+            image_url = urljoin("https://", image_url)
+
+    # تصحيح الرابط
+    link = item.get("link") or item.get("product_link") or item.get("source") or ""
+    if link and not link.startswith("http"):
+        link = "https://" + link.lstrip("/")
+
+    return {
+        "title": item.get("title", "N/A"),
+        "price": item.get("price") or item.get("extracted_price") or "N/A",
+        "source": item.get("source", "N/A"),
+        "link": link,
+        "image": image_url,
+    }
 
-    ignore_words = {"which","is","the","or","and","vs","vs."}
-    keywords = " ".join([w for w in query.split() if w.lower() not in ignore_words]).lower()
+# كلمات السؤال الموحدة بدون كلمات التوقف (عربي + إنجليزي)، فالصيغ المتكافئة تتشارك الكاش؛
+# مفتاح للكاش والكتالوج فقط، وليس النص المرسل إلى SerpAPI
+def serpapi_keywords(query):
+    return query_key(query)
 
-    url = "https://serpapi.com/search.json"
+# النص المرسل إلى SerpAPI: السؤال الأصلي بحروف صغيرة بدون كلمات التوقف، وبدون توحيد الحروف
+# (ة/ه، أ/ا) حتى لا تسوء نتائج البحث
+def serpapi_query(query):
+    words = [w.strip("?؟!,،;:\"'()") for w in query.lower().split()]
+    words = [w for w in words if w]
+    return " ".join([w for w in words if normalize_text(w) not in STOPWORDS] or words)
+
+# الصفحة الأولى تحتفظ بمفتاح الكاش القديم؛ الصفحات التالية تضيف start
+def serpapi_cache_key(keywords, start=0):
+    return make_cache_key("serpapi", "ar", "sa", keywords, *([start] if start else []))
+
+def request_serpapi_page(query, start=0):
+    keywords = serpapi_keywords(query)
     params = {
         "engine": "google_shopping",
-        "q": keywords,
+        "q": serpapi_query(query),
         "hl": "ar",
         "gl": "sa",
         "api_key": SERPAPI_KEY,
         "tbm": "shop",
     }
+    if start:
+        params["start"] = start
 
-    response = requests.get(url, params=params)
+    response = serpapi_client.get(SERPAPI_URL, params=params)
     if response.status_code != 200:
         raise RuntimeError(f"SerpAPI error {response.status_code}: {response.text}")
 
     data = response.json()
     results = data.get("shopping_results", [])
+    serp_cache.set(serpapi_cache_key(keywords, start), results)
+    if catalog is not None:
+        try:
+            catalog.ingest(keywords, [format_product(item) for item in results])
+        except Exception as e:
+            print(f"Error ingesting SerpAPI results into catalog: {e}")
+    return results
+
+def get_serpapi_page(query, start=0):
+    results = serp_cache.get(serpapi_cache_key(serpapi_keywords(query), start))
+    return results if results is not None else request_serpapi_page(query, start)
 
+def match_products(results, keywords, limit=None):
     filtered = []
     for item in results:
-        title = item.get("title", "").lower()
+        title = normalize_text(item.get("title", ""))
         if any(word in title for word in keywords.split()):
             filtered.append(item)
-        if len(filtered) >= limit:
+        if limit and len(filtered) >= limit:
             break
+    return [format_product(item) for item in filtered]
+
+# عنصر يشارك جلب عنصر أعم ("iphone 15 pro" من نتائج "iphone 15"): يُطابق على صفحة SerpAPI كاملة
+# وليس على أول SEARCH_PAGE_SIZE منها، والعناوين التي تحتوي كل كلماته أولًا
+def match_item_products(results, item, limit=SEARCH_PAGE_SIZE):
+    words = query_key(item).split()
+    full, partial = [], []
+    for result in results:
+        title = normalize_text(result.get("title", ""))
+        if all(word in title for word in words):
+            full.append(result)
+        elif any(word in title for word in words):
+            partial.append(result)
+    return [format_product(result) for result in (full + partial)[:limit]]
+
+def fetch_products_serpapi(query, limit=SEARCH_PAGE_SIZE):
+    if not SERPAPI_KEY:
+        raise RuntimeError("Missing SERPAPI_KEY")
+
+    keywords = serpapi_keywords(query)
+    results = serp_cache.get(serpapi_cache_key(keywords))
 
-    formatted = []
-    for item in filtered:
-        # تصحيح روابط الصور إذا كانت غير مكتملة
-        image_url = item.get("thumbnail") or (item.get("images")[0] if item.get("images") else None)
-        if image_url:
-            if image_url.startswith("//"):
-                image_url = "https:" + image_url
-            elif not image_url.startswith("http"):
-                image_url = urljoin("https://", image_url)
-
-        # تصحيح الرابط
-        link = item.get("link") or item.get("product_link") or item.get("source") or ""
-        if link and not link.startswith("http"):
-            link = "https://" + link.lstrip("/")
-
-        formatted.append({
-            "title": item.get("title", "N/A"),
-            "price": item.get("price") or item.get("extracted_price") or "N/A",
-            "source": item.get("source", "N/A"),
-            "link": link,
-            "image": image_url,
-        })
-    return formatted
+    if results is None:
+        # الكتالوج المحلي يكفي إذا فيه منتجات حديثة كافية تطابق كل الكلمات
+        if catalog is not None:
+            products = catalog.lookup(keywords, limit)
+            CATALOG_LOOKUPS.inc(result="hit" if products else "miss")
+            if products:
+                return products
+
+        try:
+            results = request_serpapi_page(query)
+        except UpstreamUnavailable:
+            # القاطع مفتوح أو الطابور ممتلئ: منتجات الكتالوج القديمة أفضل من لا شيء
+            stale = catalog.search(keywords, limit, max_age=catalog.retention) if catalog is not None else []
+            if stale:
+                return stale
+            raise
+
+    return match_products(results, keywords, limit)
+
+# ---------------- Further Result Pages ----------------
+# المطابقة بنفس دالة الصفحة الأولى (fetch_and_filter_group) حتى يبقى عدّ k في الـ cursor متسقًا:
+# عنصر الجلب نفسه بكلمات نص الجلب، والعنصر الأضيق الذي شاركه الجلب بكلماته هو
+def fetch_products_page(state, page_size=PRODUCTS_PAGE_SIZE):
+    if not SERPAPI_KEY:
+        raise RuntimeError("Missing SERPAPI_KEY")
+    if state["m"] == state["q"]:
+        keywords = serpapi_keywords(state["q"])
+        match = lambda results: match_products(results, keywords)
+    else:
+        match = lambda results: match_item_products(results, state["m"], limit=None)
+    return next_page(
+        state, page_size,
+        load_page=lambda start: get_serpapi_page(state["q"], start),
+        match=match,
+    )
+
+# نتيجة الجلب في كاش SerpAPI تعني أن الصفحة الأولى عُرضت منها وليست من الكتالوج
+def served_from_serpapi(fetch_query):
+    return serp_cache.ttl_remaining(serpapi_cache_key(serpapi_keywords(fetch_query))) > 0
+
+def search_cursors(plan, products_by_item):
+    return first_page_cursors(plan, products_by_item, from_serpapi=served_from_serpapi)
+
+@app.get("/products")
+def get_products(cursor: str = Query(...), page_size: int = Query(default=None, ge=1, le=50)):
+    try:
+        state = decode_cursor(cursor)
+    except CursorError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    products, next_cursor = fetch_products_page(state, page_size or PRODUCTS_PAGE_SIZE)
+    return {
+        "item": state["m"],
+        "products": with_proxied_images(to_json_products(products)),
+        "next_cursor": next_cursor,
+    }
 
 # ---------------- Call Groq API ----------------
-def call_groq(messages):
+def call_groq(messages, fresh=False, max_tokens=None, json_mode=False):
     if not GROQ_KEY or not GROQ_URL or not GROQ_MODEL:
         raise RuntimeError("Missing GROQ environment variables")
 
+    # fresh=True يتجاوز القراءة من الكاش لكنه يحدّثه بالرد الجديد
+    cache_key = groq_cache_key(messages, max_tokens, json_mode)
+    if not fresh:
+        cached = groq_cache.get(cache_key)
+        if cached is not None:
+            return cached
+
     headers = {
         "Authorization": f"Bearer {GROQ_KEY}",
         "Content-Type": "application/json",
@@ -109,26 +300,120 @@ def call_groq(messages):
         "model": GROQ_MODEL,
         "messages": messages,
     }
+    if max_tokens:
+        payload["max_tokens"] = max_tokens
+    if json_mode:
+        payload["response_format"] = {"type": "json_object"}
 
-    response = requests.post(GROQ_URL, headers=headers, json=payload)
+    response = groq_client.post(GROQ_URL, headers=headers, json=payload)
     if response.status_code != 200:
         raise RuntimeError(f"GROQ API error {response.status_code}: {response.text}")
 
     data = response.json()
-    return data["choices"][0]["message"]["content"]
+    content = data["choices"][0]["message"]["content"]
+    groq_cache.set(cache_key, content)
+    return content
+
+# ---------------- Call Groq API (Streaming) ----------------
+def call_groq_stream(messages, fresh=False, max_tokens=None):
+    if not GROQ_KEY or not GROQ_URL or not GROQ_MODEL:
+        raise RuntimeError("Missing GROQ environment variables")
+
+    cache_key = groq_cache_key(messages, max_tokens)
+    if not fresh:
+        cached = groq_cache.get(cache_key)
+        if cached is not None:
+            yield cached
+            return
+
+    headers = {
+        "Authorization": f"Bearer {GROQ_KEY}",
+        "Content-Type": "application/json",
+    }
+
+    payload = {
+        "model": GROQ_MODEL,
+        "messages": messages,
+        "stream": True,
+    }
+    if max_tokens:
+        payload["max_tokens"] = max_tokens
+
+    response = groq_client.post(GROQ_URL, headers=headers, json=payload, stream=True)
+    if response.status_code != 200:
+        raise RuntimeError(f"GROQ API error {response.status_code}: {response.text}")
+
+    # كل سطر "data: {...}" يحمل جزءًا من الرد، وينتهي البث بـ "data: [DONE]"
+    parts = []
+    try:
+        for raw_line in response.iter_lines():
+            line = raw_line.decode("utf-8") if isinstance(raw_line, bytes) else raw_line
+            if not line.startswith("data:"):
+                continue
+            chunk = line[len("data:"):].strip()
+            if chunk == "[DONE]":
+                groq_cache.set(cache_key, "".join(parts))
+                break
+            delta = json.loads(chunk)["choices"][0].get("delta", {}).get("content")
+            if delta:
+                parts.append(delta)
+                yield delta
+    finally:
+        response.close()
+
+# ---------------- Upstream Pool Stats ----------------
+@app.get("/upstream/stats")
+def get_upstream_stats():
+    return upstream_stats()
+
+# ---------------- Upstream Governor Admin ----------------
+@app.get("/admin/upstreams")
+def get_upstream_governors():
+    return {name: client.governor.stats() for name, client in CLIENTS.items() if client.governor}
+
+@app.post("/admin/upstreams/{name}/reset")
+def reset_upstream_governor(name: str):
+    client = CLIENTS.get(name)
+    if client is None or client.governor is None:
+        raise HTTPException(status_code=404, detail="Unknown upstream")
+    client.governor.reset()
+    return client.governor.stats()
+
+@app.get("/cache/stats")
+def get_cache_stats():
+    return {"serpapi": serp_cache.stats(), "groq": groq_cache.stats()}
+
+@app.get("/catalog/stats")
+def get_catalog_stats():
+    if catalog is None:
+        return {"enabled": False}
+    return dict(catalog.stats(), enabled=True)
 
 # ---------------- Evaluate Accuracy Using LLM ----------------
-def evaluate_accuracy_llm(query, context, final_answer):
+def normalize_scores(scores):
+    for k in ["faithfulness", "relevance", "completeness"]:
+        val = scores.get(k, 10)
+        scores[k] = max(10, min(val, 100))
+
+    total = round(
+        0.4 * scores["faithfulness"]
+        + 0.3 * scores["relevance"]
+        + 0.3 * scores["completeness"],
+        2
+    )
+    scores["total"] = max(10, min(total, 100))
+    return scores
+
+# strict=True (إعادة التقييم في rescore.py): فشل الاستدعاء أو JSON غير صالح يرفع استثناء
+# بدل درجة الحد الأدنى، حتى لا يُكتب فشل مؤقت كأنه تقييم حقيقي
+def evaluate_accuracy_llm(query, context, final_answer, strict=False, fresh=False):
     if not context:
         return {"faithfulness": 10, "relevance": 10, "completeness": 10, "total": 10}
 
     user_lang = detect_language(query)
     system_prompt = get_system_prompt(role="accuracy evaluation", user_lang=user_lang)
 
-    context_text = ""
-    for idx, p in enumerate(context, 1):
-        context_text += f"{idx}. {p.get('title')} | {p.get('price')} | {p.get('source')}\n"
-
+    context_text = CONTEXT_SLOT
     if user_lang == "ar":
         prompt = f"""
 أنت مساعد تقييم ذكي للإجابات.
@@ -158,40 +443,30 @@ Even if not perfect, provide partial scores reflecting overall accuracy.
 Return JSON: {{"faithfulness":..., "completeness":..., "relevance":..., "total":...}}
 """
 
+    # السياق يأخذ ما يتبقى من ميزانية المدخلات بعد السؤال والإجابة
+    prompt = fill_context(system_prompt, prompt, lambda budget: build_context(context, budget, numbered=True))
+
     try:
         llm_resp = call_groq([
             {"role": "system", "content": system_prompt},
             {"role": "user", "content": prompt},
-        ])
-        scores = json.loads(llm_resp)
-
-        for k in ["faithfulness", "relevance", "completeness"]:
-            val = scores.get(k, 10)
-            scores[k] = max(10, min(val, 100))
-
-        total = round(
-            0.4 * scores["faithfulness"]
-            + 0.3 * scores["relevance"]
-            + 0.3 * scores["completeness"],
-            2
-        )
-        scores["total"] = max(10, min(total, 100))
-        return scores
+        ], fresh=fresh, max_tokens=EVAL_MAX_TOKENS)
+        return normalize_scores(json.loads(llm_resp))
     except Exception as e:
+        if strict:
+            raise
         print(f"Error evaluating with LLM: {e}")
         return {"faithfulness": 10, "relevance": 10, "completeness": 10, "total": 10}
 
 # ---------------- Filter Products by Context Using LLM (Enhanced Prompt) ----------------
-def filter_products_by_context_llm(query, products):
+def filter_products_by_context_llm(query, products, strict=False):
     if not products:
         return []
 
     user_lang = detect_language(query)
     system_prompt = get_system_prompt(role="product filtering", user_lang=user_lang)
 
-    products_text = ""
-    for idx, p in enumerate(products, 1):
-        products_text += f"- {p.get('title')} | {p.get('price')} | {p.get('source')}\n"
+    products_text = CONTEXT_SLOT
 
     if user_lang == "ar":
         prompt = f"""
@@ -224,72 +499,152 @@ Retrieved products:
 Return only products relevant to the question.
 """
 
+    prompt = fill_context(system_prompt, prompt, lambda budget: build_context(products, budget))
+
     try:
         llm_resp = call_groq([
             {"role": "system", "content": system_prompt},
             {"role": "user", "content": prompt},
-        ])
+        ], max_tokens=FILTER_MAX_TOKENS)
         filtered = json.loads(llm_resp)
         return filtered
     except Exception as e:
+        if strict:
+            raise
         print(f"Error filtering products with LLM: {e}")
         return products
 
-# ---------------- Unified JSON Logging (Updated to avoid duplicates) ----------------
+# ---------------- Local Ranking (LLM only for ambiguous products) ----------------
+FILTER_MODE = os.getenv("FILTER_MODE", "hybrid")
+
+def match_llm_products(llm_products, candidates):
+    if isinstance(llm_products, dict):
+        llm_products = next((v for v in llm_products.values() if isinstance(v, list)), None)
+    if not isinstance(llm_products, list):
+        raise ValueError("LLM filter did not return a product list")
+
+    # نعيد المنتجات الأصلية (مع link و image) بدل ما كتبه النموذج
+    by_title = {normalize_text(p.get("title")): p for p in candidates}
+    matched = []
+    for entry in llm_products:
+        if not isinstance(entry, dict):
+            continue
+        title = normalize_text(entry.get("title"))
+        product = by_title.get(title)
+        if product is None and len(title) >= 10:
+            # العناوين الطويلة تُختصر في الـ prompt، فقد يعيد النموذج بداية العنوان فقط
+            product = next((p for t, p in by_title.items() if t.startswith(title)), None)
+        if product is not None and product not in matched:
+            matched.append(product)
+    return matched
+
+def filter_products(query, item, products, mode=None):
+    mode = mode or FILTER_MODE
+    if mode == "none":
+        return products
+    if mode == "llm":
+        return filter_products_by_context_llm(query, products)
+
+    ranking = rank_products(item, products)
+    if mode == "local" or not ranking["ambiguous"]:
+        return ranking["kept"]
+
+    # hybrid: فقط المنتجات التي لا يحسمها الترتيب المحلي تُرسل للنموذج
+    try:
+        llm_products = filter_products_by_context_llm(query, ranking["ambiguous"], strict=True)
+        return ranking["kept"] + match_llm_products(llm_products, ranking["ambiguous"])
+    except Exception as e:
+        print(f"Error filtering ambiguous products with LLM, using local ranking: {e}")
+        return ranking["kept"] + ranking["ambiguous"]
+
+# ---------------- Unified Session Logging ----------------
 def save_session_unified(data):
-    all_data = []
-    # تحميل الملف إذا موجود
-    if os.path.exists(ALL_CHATS_FILE):
-        with open(ALL_CHATS_FILE, "r", encoding="utf-8") as f:
-            all_data = json.load(f)
-
-    # تحقق إذا السؤال موجود مسبقًا
-    found = False
-    for idx, entry in enumerate(all_data):
-        if entry["query"] == data["query"]:
-            # استبدال السؤال القديم بالبيانات الجديدة
-            all_data[idx] = data
-            found = True
-            break
+    # نفس السؤال يستبدل السجل القديم، والسؤال الجديد يُضاف برقم جديد
+    session_store.save(data)
 
-    if not found:
-        # إضافة سؤال جديد
-        data["id"] = len(all_data) + 1
-        all_data.append(data)
+# ---------------- Background Evaluation ----------------
+EVALUATION_WORKERS = int(os.getenv("EVALUATION_WORKERS", "2"))
+EVALUATION_QUEUE_SIZE = int(os.getenv("EVALUATION_QUEUE_SIZE", "1000"))
 
-    # حفظ الملف مرة واحدة
-    with open(ALL_CHATS_FILE, "w", encoding="utf-8") as f:
-        json.dump(all_data, f, ensure_ascii=False, indent=2)
+evaluation_queue = EvaluationQueue(
+    evaluate_fn=lambda query, context, answer: evaluate_accuracy_llm(query, context, answer),
+    on_done=lambda session_id, scores, query: session_store.update_evaluation(session_id, scores, query),
+    workers=EVALUATION_WORKERS,
+    max_pending=EVALUATION_QUEUE_SIZE,
+)
 
-# ---------------- Main Search Endpoint (Optimized) ----------------
-@app.get("/search")
-def search_with_session(query: str = Query(...), session_id: str = Query(default=None)):
-    if not session_id:
-        session_id = str(uuid.uuid4())
+@app.get("/evaluation/{session_id}")
+def get_evaluation(session_id: str):
+    tracked = evaluation_queue.status(session_id)
+    if tracked:
+        status, scores = tracked
+        if status == DONE:
+            return {"session_id": session_id, "status": status, "evaluation_score": scores}
+        return {"session_id": session_id, "status": status, "evaluation_score": None}
 
-    items = [x.strip() for x in query.replace("compare", "").split("and") if x.strip()]
-    if not items:
-        items = [query]
+    # غير موجود في الذاكرة (عملية أخرى أو بعد إعادة التشغيل): نرجع لسجل الجلسات
+    session = session_store.get_by_session_id(session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Unknown session_id")
+    scores = session.get("evaluation_score")
+    return {
+        "session_id": session_id,
+        "status": session.get("evaluation_status") or (DONE if scores else PENDING),
+        "evaluation_score": scores,
+    }
 
-    products_by_item = {}
-    filtered_by_context = {}
+# ---------------- Per-Item Retrieval ----------------
+def fetch_and_filter_group(query, fetch_query, items, filter_mode=None, timings=None):
+    timings = timings or RequestTimings(detect_language(query))
+    try:
+        with timings.stage("serpapi"):
+            raw_products = fetch_products_serpapi(fetch_query)
+    except Exception as e:
+        return {item: [{"error": str(e)}] for item in items}
 
+    # نتيجة SerpAPI واحدة، وكل عنصر يُصفّى حسب نصه هو؛ العناصر الأضيق تُطابق على الصفحة كاملة
+    # (إذا جاءت النتيجة من الكتالوج فلا صفحة في الكاش ونكتفي بما أُعيد)
+    page = serp_cache.get(serpapi_cache_key(serpapi_keywords(fetch_query))) if len(items) > 1 else None
+    results = {}
     for item in items:
         try:
-            raw_products = fetch_products_serpapi(item)
-            filtered_products = filter_products_by_context_llm(query, raw_products)
-            products_by_item[item] = filtered_products
-            filtered_by_context[item] = filtered_products
+            candidates = raw_products if page is None or item == fetch_query else match_item_products(page, item)
+            with timings.stage("filter"):
+                results[item] = filter_products(query, item, candidates, filter_mode)
         except Exception as e:
-            products_by_item[item] = [{"error": str(e)}]
-            filtered_by_context[item] = [{"error": str(e)}]
+            results[item] = [{"error": str(e)}]
+    return results
+
+def fetch_and_filter_item(query, item, filter_mode=None, timings=None):
+    return fetch_and_filter_group(query, item, [item], filter_mode, timings)[item]
 
-    context_text = ""
-    for name, products in products_by_item.items():
-        context_text += f"\n\n📦 نتائج {name}:\n"
-        for p in products:
-            context_text += f"- {p.get('title')} | {p.get('price')} | {p.get('source')}\n"
+# fetches: [{"query": ..., "items": [...]}] من plan_query؛ بدونها كل عنصر يُجلب وحده
+def fetch_items_concurrently(query, items, max_concurrency=None, filter_mode=None, timings=None, fetches=None):
+    fetches = fetches or [{"query": item, "items": [item]} for item in items]
+    cap = SEARCH_MAX_CONCURRENCY
+    if max_concurrency:
+        cap = min(cap, max_concurrency)
+    workers = max(1, min(cap, len(fetches)))
+
+    results = {}
+    if workers == 1:
+        for fetch in fetches:
+            results.update(fetch_and_filter_group(query, fetch["query"], fetch["items"], filter_mode, timings))
+    else:
+        # كل جلب مستقل: خطأ في عنصر لا يؤثر على البقية
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = [
+                pool.submit(fetch_and_filter_group, query, fetch["query"], fetch["items"], filter_mode, timings)
+                for fetch in fetches
+            ]
+            for future in futures:
+                results.update(future.result())
+    return {item: results[item] for item in items}
 
+# ---------------- Search Pipeline Helpers ----------------
+# history: رسائل المحادثة السابقة (conversation.py)، تُوضع بين system والسؤال وتُخصم من الميزانية
+def build_reply_messages(query, products_by_item, history=None):
+    context_text = CONTEXT_SLOT
     user_lang = detect_language(query)
     system_prompt = get_system_prompt(role="shopping assistant", user_lang=user_lang)
 
@@ -310,15 +665,23 @@ Available data:
 {context_text}
 """
 
-    ai_reply = call_groq([
+    history = history or []
+    prompt = fill_context(
+        system_prompt, prompt,
+        lambda budget: build_grouped_context(products_by_item, budget, "\n\n📦 نتائج {name}:\n"),
+        PROMPT_INPUT_TOKENS - estimate_messages_tokens(history),
+    )
+    return [
         {"role": "system", "content": system_prompt},
+        *history,
         {"role": "user", "content": prompt},
-    ])
+    ]
 
-    flat_context = [p for plist in filtered_by_context.values() for p in plist]
-    evaluation_scores = evaluate_accuracy_llm(query, flat_context, ai_reply)
+def flatten_products(products_by_item):
+    return [p for plist in products_by_item.values() for p in plist]
 
-    json_products = [
+def to_json_products(flat_context):
+    return [
         {
             "title": p.get("title"),
             "price": p.get("price"),
@@ -329,14 +692,372 @@ Available data:
         for p in flat_context
     ]
 
+# نسخة للاستجابة فقط؛ الجلسة المحفوظة والتقييم يحتفظان بالروابط الأصلية
+def with_proxied_images(products):
+    if not IMAGE_PROXY_ENABLED:
+        return products
+    return [
+        dict(p, image=proxy_url(p["image"]) if p.get("image") and p["image"].startswith("http") else None)
+        for p in products
+    ]
+
+def response_products(session_data):
+    return dict(
+        session_data,
+        products=with_proxied_images(session_data["products"]),
+        products_by_item={item: with_proxied_images(plist) for item, plist in session_data["products_by_item"].items()},
+    )
+
+def finalize_session(session_id, query, products_by_item, ai_reply, timings, evaluation=None, follow_up=False):
+    flat_context = flatten_products(products_by_item)
+    # سؤال المتابعة لا يغيّر منتجات المحادثة
+    conversations.record(session_id, query, ai_reply, None if follow_up else products_by_item)
+
+    # evaluation_score يُملأ لاحقًا بواسطة evaluation_queue (GET /evaluation/{session_id})،
+    # إلا في الوضع السريع حيث يأتي التقييم الذاتي مع الرد
     session_data = {
         "session_id": session_id,
         "query": query,
-        "products": json_products,
+        "products": to_json_products(flat_context),
         "products_by_item": products_by_item,
         "ai_reply": ai_reply,
-        "evaluation_score": evaluation_scores,
+        "evaluation_score": evaluation,
+        "evaluation_status": DONE if evaluation else PENDING,
+        "follow_up": follow_up,
+        # مرحلة total لم تنتهِ بعد عند الحفظ: الزمن حتى الآن هو زمن الطلب الذي تقرؤه analytics.py
+        "timings": dict(timings.as_dict(), total=round(timings.elapsed() * 1000, 2)),
     }
 
-    save_session_unified(session_data)
+    with timings.stage("save"):
+        save_session_unified(session_data)
+    if evaluation is None:
+        with timings.stage("evaluate"):
+            evaluation_queue.submit(session_id, query, flat_context, ai_reply)
     return session_data
+
+# ---------------- Search Pipelines ----------------
+SEARCH_MODE = os.getenv("SEARCH_MODE", "standard")
+
+def run_standard_pipeline(query, plan, max_concurrency, filter_mode, fresh, max_tokens, timings, history=None):
+    with timings.stage("retrieve"):
+        products_by_item = fetch_items_concurrently(
+            query, plan["items"], max_concurrency, filter_mode, timings, plan["fetches"]
+        )
+    with timings.stage("reply"):
+        ai_reply = call_groq(
+            build_reply_messages(query, products_by_item, history), fresh=fresh,
+            max_tokens=max_tokens or REPLY_MAX_TOKENS,
+        )
+    return products_by_item, ai_reply, None
+
+# الوضع السريع: المنتجات الخام + استدعاء واحد يعيد التصفية والرد والتقييم معًا.
+# عند فشل الاستدعاء أو عدم مطابقة الـ schema نرجع للمسار العادي بنفس المنتجات (بدون جلب جديد)
+def run_fast_pipeline(query, plan, max_concurrency, filter_mode, fresh, max_tokens, timings, history=None):
+    with timings.stage("retrieve"):
+        raw_by_item = fetch_items_concurrently(query, plan["items"], max_concurrency, "none", timings, plan["fetches"])
+
+    user_lang = detect_language(query)
+    system_prompt = get_system_prompt(role="shopping assistant", user_lang=user_lang)
+    messages, catalog = build_fast_messages(query, raw_by_item, system_prompt, user_lang, history)
+    fast_max_tokens = (max_tokens or REPLY_MAX_TOKENS) + FAST_EXTRA_TOKENS
+    try:
+        with timings.stage("fast_llm"):
+            llm_resp = call_groq(messages, fresh=fresh, max_tokens=fast_max_tokens, json_mode=True)
+            try:
+                products_by_item, ai_reply, evaluation = parse_fast_response(llm_resp, raw_by_item, catalog)
+            except FastModeError:
+                # call_groq خزّن الرد قبل التحقق منه؛ الرد غير الصالح لا يُعاد من الكاش للطلبات التالية
+                groq_cache.delete(groq_cache_key(messages, fast_max_tokens, json_mode=True))
+                raise
+        FAST_MODE_RESULTS.inc(outcome="ok")
+        return products_by_item, ai_reply, normalize_scores(evaluation)
+    except Exception as e:
+        print(f"Fast mode failed, falling back to the multi-call path: {e}")
+        FAST_MODE_RESULTS.inc(outcome="fallback")
+
+    with timings.stage("filter"):
+        products_by_item = {
+            item: products if products and "error" in products[0] else filter_products(query, item, products, filter_mode)
+            for item, products in raw_by_item.items()
+        }
+    with timings.stage("reply"):
+        ai_reply = call_groq(
+            build_reply_messages(query, products_by_item, history), fresh=fresh,
+            max_tokens=max_tokens or REPLY_MAX_TOKENS,
+        )
+    return products_by_item, ai_reply, None
+
+# سؤال متابعة ("أيها أرخص؟"): نفس منتجات آخر بحث في الجلسة، بدون SerpAPI ولا تصفية
+def run_follow_up_pipeline(query, products_by_item, fresh, max_tokens, timings, history):
+    with timings.stage("reply"):
+        ai_reply = call_groq(
+            build_reply_messages(query, products_by_item, history), fresh=fresh,
+            max_tokens=max_tokens or REPLY_MAX_TOKENS,
+        )
+    return products_by_item, ai_reply, None
+
+# follow_up من الطلب يفرض القرار؛ بدونه نكتشفه من صياغة السؤال
+def follow_up_products(conversation, query, follow_up=None):
+    if conversation is None or not conversation.products_by_item:
+        return None
+    if follow_up if follow_up is not None else is_follow_up(query):
+        return conversation.products_by_item
+    return None
+
+# ---------------- Single-Flight Coalescing ----------------
+# طلبات متطابقة متزامنة تنتظر تنفيذًا واحدًا للـ pipeline، وكل طلب يحصل على session_id خاص به
+search_flights = SingleFlight()
+
+# history: الرد يعتمد على المحادثة السابقة، فلا يُشارك إلا مع نفس السياق
+def search_flight_key(query, lang, max_concurrency=None, filter_mode=None, fresh=False, max_tokens=None, mode=None,
+                      history=None):
+    return make_cache_key(
+        "search", lang, normalize_text(query), max_concurrency or SEARCH_MAX_CONCURRENCY,
+        filter_mode or FILTER_MODE, fresh, max_tokens or REPLY_MAX_TOKENS, mode or SEARCH_MODE,
+        content_hash(history) if history else None,
+    )
+
+@app.get("/conversations/stats")
+def get_conversation_stats():
+    return conversations.stats()
+
+@app.get("/search/coalescing/stats")
+def get_coalescing_stats():
+    return search_flights.stats()
+
+# ---------------- Main Search Endpoint (Optimized) ----------------
+@app.get("/search")
+def search_with_session(
+    response: Response,
+    query: str = Query(...),
+    session_id: str = Query(default=None),
+    max_concurrency: int = Query(default=None, ge=1),
+    filter_mode: str = Query(default=None, pattern="^(llm|local|hybrid)$"),
+    fresh: bool = Query(default=False),
+    max_tokens: int = Query(default=None, ge=1, le=8192),
+    mode: str = Query(default=None, pattern="^(standard|fast)$"),
+    follow_up: bool = Query(default=None),
+    compact: bool = Query(default=False),
+    fields: str = Query(default=None),
+    accept_encoding: str = Header(default=None),
+):
+    if fields:
+        try:
+            parse_fields(fields)
+        except FieldSelectionError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    conversation = conversations.get(session_id)
+    if not session_id:
+        session_id = str(uuid.uuid4())
+    mode = mode or SEARCH_MODE
+    history = conversation.history_messages() if conversation else []
+    cached_products = follow_up_products(conversation, query, follow_up)
+
+    timings = RequestTimings(detect_language(query))
+    status = "error"
+    try:
+        with timings.stage("total"):
+            run_pipeline = run_fast_pipeline if mode == "fast" else run_standard_pipeline
+
+            if cached_products is not None:
+                plan = {"items": list(cached_products), "fetches": []}
+                conversations.count_follow_up()
+                with timings.stage("pipeline"):
+                    products_by_item, ai_reply, evaluation = run_follow_up_pipeline(
+                        query, cached_products, fresh, max_tokens, timings, history,
+                    )
+                shared = False
+            else:
+                plan = plan_query(query)
+
+                # مراحل التنفيذ المشترك تُعاد مع النتيجة حتى يحصل كل طلب منتظر على نفس التفصيل
+                def pipeline():
+                    pipeline_timings = RequestTimings(timings.lang)
+                    result = run_pipeline(
+                        query, plan, max_concurrency, filter_mode, fresh, max_tokens, pipeline_timings, history,
+                    )
+                    return result, pipeline_timings.snapshot()
+
+                key = search_flight_key(
+                    query, timings.lang, max_concurrency, filter_mode, fresh, max_tokens, mode, history,
+                )
+                with timings.stage("pipeline"):
+                    ((products_by_item, ai_reply, evaluation), stages), shared = search_flights.do(key, pipeline)
+                    timings.merge(stages)
+            if shared:
+                SEARCH_COALESCED.inc(endpoint="/search", lang=timings.lang)
+                # نسخة مستقلة لكل طلب حتى لا تتشارك الجلسات نفس الكائنات
+                products_by_item = copy.deepcopy(products_by_item)
+                evaluation = copy.deepcopy(evaluation)
+
+            session_data = response_products(finalize_session(
+                session_id, query, products_by_item, ai_reply, timings, evaluation, cached_products is not None,
+            ))
+            session_data["coalesced"] = shared
+            session_data["mode"] = mode
+            session_data["plan"] = plan
+            session_data["cursors"] = search_cursors(plan, products_by_item)
+        status = "ok"
+    finally:
+        SEARCH_REQUESTS.inc(endpoint="/search", status=status, lang=timings.lang)
+
+    if not (compact or fields):
+        response.headers["Server-Timing"] = timings.server_timing()
+        return session_data
+
+    # الوضع المختصر: ترميز أسرع (orjson) وضغط gzip/brotli فوق RESPONSE_COMPRESS_MIN_BYTES
+    with timings.stage("serialize"):
+        payload = compact_session(session_data) if compact else session_data
+        if fields:
+            payload = select_fields(payload, fields)
+        body, headers = encode_body(dumps(payload), accept_encoding)
+    headers["Server-Timing"] = timings.server_timing()
+    return Response(content=body, media_type="application/json", headers=headers)
+
+# ---------------- Streaming Search Endpoint (SSE) ----------------
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@app.get("/search/stream")
+def search_stream(
+    query: str = Query(...),
+    session_id: str = Query(default=None),
+    max_concurrency: int = Query(default=None, ge=1),
+    filter_mode: str = Query(default=None, pattern="^(llm|local|hybrid)$"),
+    fresh: bool = Query(default=False),
+    max_tokens: int = Query(default=None, ge=1, le=8192),
+    follow_up: bool = Query(default=None),
+):
+    conversation = conversations.get(session_id)
+    if not session_id:
+        session_id = str(uuid.uuid4())
+    history = conversation.history_messages() if conversation else []
+    cached_products = follow_up_products(conversation, query, follow_up)
+
+    timings = RequestTimings(detect_language(query))
+    started = time.perf_counter()
+
+    def events():
+        if cached_products is not None:
+            plan = {"items": list(cached_products), "fetches": []}
+            conversations.count_follow_up()
+            products_by_item = cached_products
+        else:
+            plan = plan_query(query)
+            with timings.stage("retrieve"):
+                products_by_item = fetch_items_concurrently(
+                    query, plan["items"], max_concurrency, filter_mode, timings, plan["fetches"]
+                )
+        yield sse_event("products", response_products({
+            "session_id": session_id,
+            "follow_up": cached_products is not None,
+            "plan": plan,
+            "cursors": search_cursors(plan, products_by_item),
+            "products": to_json_products(flatten_products(products_by_item)),
+            "products_by_item": products_by_item,
+        }))
+
+        # الرد يُرسل جزءًا بجزء فور وصوله من Groq
+        parts = []
+        reply_started = time.perf_counter()
+        try:
+            reply_messages = build_reply_messages(query, products_by_item, history)
+            for token in call_groq_stream(reply_messages, fresh=fresh, max_tokens=max_tokens or REPLY_MAX_TOKENS):
+                if not parts:
+                    timings.record("first_token", time.perf_counter() - started)
+                parts.append(token)
+                yield sse_event("token", {"text": token})
+        except Exception as e:
+            timings.record("reply", time.perf_counter() - reply_started, "error")
+            SEARCH_REQUESTS.inc(endpoint="/search/stream", status="error", lang=timings.lang)
+            yield sse_event("error", {"error": str(e)})
+            return
+        timings.record("reply", time.perf_counter() - reply_started)
+
+        # التقييم والحفظ قبل "done" حتى لا يضيعا إذا أغلق العميل الاتصال بعده
+        session_data = finalize_session(
+            session_id, query, products_by_item, "".join(parts), timings, follow_up=cached_products is not None,
+        )
+        timings.record("total", time.perf_counter() - started)
+        SEARCH_REQUESTS.inc(endpoint="/search/stream", status="ok", lang=timings.lang)
+        yield sse_event("done", dict(response_products(session_data), timings=timings.as_dict()))
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+# ---------------- Cache Warmer ----------------
+# يعيد جلب SerpAPI لكل جلب في خطة السؤال إذا قارب كاشه على الانتهاء، ثم (اختياريًا) الرد نفسه.
+# يعيد عدد الاستدعاءات الخارجية؛ استدعاءات تصفية LLM (وضع hybrid/llm) تمر عبر groq_cache ولا تُحسب
+def warm_query(query, budget):
+    plan = plan_query(query)
+    used = 0
+    for fetch in plan["fetches"]:
+        keywords = serpapi_keywords(fetch["query"])
+        if serp_cache.ttl_remaining(serpapi_cache_key(keywords)) > CACHE_WARMER_REFRESH_AHEAD:
+            continue
+        if used >= budget:
+            return used
+        request_serpapi_page(fetch["query"])
+        used += 1
+
+    if CACHE_WARMER_REPLIES and used < budget:
+        # المنتجات من الكاش الذي سُخّن للتو، فرسائل الرد مطابقة لما سيبنيه /search
+        products_by_item = fetch_items_concurrently(query, plan["items"], fetches=plan["fetches"])
+        messages = build_reply_messages(query, products_by_item)
+        for max_tokens in dict.fromkeys(CACHE_WARMER_MAX_TOKENS):
+            if used >= budget:
+                break
+            if groq_cache.ttl_remaining(groq_cache_key(messages, max_tokens)) <= CACHE_WARMER_REFRESH_AHEAD:
+                call_groq(messages, fresh=True, max_tokens=max_tokens)
+                used += 1
+    return used
+
+cache_warmer = CacheWarmer(session_store, warm_query)
+
+@app.get("/cache/warmer/stats")
+def get_cache_warmer_stats():
+    return cache_warmer.stats()
+
+@app.post("/admin/cache-warmer/run")
+def run_cache_warmer():
+    return cache_warmer.run_once()
+
+# ---------------- Image Proxy Endpoint ----------------
+@app.get("/img")
+def get_image(request: Request, url: str = Query(...), sig: str = Query(default=None)):
+    if not verify_signature(url, sig):
+        raise HTTPException(status_code=403, detail="Invalid image signature")
+    try:
+        data, content_type, etag = image_proxy.get(url)
+    except ImageProxyError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+
+    headers = {"ETag": etag, "Cache-Control": f"public, max-age={IMAGE_CACHE_MAX_AGE}, immutable"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return Response(content=data, media_type=content_type, headers=headers)
+
+@app.get("/img/stats")
+def get_image_stats():
+    return image_proxy.cache.stats()
+
+# ---------------- Metrics ----------------
+def _cache_gauge():
+    values = {}
+    for name, stats in (("serpapi", serp_cache.memory.stats()), ("groq", groq_cache.stats())):
+        for kind in ("hits", "misses", "evictions"):
+            values[(name, kind)] = stats[kind]
+    return values
+
+REGISTRY.gauge("cache_events", "Cache hits/misses/evictions since start.", ["cache", "event"], _cache_gauge)
+REGISTRY.gauge(
+    "evaluation_queue_depth", "Sessions waiting for background evaluation.", [],
+    lambda: {(): evaluation_queue.stats()["queued"]},
+)
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
@@ -0,0 +1,90 @@
+import argparse
+import gzip
+import json
+import time
+
+import response_format
+from benchmarks.fake_upstreams import shopping_results
+
+# ---------------- Workload ----------------
+# رد /search نموذجي بنفس شكل format_product: المنتجات مكررة في products و products_by_item
+def sample_session(items=("iphone 15", "galaxy s24"), per_item=10):
+    products_by_item = {
+        item: [
+            {"title": r["title"], "price": r["price"], "source": r["source"], "link": r["link"],
+             "image": "https:" + r["thumbnail"] if i % 3 else None}
+            for i, r in enumerate(shopping_results(item, per_item))
+        ]
+        for item in items
+    }
+    return {
+        "session_id": "0f8e5c1a-bench",
+        "query": " vs ".join(items),
+        "products": [p for plist in products_by_item.values() for p in plist],
+        "products_by_item": products_by_item,
+        "ai_reply": "Comparison of the options above. " * 40,
+        "evaluation_score": None,
+        "evaluation_status": "pending",
+        "timings": {"retrieve": 0.41, "filter": 0.002, "reply": 0.83, "save": 0.004, "total": 1.25},
+        "cursors": {item: "eyJxIjoiYmVuY2gifQ" for item in items},
+        "mode": "standard",
+        "follow_up": False,
+    }
+
+def time_per_call(fn, data, repeat=200):
+    best = float("inf")
+    for _ in range(5):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            fn(data)
+        best = min(best, time.perf_counter() - start)
+    return round(best / repeat * 1e6, 1)
+
+# FastAPI's JSONResponse: json.dumps(ensure_ascii=False) بالفواصل الافتراضية
+def stdlib_dumps(data):
+    return json.dumps(data, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")).encode("utf-8")
+
+def run_benchmark(per_item=10):
+    data = sample_session(per_item=per_item)
+    variants = {
+        "full": data,
+        "compact": response_format.compact_session(data),
+        "fields": response_format.select_fields(data, "ai_reply,products_by_item.title,products_by_item.price"),
+    }
+    sizes = {}
+    for name, payload in variants.items():
+        body = response_format.dumps(payload)
+        sizes[name] = {"json": len(body), "gzip": len(gzip.compress(body, response_format.RESPONSE_GZIP_LEVEL))}
+        if response_format.brotli is not None:
+            sizes[name]["br"] = len(response_format.brotli.compress(body, quality=response_format.RESPONSE_BROTLI_QUALITY))
+
+    return {
+        "per_item": per_item,
+        "orjson": response_format.orjson is not None,
+        "us_per_call": {
+            "stdlib_json": time_per_call(stdlib_dumps, data),
+            "dumps": time_per_call(response_format.dumps, data),
+            "compact_and_dumps": time_per_call(lambda d: response_format.dumps(response_format.compact_session(d)), data),
+        },
+        "bytes": sizes,
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark /search serialization and payload sizes")
+    parser.add_argument("--per-item", type=int, default=10)
+    parser.add_argument("--output", help="write the JSON report here")
+    args = parser.parse_args(argv)
+
+    report = run_benchmark(args.per_item)
+    print(f"orjson: {report['orjson']}")
+    for name, value in report["us_per_call"].items():
+        print(f"{name:<20}{value:>10} us")
+    for name, sizes in report["bytes"].items():
+        print(f"{name:<10}" + "  ".join(f"{k}={v}B" for k, v in sizes.items()))
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+if __name__ == "__main__":
+    main()
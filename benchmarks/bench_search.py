@@ -0,0 +1,254 @@
+import argparse
+import contextlib
+import json
+import math
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+import uvicorn
+
+from benchmarks.fake_upstreams import FakeUpstreams
+from metrics import parse_server_timing
+
+DEFAULT_QUERIES = [
+    "iphone 15", "airpods pro", "compare iphone 15 and galaxy s24", "ps5", "macbook air",
+    "ايفون 15", "سماعات لاسلكية", "compare ipad and galaxy tab", "apple watch", "kindle",
+]
+
+# ---------------- Stats ----------------
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    # nearest-rank
+    index = max(0, min(len(sorted_values) - 1, math.ceil(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+def summarize(samples):
+    values = sorted(samples)
+    if not values:
+        return {"count": 0}
+    return {
+        "count": len(values),
+        "mean_ms": round(1000 * sum(values) / len(values), 2),
+        "p50_ms": round(1000 * percentile(values, 50), 2),
+        "p95_ms": round(1000 * percentile(values, 95), 2),
+        "p99_ms": round(1000 * percentile(values, 99), 2),
+    }
+
+class StageRecorder:
+    def __init__(self):
+        self.samples = {}
+        self._lock = threading.Lock()
+
+    def record(self, stage, seconds):
+        with self._lock:
+            self.samples.setdefault(stage, []).append(seconds)
+
+    def wrap(self, stage, fn):
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self.record(stage, time.perf_counter() - start)
+        return timed
+
+# ---------------- App Under Test ----------------
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+@contextlib.contextmanager
+def app_under_test(fakes, recorder, keep_caches=False):
+    os.environ.setdefault("IMAGE_PROXY_SECRET", "bench")  # app.py يرفض البدء بدونه
+    import app as app_module
+    from session_store import SessionStore
+
+    # مراحل الطلب تأتي من ترويسة Server-Timing؛ التقييم يعمل في الخلفية فيُقاس هنا
+    stages = {"evaluate_llm": "evaluate_accuracy_llm"}
+    overrides = {
+        "SERPAPI_KEY": "bench", "SERPAPI_URL": fakes.serpapi_url,
+        "GROQ_KEY": "bench", "GROQ_URL": fakes.groq_url, "GROQ_MODEL": "bench-model",
+    }
+
+    with tempfile.TemporaryDirectory() as tmp:
+        overrides["session_store"] = SessionStore(os.path.join(tmp, "bench_sessions.db"))
+        for stage, name in stages.items():
+            overrides[name] = recorder.wrap(stage, getattr(app_module, name))
+
+        saved = {name: getattr(app_module, name) for name in overrides}
+        for name, value in overrides.items():
+            setattr(app_module, name, value)
+        if not keep_caches:
+            app_module.serp_cache.memory.clear()
+            app_module.groq_cache.clear()
+        # قاطع مفتوح من تشغيل سابق (error_rate) يفسد القياس
+        for upstream in app_module.CLIENTS.values():
+            if upstream.governor is not None:
+                upstream.governor.reset()
+
+        port = free_port()
+        server = uvicorn.Server(uvicorn.Config(app_module.app, host="127.0.0.1", port=port, log_level="warning"))
+        thread = threading.Thread(target=server.run, daemon=True)
+        thread.start()
+        while not server.started:
+            time.sleep(0.01)
+        try:
+            yield f"http://127.0.0.1:{port}"
+        finally:
+            server.should_exit = True
+            thread.join(timeout=10)
+            app_module.evaluation_queue.join()
+            for name, value in saved.items():
+                setattr(app_module, name, value)
+
+# ---------------- Load Driver ----------------
+def drive(base_url, queries, total_requests, concurrency, recorder, params=None, unique=False):
+    local = threading.local()
+    results = []
+    lock = threading.Lock()
+
+    def one(i):
+        session = getattr(local, "session", None)
+        if session is None:
+            session = local.session = requests.Session()
+        query = queries[i % len(queries)]
+        if unique:
+            query = f"{query} {i}"
+        start = time.perf_counter()
+        try:
+            response = session.get(f"{base_url}/search", params={"query": query, **(params or {})}, timeout=120)
+            status = response.status_code
+            # requests يفك الضغط: content بعد فكه، Content-Length كما نُقل فعلًا
+            body_bytes = len(response.content)
+            wire_bytes = int(response.headers.get("Content-Length") or body_bytes)
+            for stage, ms in parse_server_timing(response.headers.get("Server-Timing")).items():
+                recorder.record(stage, ms / 1000)
+        except requests.RequestException:
+            status, body_bytes, wire_bytes = None, 0, 0
+        elapsed = time.perf_counter() - start
+        with lock:
+            results.append((status, elapsed, body_bytes, wire_bytes))
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, range(total_requests)))
+    wall = time.perf_counter() - start
+    return results, wall
+
+def run_benchmark(requests_total=50, concurrency=5, serp_latency="lognormal:300:0.4",
+                  groq_latency="lognormal:800:0.4", error_rate=0.0, seed=1, queries=None,
+                  unique=False, keep_caches=False, params=None):
+    recorder = StageRecorder()
+    fakes = FakeUpstreams(serp_latency, groq_latency, error_rate, seed).start()
+    try:
+        with app_under_test(fakes, recorder, keep_caches) as base_url:
+            results, wall = drive(base_url, queries or DEFAULT_QUERIES, requests_total, concurrency, recorder,
+                                  params, unique)
+    finally:
+        fakes.stop()
+
+    ok = [elapsed for status, elapsed, _, _ in results if status == 200]
+    sizes = [(body, wire) for status, _, body, wire in results if status == 200]
+    stages = {"client_total": summarize(ok)}
+    for stage, samples in sorted(recorder.samples.items()):
+        stages[stage] = summarize(samples)
+
+    return {
+        "config": {
+            "requests": requests_total, "concurrency": concurrency, "serp_latency": serp_latency,
+            "groq_latency": groq_latency, "error_rate": error_rate, "seed": seed,
+            "unique_queries": unique, "keep_caches": keep_caches, "params": params or {},
+        },
+        "throughput_rps": round(len(ok) / wall, 2) if wall else None,
+        "wall_s": round(wall, 3),
+        "ok": len(ok),
+        "errors": len(results) - len(ok),
+        "upstream_calls": dict(fakes.counts),
+        "payload": {
+            "body_bytes_avg": round(sum(b for b, _ in sizes) / len(sizes)) if sizes else 0,
+            "wire_bytes_avg": round(sum(w for _, w in sizes) / len(sizes)) if sizes else 0,
+        },
+        "stages": stages,
+    }
+
+# ---------------- Baseline Comparison ----------------
+def compare(report, baseline):
+    rows = []
+    for stage, stats in report["stages"].items():
+        base = baseline.get("stages", {}).get(stage)
+        if not base or not stats.get("count") or not base.get("count"):
+            continue
+        for key in ("p50_ms", "p95_ms", "p99_ms"):
+            change = (stats[key] - base[key]) / base[key] * 100 if base[key] else 0.0
+            rows.append((stage, key, base[key], stats[key], round(change, 1)))
+    base_rps = baseline.get("throughput_rps")
+    if base_rps:
+        rows.append(("throughput", "rps", base_rps, report["throughput_rps"],
+                     round((report["throughput_rps"] - base_rps) / base_rps * 100, 1)))
+    return rows
+
+def print_report(report, comparison=None):
+    print(f"throughput: {report['throughput_rps']} req/s  ok={report['ok']} errors={report['errors']}  "
+          f"upstream={report['upstream_calls']}")
+    payload = report.get("payload")
+    if payload:
+        print(f"payload: {payload['body_bytes_avg']} B body, {payload['wire_bytes_avg']} B on the wire")
+    print(f"{'stage':<14}{'count':>7}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for stage, stats in report["stages"].items():
+        if stats.get("count"):
+            print(f"{stage:<14}{stats['count']:>7}{stats['p50_ms']:>10}{stats['p95_ms']:>10}{stats['p99_ms']:>10}")
+    if comparison:
+        print("\nvs baseline:")
+        for stage, key, base, current, change in comparison:
+            print(f"  {stage:<14}{key:<8}{base:>10} -> {current:<10}({change:+}%)")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark /search against local SerpAPI/Groq stand-ins")
+    parser.add_argument("--requests", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=5)
+    parser.add_argument("--serp-latency", default="lognormal:300:0.4")
+    parser.add_argument("--groq-latency", default="lognormal:800:0.4")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--unique-queries", action="store_true", help="make every query distinct (cold caches)")
+    parser.add_argument("--keep-caches", action="store_true")
+    parser.add_argument("--param", action="append", default=[], help="extra /search param, e.g. filter_mode=local")
+    parser.add_argument("--output", help="write the JSON report here")
+    parser.add_argument("--baseline", help="compare against a stored JSON report")
+    parser.add_argument("--max-regression", type=float, default=None,
+                        help="exit 1 if total p95 regresses more than this percent")
+    args = parser.parse_args(argv)
+
+    report = run_benchmark(
+        requests_total=args.requests, concurrency=args.concurrency, serp_latency=args.serp_latency,
+        groq_latency=args.groq_latency, error_rate=args.error_rate, seed=args.seed,
+        unique=args.unique_queries, keep_caches=args.keep_caches,
+        params=dict(p.split("=", 1) for p in args.param),
+    )
+
+    comparison = None
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            comparison = compare(report, json.load(f))
+    print_report(report, comparison)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+    if comparison and args.max_regression is not None:
+        for stage, key, base, current, change in comparison:
+            if stage == "client_total" and key == "p95_ms" and change > args.max_regression:
+                print(f"p95 regression {change}% exceeds {args.max_regression}%")
+                sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+import argparse
+import json
+import random
+import time
+
+import textnorm
+from benchmarks.bench_search import DEFAULT_QUERIES
+
+# ---------------- Legacy Implementations (للمقارنة فقط) ----------------
+def legacy_detect_language(text):
+    arabic_chars = sum([1 for c in text if "\u0600" <= c <= "\u06FF"])
+    return "ar" if arabic_chars > 0 else "en"
+
+def legacy_keywords(query):
+    ignore_words = {"which","is","the","or","and","vs","vs."}
+    return " ".join([w for w in query.split() if w.lower() not in ignore_words]).lower()
+
+# ---------------- Workload ----------------
+# استعلامات قصيرة تتكرر كثيرًا (كما في الإنتاج) + عناوين منتجات طويلة
+TITLES = [
+    "Apple iPhone 15 Pro Max 256GB Natural Titanium - Unlocked",
+    "سماعات ابل ايربودز برو الجيل الثاني مع علبة شحن MagSafe",
+    "Samsung Galaxy S24 Ultra 512GB Titanium Black | Dual SIM",
+    "لابتوب لينوفو ليجن ٥ برو بمعالج إنتل كور i7 وذاكرة ١٦ جيجابايت",
+]
+
+# صيغ متكافئة لنفس السؤال كما يكتبها المستخدمون
+VARIANTS = [
+    "iPhone 15?", "IPHONE 15", "which is the best iphone 15", "Best iPhone 15!",
+    "أيفون ١٥", "ايفون 15", "إيفون ١٥؟", "ما هو أفضل ايفون 15",
+]
+
+def workload(size, seed=1):
+    rng = random.Random(seed)
+    texts = DEFAULT_QUERIES + TITLES + VARIANTS
+    return [rng.choice(texts) for _ in range(size)]
+
+def time_per_call(fn, texts, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for text in texts:
+            fn(text)
+        best = min(best, time.perf_counter() - start)
+    return round(best / len(texts) * 1e6, 3)
+
+def run_benchmark(size=20000, seed=1):
+    texts = workload(size, seed)
+    # بدون ذاكرة (كل نص جديد) ثم مع lru_cache كما يعمل في الخادم
+    uncached = {
+        "detect_language": lambda t: textnorm.detect_script.__wrapped__(t) in ("ar", "mixed"),
+        "keywords": lambda t: textnorm.keywords.__wrapped__(t),
+        "normalize_text": textnorm.normalize_text.__wrapped__,
+    }
+    report = {
+        "size": size,
+        "us_per_call": {
+            "detect_language": {
+                "legacy": time_per_call(legacy_detect_language, texts),
+                "textnorm": time_per_call(uncached["detect_language"], texts),
+                "textnorm_cached": time_per_call(textnorm.detect_language, texts),
+            },
+            "keywords": {
+                "legacy": time_per_call(legacy_keywords, texts),
+                "textnorm": time_per_call(uncached["keywords"], texts),
+                "textnorm_cached": time_per_call(textnorm.query_key, texts),
+            },
+            "normalize_text": {
+                "textnorm": time_per_call(uncached["normalize_text"], texts),
+                "textnorm_cached": time_per_call(textnorm.normalize_text, texts),
+            },
+        },
+        # الصيغ المتكافئة التي أصبحت تتشارك مفتاح الكاش نفسه
+        "distinct_cache_keys": {
+            "legacy": len({legacy_keywords(t) for t in texts}),
+            "textnorm": len({textnorm.query_key(t) for t in texts}),
+        },
+    }
+    return report
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark language detection and keyword extraction")
+    parser.add_argument("--size", type=int, default=20000)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="write the JSON report here")
+    args = parser.parse_args(argv)
+
+    report = run_benchmark(args.size, args.seed)
+    print(f"{'function':<16}{'variant':<18}{'us/call':>10}")
+    for name, variants in report["us_per_call"].items():
+        for variant, value in variants.items():
+            print(f"{name:<16}{variant:<18}{value:>10}")
+    print(f"distinct cache keys: {report['distinct_cache_keys']}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+# ---------------- Latency Distributions ----------------
+# "fixed:50" | "uniform:20:80" | "normal:60:15" | "lognormal:50:0.5" (بالمللي ثانية)
+def parse_latency(spec):
+    kind, *args = (spec or "fixed:0").split(":")
+    values = [float(a) for a in args]
+    if kind == "fixed":
+        return lambda rng: values[0] / 1000
+    if kind == "uniform":
+        return lambda rng: rng.uniform(values[0], values[1]) / 1000
+    if kind == "normal":
+        return lambda rng: max(0.0, rng.gauss(values[0], values[1])) / 1000
+    if kind == "lognormal":
+        median, sigma = values
+        return lambda rng: median * rng.lognormvariate(0, sigma) / 1000
+    raise ValueError(f"Unknown latency distribution: {spec}")
+
+# ---------------- Canned Responses ----------------
+SOURCES = ["Amazon.sa", "Jarir", "Extra", "Noon", "N/A"]
+
+def shopping_results(query, count=20):
+    return [
+        {
+            "title": f"{query.title()} Model {i}" if i % 4 else f"{query.title()} Case {i}",
+            "price": f"${(i + 1) * 49}.99" if i % 4 else "$9.99",
+            "extracted_price": (i + 1) * 49.99 if i % 4 else 9.99,
+            "source": SOURCES[i % len(SOURCES)],
+            "link": f"https://shop.example/{query.replace(' ', '-')}/{i}",
+            "thumbnail": f"//img.example/{query.replace(' ', '-')}/{i}.jpg",
+        }
+        for i in range(count)
+    ]
+
+def chat_reply(messages):
+    system = messages[0]["content"] if messages else ""
+    prompt = messages[-1]["content"] if messages else ""
+    if "evaluation" in system:
+        return json.dumps({"faithfulness": 80, "completeness": 70, "relevance": 90})
+    if '"reply"' in prompt:
+        # fast mode: المنتجات كلها + الرد + التقييم في JSON واحد
+        selected = {}
+        for pid, item_idx in re.findall(r"^((\d+)\.\d+) \|", prompt, flags=re.MULTILINE):
+            selected.setdefault(item_idx, []).append(pid)
+        return json.dumps({
+            "products": selected,
+            "reply": "The first option offers the best value.",
+            "evaluation": {"faithfulness": 80, "relevance": 90, "completeness": 70},
+        })
+    if "filtering" in system:
+        titles = re.findall(r"^- (.+?) \|", prompt, flags=re.MULTILINE)
+        return json.dumps([{"title": t} for t in titles])
+    return ("Based on the available data, the first option offers the best value, "
+            "while the second has a better display. Prices vary by store.")
+
+# ---------------- Fake Upstream Server ----------------
+class FakeUpstreams:
+    def __init__(self, serp_latency="fixed:0", groq_latency="fixed:0", error_rate=0.0,
+                 seed=None, host="127.0.0.1", port=0, stream_chunk_delay=0.0):
+        self.serp_latency = parse_latency(serp_latency)
+        self.groq_latency = parse_latency(groq_latency)
+        self.error_rate = error_rate
+        self.stream_chunk_delay = stream_chunk_delay
+        self.rng = random.Random(seed)
+        self._rng_lock = threading.Lock()
+        self.counts = {"serpapi": 0, "groq": 0, "errors": 0}
+        self.server = ThreadingHTTPServer((host, port), self._handler_class())
+        self.server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def serpapi_url(self):
+        return f"{self.base_url}/search.json"
+
+    @property
+    def groq_url(self):
+        return f"{self.base_url}/openai/v1/chat/completions"
+
+    def _sample(self, upstream, dist):
+        with self._rng_lock:
+            self.counts[upstream] += 1
+            delay = dist(self.rng)
+            fail = self.rng.random() < self.error_rate
+            if fail:
+                self.counts["errors"] += 1
+        return delay, fail
+
+    def _handler_class(self):
+        fakes = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def _send(self, status, body, content_type="application/json"):
+                payload = body.encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def _maybe_fail(self, upstream, dist):
+                delay, fail = fakes._sample(upstream, dist)
+                time.sleep(delay)
+                if fail:
+                    self._send(503, json.dumps({"error": "injected failure"}))
+                return fail
+
+            def do_GET(self):
+                parsed = urlparse(self.path)
+                if parsed.path != "/search.json":
+                    return self._send(404, "{}")
+                if self._maybe_fail("serpapi", fakes.serp_latency):
+                    return
+                query = parse_qs(parsed.query).get("q", [""])[0]
+                start = int(parse_qs(parsed.query).get("start", ["0"])[0])
+                results = shopping_results(query)[start:start + 20] if start < 20 else []
+                self._send(200, json.dumps({"shopping_results": results}))
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                body = json.loads(self.rfile.read(length) or b"{}")
+                if not self.path.endswith("/chat/completions"):
+                    return self._send(404, "{}")
+                if self._maybe_fail("groq", fakes.groq_latency):
+                    return
+                content = chat_reply(body.get("messages", []))
+                if not body.get("stream"):
+                    return self._send(200, json.dumps({"choices": [{"message": {"role": "assistant", "content": content}}]}))
+
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                for word in content.split(" "):
+                    chunk = {"choices": [{"delta": {"content": word + " "}}]}
+                    self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+                    self.wfile.flush()
+                    time.sleep(fakes.stream_chunk_delay)
+                self.wfile.write(b"data: [DONE]\n\n")
+                self.close_connection = True
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Local SerpAPI + Groq stand-in servers")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--serp-latency", default="lognormal:300:0.4")
+    parser.add_argument("--groq-latency", default="lognormal:800:0.4")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args(argv)
+
+    fakes = FakeUpstreams(args.serp_latency, args.groq_latency, args.error_rate, args.seed, port=args.port)
+    print(f"SERPAPI_URL={fakes.serpapi_url}")
+    print(f"GROQ_URL={fakes.groq_url}")
+    fakes.server.serve_forever()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+_MISSING = object()
+
+def estimate_size(value):
+    if isinstance(value, str):
+        return len(value.encode("utf-8"))
+    return len(json.dumps(value, ensure_ascii=False).encode("utf-8"))
+
+# ---------------- In-Process LRU + TTL ----------------
+class TTLCache:
+    def __init__(self, max_entries=1024, ttl=900, max_bytes=None, sizeof=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof or estimate_size
+        self._data = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def _pop(self, key):
+        _, _, size = self._data.pop(key)
+        self._bytes -= size
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is _MISSING:
+                self.misses += 1
+                return default
+            expires_at, value, _ = entry
+            if expires_at <= time.time():
+                self._pop(key)
+                self.expirations += 1
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.time() + (self.ttl if ttl is None else ttl)
+        size = self.sizeof(value) if self.max_bytes else 0
+        if self.max_bytes and size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._data:
+                self._pop(key)
+            self._data[key] = (expires_at, value, size)
+            self._bytes += size
+            while len(self._data) > self.max_entries or (self.max_bytes and self._bytes > self.max_bytes):
+                self._pop(next(iter(self._data)))
+                self.evictions += 1
+
+    # الوقت المتبقي قبل الانتهاء (0 إذا غير موجود) بدون احتسابه hit أو miss
+    def ttl_remaining(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            return max(0.0, entry[0] - time.time()) if entry else 0.0
+
+    def delete(self, key):
+        with self._lock:
+            if key in self._data:
+                self._pop(key)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._data),
+                "max_entries": self.max_entries,
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+# ---------------- On-Disk Layer (SQLite) ----------------
+# purge_every: كل N عملية set تُحذف كل الصفوف المنتهية، حتى لا تبقى الأسئلة التي لا تتكرر على القرص للأبد
+class SqliteCache:
+    def __init__(self, path, ttl=900, purge_every=256):
+        self.path = path
+        self.ttl = ttl
+        self.purge_every = purge_every
+        self._sets = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=10, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            " key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+        self._conn.commit()
+        self.hits = 0
+        self.misses = 0
+        self.expirations = 0
+
+    # يعيد (القيمة، الوقت المتبقي) حتى تحتفظ الطبقة الأولى بنفس تاريخ الانتهاء
+    def get_with_ttl(self, key):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return _MISSING, 0
+            value, expires_at = row
+            if expires_at <= now:
+                self._conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+                self._conn.commit()
+                self.expirations += 1
+                self.misses += 1
+                return _MISSING, 0
+            self.hits += 1
+        return json.loads(value), expires_at - now
+
+    def get(self, key, default=None):
+        value, _ = self.get_with_ttl(key)
+        return default if value is _MISSING else value
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.time() + (self.ttl if ttl is None else ttl)
+        payload = json.dumps(value, ensure_ascii=False)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, payload, expires_at),
+            )
+            self._conn.commit()
+            self._sets += 1
+            due = self.purge_every and self._sets % self.purge_every == 0
+        if due:
+            self.purge_expired()
+
+    def ttl_remaining(self, key):
+        with self._lock:
+            row = self._conn.execute("SELECT expires_at FROM cache WHERE key = ?", (key,)).fetchone()
+        return max(0.0, row[0] - time.time()) if row else 0.0
+
+    def purge_expired(self):
+        with self._lock:
+            cur = self._conn.execute("DELETE FROM cache WHERE expires_at <= ?", (time.time(),))
+            self._conn.commit()
+            self.expirations += cur.rowcount
+            return cur.rowcount
+
+    def stats(self):
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+            return {
+                "path": self.path,
+                "entries": entries,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "expirations": self.expirations,
+            }
+
+# ---------------- Two-Tier Cache ----------------
+class TieredCache:
+    def __init__(self, memory, disk=None):
+        self.memory = memory
+        self.disk = disk
+
+    def get(self, key, default=None):
+        value = self.memory.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+        if self.disk is None:
+            return default
+        value, remaining = self.disk.get_with_ttl(key)
+        if value is _MISSING:
+            return default
+        self.memory.set(key, value, ttl=remaining)
+        return value
+
+    def set(self, key, value, ttl=None):
+        self.memory.set(key, value, ttl)
+        if self.disk is not None:
+            self.disk.set(key, value, ttl)
+
+    def ttl_remaining(self, key):
+        remaining = self.memory.ttl_remaining(key)
+        if remaining or self.disk is None:
+            return remaining
+        return self.disk.ttl_remaining(key)
+
+    def stats(self):
+        return {
+            "memory": self.memory.stats(),
+            "disk": self.disk.stats() if self.disk is not None else None,
+        }
+
+def make_cache_key(*parts):
+    return "|".join(str(p) for p in parts)
+
+def content_hash(value):
+    payload = json.dumps(value, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
@@ -0,0 +1,134 @@
+import argparse
+import json
+import os
+import threading
+import time
+
+from conversation import is_follow_up
+from prompt_builder import REPLY_MAX_TOKENS
+
+# ---------------- Cache Warmer ----------------
+# كل CACHE_WARMER_INTERVAL ثانية: أشهر N سؤال من سجل الجلسات (التكرار × الحداثة)،
+# ولكل سؤال تقترب نتائجه من الانتهاء يُعاد جلب SerpAPI (والرد اختياريًا) قبل أن يطلبه المستخدمون،
+# بحد أقصى CACHE_WARMER_BUDGET استدعاء خارجي في كل دورة.
+CACHE_WARMER_ENABLED = os.getenv("CACHE_WARMER_ENABLED", "0") == "1"
+CACHE_WARMER_INTERVAL = float(os.getenv("CACHE_WARMER_INTERVAL", "300"))
+CACHE_WARMER_TOP_N = int(os.getenv("CACHE_WARMER_TOP_N", "20"))
+CACHE_WARMER_BUDGET = int(os.getenv("CACHE_WARMER_BUDGET", "20"))
+CACHE_WARMER_HALF_LIFE = float(os.getenv("CACHE_WARMER_HALF_LIFE", "86400"))
+# يُحدّث المدخل إذا بقي من عمره أقل من هذا (يجب أن يكون أكبر من INTERVAL حتى لا ينتهي بين دورتين)
+CACHE_WARMER_REFRESH_AHEAD = float(os.getenv("CACHE_WARMER_REFRESH_AHEAD", "600"))
+CACHE_WARMER_REPLIES = os.getenv("CACHE_WARMER_REPLIES", "0") == "1"
+# max_tokens جزء من مفتاح كاش الرد، فيُسخَّن الرد لكل قيمة يرسلها العملاء فعلًا:
+# REPLY_MAX_TOKENS (/search بدون max_tokens) و1000 (واجهة Streamlit عبر /search/stream)
+CACHE_WARMER_MAX_TOKENS = [
+    int(v) for v in os.getenv("CACHE_WARMER_MAX_TOKENS", f"{REPLY_MAX_TOKENS},1000").split(",") if v.strip()
+]
+
+class CacheWarmer:
+    # warm_fn(query, budget) -> عدد الاستدعاءات الخارجية المستخدمة (0 = كان حديثًا)
+    def __init__(self, store, warm_fn, top_n=CACHE_WARMER_TOP_N, budget=CACHE_WARMER_BUDGET,
+                 interval=CACHE_WARMER_INTERVAL, half_life=CACHE_WARMER_HALF_LIFE):
+        self.store = store
+        self.warm_fn = warm_fn
+        self.top_n = top_n
+        self.budget = budget
+        self.interval = interval
+        self.half_life = half_life
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+        self.runs = 0
+        self.upstream_calls = 0
+        self.last_run = None
+
+    # أسئلة المتابعة ("أيها أرخص؟") لا معنى لها بدون محادثتها فلا تُسخّن
+    def candidates(self):
+        top = self.store.top_queries(limit=self.top_n * 2, half_life=self.half_life)
+        return [row for row in top if not is_follow_up(row["query"])][:self.top_n]
+
+    def run_once(self):
+        started = time.time()
+        used, warmed, fresh, failed, skipped = 0, [], 0, [], []
+        for row in self.candidates():
+            query = row["query"]
+            if used >= self.budget:
+                skipped.append(query)
+                continue
+            try:
+                calls = self.warm_fn(query, self.budget - used)
+            except Exception as e:
+                print(f"Error warming cache for {query!r}: {e}")
+                failed.append(query)
+                continue
+            used += calls
+            if calls:
+                warmed.append(query)
+            else:
+                fresh += 1
+
+        summary = {
+            "started_at": started,
+            "seconds": round(time.time() - started, 3),
+            "upstream_calls": used,
+            "budget": self.budget,
+            "warmed": warmed,
+            "already_fresh": fresh,
+            "failed": failed,
+            "skipped_over_budget": skipped,
+        }
+        with self._lock:
+            self.runs += 1
+            self.upstream_calls += used
+            self.last_run = summary
+        return summary
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"Error in cache warmer: {e}")
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._loop, daemon=True, name="cache-warmer")
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "running": self._thread is not None and self._thread.is_alive(),
+                "interval": self.interval,
+                "top_n": self.top_n,
+                "budget": self.budget,
+                "runs": self.runs,
+                "upstream_calls": self.upstream_calls,
+                "last_run": self.last_run,
+            }
+
+# ---------------- CLI ----------------
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Warm the SerpAPI/reply caches for the most popular queries.")
+    parser.add_argument("command", choices=["run", "top"], help="run: warm once; top: only list the candidates")
+    parser.add_argument("--top", type=int, default=CACHE_WARMER_TOP_N)
+    parser.add_argument("--budget", type=int, default=CACHE_WARMER_BUDGET)
+    args = parser.parse_args(argv)
+
+    # يستورد الخادم (الكاش والعملاء) فقط عند الحاجة
+    import app as app_module
+    warmer = CacheWarmer(app_module.session_store, app_module.warm_query, top_n=args.top, budget=args.budget)
+    if args.command == "top":
+        for row in warmer.candidates():
+            print(f"{row['score']:10.2f}  {row['hits']:>5}  {row['query']}")
+    else:
+        print(json.dumps(warmer.run_once(), indent=2, ensure_ascii=False))
+
+if __name__ == "__main__":
+    main()
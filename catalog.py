@@ -0,0 +1,204 @@
+import argparse
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from textnorm import normalize_text, tokenize
+
+# ---------------- Local Product Catalog (SQLite FTS5) ----------------
+# كل نتيجة SerpAPI تُحفظ هنا مع وقت جلبها؛ /search يجيب من الكتالوج إذا وجد
+# عددًا كافيًا من المنتجات الحديثة المطابقة، وإلا يذهب إلى SerpAPI.
+CATALOG_MAX_AGE = float(os.getenv("CATALOG_MAX_AGE", str(6 * 3600)))        # أقدم منتج يُعتبر حديثًا
+CATALOG_MIN_RESULTS = int(os.getenv("CATALOG_MIN_RESULTS", "5"))              # أقل عدد مطابقات للإجابة من الكتالوج
+CATALOG_RETENTION = float(os.getenv("CATALOG_RETENTION", str(7 * 24 * 3600))) # بعدها يُحذف المنتج عند الضغط
+CATALOG_MAX_PRODUCTS = int(os.getenv("CATALOG_MAX_PRODUCTS", "200000"))
+CATALOG_COMPACT_EVERY = int(os.getenv("CATALOG_COMPACT_EVERY", "500"))        # ضغط تلقائي كل N عملية إدخال
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS products (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    product_key TEXT NOT NULL UNIQUE,
+    search_text TEXT NOT NULL,
+    data TEXT NOT NULL,
+    query TEXT,
+    fetched_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_products_fetched_at ON products (fetched_at);
+
+CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5(
+    search_text, content='products', content_rowid='id'
+);
+CREATE TRIGGER IF NOT EXISTS products_ai AFTER INSERT ON products BEGIN
+    INSERT INTO products_fts (rowid, search_text) VALUES (new.id, new.search_text);
+END;
+CREATE TRIGGER IF NOT EXISTS products_ad AFTER DELETE ON products BEGIN
+    INSERT INTO products_fts (products_fts, rowid, search_text) VALUES ('delete', old.id, old.search_text);
+END;
+CREATE TRIGGER IF NOT EXISTS products_au AFTER UPDATE OF search_text ON products BEGIN
+    INSERT INTO products_fts (products_fts, rowid, search_text) VALUES ('delete', old.id, old.search_text);
+    INSERT INTO products_fts (rowid, search_text) VALUES (new.id, new.search_text);
+END;
+"""
+
+def product_key(product):
+    # الرابط يميز العرض؛ بدونه نستخدم العنوان + المتجر
+    link = product.get("link")
+    if link:
+        return link
+    return f"{normalize_text(product.get('title'))}|{normalize_text(product.get('source'))}"
+
+def fts_query(query):
+    tokens = tokenize(query)
+    # كل كلمة مطلوبة (AND)، وكل كلمة بين علامتي تنصيص حتى لا تُفهم كمعامل FTS
+    return " ".join(f'"{t}"' for t in tokens)
+
+class Catalog:
+    def __init__(self, path, max_age=CATALOG_MAX_AGE, min_results=CATALOG_MIN_RESULTS,
+                 retention=CATALOG_RETENTION, max_products=CATALOG_MAX_PRODUCTS, compact_every=CATALOG_COMPACT_EVERY):
+        self.path = path
+        self.max_age = max_age
+        self.min_results = min_results
+        self.retention = retention
+        self.max_products = max_products
+        self.compact_every = compact_every
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._ingests = 0
+        self.hits = 0
+        self.misses = 0
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=30000")
+            conn.executescript(SCHEMA)
+            self._local.conn = conn
+        return conn
+
+    def ingest(self, query, products, fetched_at=None):
+        fetched_at = fetched_at or time.time()
+        rows = [
+            (product_key(p), normalize_text(p.get("title")), json.dumps(p, ensure_ascii=False), query, fetched_at)
+            for p in products if p.get("title")
+        ]
+        if not rows:
+            return 0
+        conn = self._conn()
+        with conn:
+            conn.executemany(
+                "INSERT INTO products (product_key, search_text, data, query, fetched_at) VALUES (?, ?, ?, ?, ?)"
+                " ON CONFLICT (product_key) DO UPDATE SET"
+                " search_text = excluded.search_text, data = excluded.data,"
+                " query = excluded.query, fetched_at = excluded.fetched_at",
+                rows,
+            )
+
+        with self._lock:
+            self._ingests += 1
+            due = self.compact_every and self._ingests % self.compact_every == 0
+        if due:
+            self.compact()
+        return len(rows)
+
+    def search(self, query, limit=5, max_age=None):
+        match = fts_query(query)
+        if not match:
+            return []
+        cutoff = time.time() - (self.max_age if max_age is None else max_age)
+        rows = self._conn().execute(
+            "SELECT p.data FROM products_fts f JOIN products p ON p.id = f.rowid"
+            " WHERE products_fts MATCH ? AND p.fetched_at >= ?"
+            " ORDER BY bm25(products_fts), p.fetched_at DESC LIMIT ?",
+            (match, cutoff, limit),
+        ).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    # None = لا يكفي (قديم أو قليل) ويجب الذهاب إلى SerpAPI
+    def lookup(self, query, limit=5):
+        products = self.search(query, limit=max(limit, self.min_results))
+        with self._lock:
+            if len(products) >= self.min_results:
+                self.hits += 1
+            else:
+                self.misses += 1
+                return None
+        return products[:limit]
+
+    # ---------------- Compaction ----------------
+    # يحذف المنتجات الأقدم من retention، ثم الأقدم جلبًا إذا تجاوز العدد max_products، ثم يدمج فهرس FTS
+    def compact(self):
+        conn = self._conn()
+        with conn:
+            expired = conn.execute(
+                "DELETE FROM products WHERE fetched_at < ?", (time.time() - self.retention,)
+            ).rowcount
+            overflow = conn.execute(
+                "DELETE FROM products WHERE id IN ("
+                " SELECT id FROM products ORDER BY fetched_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_products,),
+            ).rowcount
+            conn.execute("INSERT INTO products_fts (products_fts) VALUES ('optimize')")
+        return {"expired": expired, "overflow": overflow}
+
+    def vacuum(self):
+        self._conn().execute("VACUUM")
+
+    def count(self):
+        return self._conn().execute("SELECT COUNT(*) FROM products").fetchone()[0]
+
+    def stats(self):
+        conn = self._conn()
+        total, oldest, newest = conn.execute(
+            "SELECT COUNT(*), MIN(fetched_at), MAX(fetched_at) FROM products"
+        ).fetchone()
+        fresh = conn.execute(
+            "SELECT COUNT(*) FROM products WHERE fetched_at >= ?", (time.time() - self.max_age,)
+        ).fetchone()[0]
+        with self._lock:
+            hits, misses = self.hits, self.misses
+        return {
+            "products": total,
+            "fresh_products": fresh,
+            "oldest_fetched_at": oldest,
+            "newest_fetched_at": newest,
+            "hits": hits,
+            "misses": misses,
+            "max_age": self.max_age,
+            "min_results": self.min_results,
+        }
+
+    def close(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+# ---------------- CLI ----------------
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Maintain the local product catalog.")
+    parser.add_argument("command", choices=["compact", "stats", "search"])
+    parser.add_argument("query", nargs="?", help="search: products matching this query")
+    parser.add_argument("--db", default=os.getenv("CATALOG_DB", "catalog.db"))
+    parser.add_argument("--vacuum", action="store_true", help="compact: also VACUUM the database file")
+    args = parser.parse_args(argv)
+
+    catalog = Catalog(args.db)
+    if args.command == "compact":
+        result = catalog.compact()
+        if args.vacuum:
+            catalog.vacuum()
+        print(f"Removed {result['expired']} expired and {result['overflow']} overflow products; {catalog.count()} left")
+    elif args.command == "stats":
+        print(json.dumps(catalog.stats(), indent=2))
+    else:
+        for p in catalog.search(args.query or "", limit=20, max_age=catalog.retention):
+            print(f"- {p.get('title')} | {p.get('price')} | {p.get('source')}")
+    catalog.close()
+
+if __name__ == "__main__":
+    main()
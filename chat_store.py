@@ -0,0 +1,98 @@
+import os
+import json
+import threading
+
+# ---------------- Append-Only Chat Store ----------------
+# كل حفظ يضيف سطر JSON واحد (JSONL) بدل إعادة كتابة الملف كاملاً،
+# والفهرس في الذاكرة (query -> آخر نسخة) يجعل البحث O(1).
+# عند إعادة التحميل آخر سطر لنفس السؤال هو الصحيح (last-write-wins).
+COMPACT_MIN_LINES = int(os.getenv("CHAT_STORE_COMPACT_MIN_LINES", "1000"))
+COMPACT_RATIO = float(os.getenv("CHAT_STORE_COMPACT_RATIO", "2"))
+
+def merge_chat(existing, data):
+    # نفس دمج save_chat_unified القديم: المنتجات تُضاف حسب العنوان، والرد والتقييم يُستبدلان
+    merged = dict(existing)
+    products = list(existing.get("products", []))
+    titles = {p.get("title") for p in products}
+    for p in data.get("products", []):
+        if p.get("title") not in titles:
+            products.append(p)
+            titles.add(p.get("title"))
+    merged["products"] = products
+    merged["ai_reply"] = data.get("ai_reply")
+    merged["evaluation_score"] = data.get("evaluation_score")
+    return merged
+
+class ChatStore:
+    def __init__(self, path, legacy_path=None, compact_min_lines=COMPACT_MIN_LINES, compact_ratio=COMPACT_RATIO):
+        self.path = str(path)
+        self.compact_min_lines = compact_min_lines
+        self.compact_ratio = compact_ratio
+        self._index = {}
+        self._lines = 0
+        self._lock = threading.Lock()
+
+        if os.path.exists(self.path):
+            self._load()
+        elif legacy_path and os.path.exists(legacy_path):
+            self.import_legacy(legacy_path)
+
+    def _load(self):
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # سطر أخير ناقص بعد توقف مفاجئ
+                    print(f"Skipping corrupt line in {self.path}")
+                    continue
+                self._index[entry["query"]] = entry
+                self._lines += 1
+
+    def import_legacy(self, legacy_path):
+        with open(legacy_path, "r", encoding="utf-8") as f:
+            chats = json.load(f)
+        with self._lock:
+            for entry in chats:
+                existing = self._index.get(entry["query"])
+                self._index[entry["query"]] = merge_chat(existing, entry) if existing else entry
+            self._rewrite()
+        return len(chats)
+
+    def get(self, query):
+        return self._index.get(query)
+
+    def entries(self):
+        return list(self._index.values())
+
+    def __len__(self):
+        return len(self._index)
+
+    def save(self, data):
+        with self._lock:
+            existing = self._index.get(data["query"])
+            entry = merge_chat(existing, data) if existing else data
+            self._index[data["query"]] = entry
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            self._lines += 1
+
+            if self._lines > max(self.compact_min_lines, self.compact_ratio * len(self._index)):
+                self._rewrite()
+        return entry
+
+    def compact(self):
+        with self._lock:
+            self._rewrite()
+
+    # يكتب نسخة واحدة لكل سؤال في ملف مؤقت ثم يستبدل الأصلي (آمن عند التوقف)
+    def _rewrite(self):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for entry in self._index.values():
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        os.replace(tmp_path, self.path)
+        self._lines = len(self._index)
@@ -0,0 +1,165 @@
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from prompt_builder import estimate_tokens, MESSAGE_OVERHEAD_TOKENS
+from textnorm import normalize_text, tokenize
+
+# ---------------- Conversation State (in-memory) ----------------
+# لكل session_id: آخر الأسئلة والردود + منتجات آخر بحث، حتى تُجاب أسئلة المتابعة
+# ("أيها أرخص؟") من نفس المنتجات بدون SerpAPI، ويُرسل السياق السابق إلى Groq كرسائل.
+CONVERSATION_MAX_SESSIONS = int(os.getenv("CONVERSATION_MAX_SESSIONS", "1000"))   # LRU
+CONVERSATION_IDLE_TTL = float(os.getenv("CONVERSATION_IDLE_TTL", "1800"))          # ثوانٍ بدون نشاط
+CONVERSATION_MAX_TURNS = int(os.getenv("CONVERSATION_MAX_TURNS", "6"))             # الأقدم يُضغط في ملخص
+CONVERSATION_HISTORY_TOKENS = int(os.getenv("CONVERSATION_HISTORY_TOKENS", "800"))
+CONVERSATION_SUMMARY_CHARS = int(os.getenv("CONVERSATION_SUMMARY_CHARS", "600"))
+TURN_REPLY_MAX_CHARS = 300
+
+# أسئلة تشير إلى منتجات سبق عرضها (بعد normalize_text: أ/إ ← ا، ة ← ه، ى ← ي).
+# كلمة إشارة ("these"، "منها"، "ايهما") تكفي؛ أما "cheaper"/"الاول"/"previous" وحدها فتأتي
+# في أسئلة جديدة أيضًا ("cheapest gaming laptop"، "ارخص لابتوب") فلا تُعد متابعة إلا إذا
+# لم يبقَ في السؤال أي كلمة منتج بعد حذف كلمات التوقف وكلمات الإحالة.
+DEICTIC_RE = re.compile(
+    r"\b(?:these|those|them|this one|that one|the (?:first|second|third|last) one|either of|"
+    r"you (?:mentioned|listed|showed|suggested|recommended))\b"
+    r"|(?<!\w)(?:هذه|هذي|هذول|هاذي|منها|منهم|منهما|ايهما|ايها|ايهم|كلاهما|كليهما|المذكوره)(?!\w)"
+    # "هل الاول يدعم..." : الترتيب في بداية السؤال يعني "الأول منها"، بخلاف "ايفون الاول"
+    r"|^(?:(?:هل|ما|وش|كم)\s+)?(?:الاول|الثاني|الثالث|الاخير)(?!\w)"
+)
+REFERENCE_RE = re.compile(
+    r"\b(?:which one|which of|first|second|third|last|cheaper|cheapest|more expensive|most expensive|previous)\b"
+    r"|(?<!\w)(?:الارخص|ارخص|الاغلي|اغلي|الاول|الثاني|الثالث|الاخير|السابق|السابقه)(?!\w)"
+)
+FOLLOW_UP_FILLER = frozenset({
+    "one", "ones", "option", "options", "choice", "item", "items", "product", "products", "model", "models",
+    "more", "most", "less", "expensive", "cheaper", "cheapest", "better", "good", "first", "second", "third",
+    "last", "previous", "it", "about", "recommend", "should", "buy", "get", "pick", "choose", "are", "do",
+    "does", "can", "you", "would",
+    "الارخص", "ارخص", "الاغلي", "اغلي", "الاول", "الثاني", "الثالث", "الاخير", "السابق", "السابقه",
+    "احسن", "الاحسن", "انسب", "الانسب", "واحد", "الواحد", "خيار", "الخيار", "اشتري", "اختار", "تنصحني", "تنصح",
+})
+
+def is_follow_up(query):
+    text = normalize_text(query)
+    if DEICTIC_RE.search(text):
+        return True
+    if not REFERENCE_RE.search(text):
+        return False
+    return all(token in FOLLOW_UP_FILLER for token in tokenize(query))
+
+def _clip(text, max_chars):
+    text = " ".join(str(text or "").split())
+    return text if len(text) <= max_chars else text[:max_chars].rsplit(" ", 1)[0] + "…"
+
+class Conversation:
+    def __init__(self, session_id, now):
+        self.session_id = session_id
+        self.turns = []               # [{"query", "reply"}]، الأحدث آخرًا
+        self.summary = ""             # الأسئلة الأقدم بعد الضغط
+        self.products_by_item = None  # منتجات آخر بحث فعلي
+        self.last_seen = now
+
+    def _compact(self, max_turns, summary_chars):
+        if len(self.turns) <= max_turns:
+            return
+        old, self.turns = self.turns[:-max_turns], self.turns[-max_turns:]
+        folded = "; ".join(f"{t['query']} → {_clip(t['reply'], 80)}" for t in old)
+        summary = f"{self.summary}; {folded}" if self.summary else folded
+        # نحتفظ بنهاية الملخص (الأحدث) إذا تجاوز الحد
+        self.summary = summary if len(summary) <= summary_chars else "…" + summary[-summary_chars:]
+
+    # رسائل user/assistant السابقة ضمن ميزانية tokens؛ الأحدث أولًا حتى تمتلئ الميزانية
+    def history_messages(self, budget_tokens=CONVERSATION_HISTORY_TOKENS):
+        messages, used = [], 0
+        for turn in reversed(self.turns):
+            pair = [
+                {"role": "user", "content": turn["query"]},
+                {"role": "assistant", "content": _clip(turn["reply"], TURN_REPLY_MAX_CHARS)},
+            ]
+            cost = sum(estimate_tokens(m["content"]) + MESSAGE_OVERHEAD_TOKENS for m in pair)
+            if used + cost > budget_tokens:
+                break
+            messages[:0] = pair
+            used += cost
+        if self.summary and len(messages) == 2 * len(self.turns):
+            note = {"role": "system", "content": f"Earlier in this conversation: {self.summary}"}
+            if used + estimate_tokens(note["content"]) + MESSAGE_OVERHEAD_TOKENS <= budget_tokens:
+                messages.insert(0, note)
+        return messages
+
+class ConversationStore:
+    def __init__(self, max_sessions=CONVERSATION_MAX_SESSIONS, idle_ttl=CONVERSATION_IDLE_TTL,
+                 max_turns=CONVERSATION_MAX_TURNS, summary_chars=CONVERSATION_SUMMARY_CHARS, clock=time.monotonic):
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self.max_turns = max_turns
+        self.summary_chars = summary_chars
+        self.clock = clock
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        self.evicted = 0
+        self.expired = 0
+        self.follow_ups = 0
+
+    # الترتيب حسب آخر نشاط، فالمنتهية كلها في البداية
+    def _expire(self, now):
+        while self._sessions:
+            conversation = next(iter(self._sessions.values()))
+            if now - conversation.last_seen <= self.idle_ttl:
+                break
+            self._sessions.popitem(last=False)
+            self.expired += 1
+
+    def get(self, session_id):
+        if not session_id:
+            return None
+        with self._lock:
+            self._expire(self.clock())
+            conversation = self._sessions.get(session_id)
+            if conversation is not None:
+                self._sessions.move_to_end(session_id)
+                conversation.last_seen = self.clock()
+            return conversation
+
+    # products_by_item=None (سؤال متابعة) يُبقي منتجات البحث السابق
+    def record(self, session_id, query, reply, products_by_item=None):
+        if not session_id:
+            return None
+        with self._lock:
+            now = self.clock()
+            self._expire(now)
+            conversation = self._sessions.get(session_id)
+            if conversation is None:
+                conversation = self._sessions[session_id] = Conversation(session_id, now)
+            self._sessions.move_to_end(session_id)
+            conversation.last_seen = now
+            conversation.turns.append({"query": query, "reply": reply})
+            if products_by_item is not None:
+                conversation.products_by_item = products_by_item
+            conversation._compact(self.max_turns, self.summary_chars)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+                self.evicted += 1
+            return conversation
+
+    def count_follow_up(self):
+        with self._lock:
+            self.follow_ups += 1
+
+    def clear(self):
+        with self._lock:
+            self._sessions.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "sessions": len(self._sessions),
+                "max_sessions": self.max_sessions,
+                "idle_ttl": self.idle_ttl,
+                "max_turns": self.max_turns,
+                "evicted": self.evicted,
+                "expired": self.expired,
+                "follow_ups": self.follow_ups,
+            }
@@ -0,0 +1,89 @@
+import queue
+import threading
+from collections import OrderedDict
+
+# ---------------- Background Evaluation Queue ----------------
+# التقييم يتم بعد إرجاع الرد للمستخدم: طابور + مجموعة خيوط عاملة،
+# والنتيجة تُكتب في سجل الجلسات عبر on_done.
+PENDING = "pending"
+DONE = "done"
+FAILED = "failed"
+SKIPPED = "skipped"
+
+class EvaluationQueue:
+    def __init__(self, evaluate_fn, on_done, workers=2, max_pending=1000, max_tracked=10000):
+        self.evaluate_fn = evaluate_fn
+        self.on_done = on_done
+        self.workers = workers
+        self.max_tracked = max_tracked
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._status = OrderedDict()
+        self._lock = threading.Lock()
+        self._threads = []
+        self.completed = 0
+        self.failed = 0
+        self.skipped = 0
+
+    def _set_status(self, session_id, status, scores=None):
+        with self._lock:
+            self._status[session_id] = (status, scores)
+            self._status.move_to_end(session_id)
+            while len(self._status) > self.max_tracked:
+                self._status.popitem(last=False)
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                t = threading.Thread(target=self._run, name=f"evaluation-worker-{i}", daemon=True)
+                t.start()
+                self._threads.append(t)
+
+    def submit(self, session_id, query, context, final_answer):
+        self._ensure_started()
+        self._set_status(session_id, PENDING)
+        try:
+            self._queue.put_nowait((session_id, query, context, final_answer))
+            return True
+        except queue.Full:
+            # الطابور ممتلئ: نتجاوز التقييم بدل إبطاء الطلبات (يمكن إعادته لاحقًا دفعة واحدة)
+            print(f"Evaluation queue full, skipping session {session_id}")
+            self._set_status(session_id, SKIPPED)
+            with self._lock:
+                self.skipped += 1
+            return False
+
+    def _run(self):
+        while True:
+            session_id, query, context, final_answer = self._queue.get()
+            try:
+                scores = self.evaluate_fn(query, context, final_answer)
+                self.on_done(session_id, scores, query)
+                self._set_status(session_id, DONE, scores)
+                with self._lock:
+                    self.completed += 1
+            except Exception as e:
+                print(f"Error in background evaluation for {session_id}: {e}")
+                self._set_status(session_id, FAILED)
+                with self._lock:
+                    self.failed += 1
+            finally:
+                self._queue.task_done()
+
+    def status(self, session_id):
+        with self._lock:
+            return self._status.get(session_id)
+
+    def join(self):
+        self._queue.join()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "queued": self._queue.qsize(),
+                "completed": self.completed,
+                "failed": self.failed,
+                "skipped": self.skipped,
+            }
@@ -0,0 +1,153 @@
+import os
+import json
+
+from prompt_builder import (
+    CONTEXT_SLOT, PROMPT_INPUT_TOKENS, dedupe_products, estimate_messages_tokens, estimate_tokens, fill_context,
+    truncate_title,
+)
+from textnorm import normalize_text
+
+# ---------------- Fast Mode (one structured LLM call) ----------------
+# التصفية + الرد + التقييم الذاتي في استدعاء واحد بدل N+2 استدعاءات
+# الرد نفسه بميزانية max_tokens العادية، وهذه إضافة لمعرفات المنتجات والتقييم داخل JSON
+FAST_EXTRA_TOKENS = int(os.getenv("FAST_EXTRA_TOKENS", "400"))
+
+SCORE_KEYS = ("faithfulness", "relevance", "completeness")
+
+class FastModeError(ValueError):
+    pass
+
+# ---------------- Prompt ----------------
+# كل منتج يأخذ معرفًا "رقم العنصر.رقم المنتج" ويعيده النموذج بدل نسخ العنوان
+def render_catalog(products_by_item, budget_tokens, catalog):
+    text = ""
+    per_item = budget_tokens // max(1, len(products_by_item))
+    for i, (item, products) in enumerate(products_by_item.items(), 1):
+        header = f"\n[{i}] {item}:\n"
+        text += header
+        used = estimate_tokens(header)
+        titled = [p for p in products if p.get("title")]
+        for j, p in enumerate(dedupe_products(titled), 1):
+            pid = f"{i}.{j}"
+            line = f"{pid} | {truncate_title(p.get('title'))} | {p.get('price')} | {p.get('source')}\n"
+            cost = estimate_tokens(line)
+            if used + cost > per_item:
+                break
+            text += line
+            used += cost
+            catalog[pid] = (item, p)
+    return text
+
+def build_fast_messages(query, products_by_item, system_prompt, user_lang="en", history=None):
+    catalog = {}
+    history = history or []
+    items = json.dumps(list(products_by_item.keys()), ensure_ascii=False)
+    shape = '{"products": {"<item>": ["1.1", "1.2"]}, "reply": "...", "evaluation": {"faithfulness": 0, "relevance": 0, "completeness": 0}}'
+
+    if user_lang == "ar":
+        prompt = f"""
+أنت مساعد تسوق خبير. أجب باستجابة JSON واحدة فقط تتضمن:
+1- products: لكل عنصر، معرفات المنتجات المتعلقة بالسؤال مباشرة (الأكثر صلة أولاً).
+2- reply: ردك على المستخدم باللغة العربية لمقارنة هذه المنتجات وتقديم التوصيات.
+3- evaluation: قيّم ردك: faithfulness و relevance و completeness من 10 إلى 100.
+
+سؤال المستخدم: {query}
+العناصر: {items}
+المنتجات (المعرف | العنوان | السعر | المصدر):
+{CONTEXT_SLOT}
+
+أعد JSON فقط بهذا الشكل:
+{shape}
+"""
+    else:
+        prompt = f"""
+You are a shopping assistant expert. Answer with ONE JSON document only, containing:
+1- products: for each item, the ids of products directly relevant to the question (most relevant first).
+2- reply: your reply to the user in English, comparing these products and giving recommendations.
+3- evaluation: rate your own reply: faithfulness, relevance and completeness from 10 to 100.
+
+User question: {query}
+Items: {items}
+Products (id | title | price | source):
+{CONTEXT_SLOT}
+
+Return only JSON in exactly this shape:
+{shape}
+"""
+
+    prompt = fill_context(
+        system_prompt, prompt, lambda budget: render_catalog(products_by_item, budget, catalog),
+        PROMPT_INPUT_TOKENS - estimate_messages_tokens(history),
+    )
+    messages = [
+        {"role": "system", "content": system_prompt},
+        *history,
+        {"role": "user", "content": prompt},
+    ]
+    return messages, catalog
+
+# ---------------- Schema Validation ----------------
+def _strip_fences(text):
+    text = text.strip()
+    if text.startswith("```"):
+        text = text.split("\n", 1)[1] if "\n" in text else ""
+        text = text.rsplit("```", 1)[0]
+    return text.strip()
+
+def _resolve_item(key, items):
+    if key in items:
+        return key
+    if str(key).isdigit() and 1 <= int(key) <= len(items):
+        return items[int(key) - 1]
+    normalized = normalize_text(key)
+    return next((item for item in items if normalize_text(item) == normalized), None)
+
+# يعيد (products_by_item, reply, evaluation) أو يرفع FastModeError
+def parse_fast_response(text, products_by_item, catalog):
+    try:
+        data = json.loads(_strip_fences(text))
+    except (TypeError, json.JSONDecodeError) as e:
+        raise FastModeError(f"Fast mode reply is not JSON: {e}")
+    if not isinstance(data, dict):
+        raise FastModeError("Fast mode reply must be a JSON object")
+
+    reply = data.get("reply")
+    if not isinstance(reply, str) or not reply.strip():
+        raise FastModeError("Fast mode reply is missing 'reply'")
+
+    evaluation = data.get("evaluation")
+    if not isinstance(evaluation, dict) or not all(
+        isinstance(evaluation.get(k), (int, float)) and not isinstance(evaluation.get(k), bool) for k in SCORE_KEYS
+    ):
+        raise FastModeError("Fast mode reply has an invalid 'evaluation'")
+
+    selected = data.get("products")
+    if not isinstance(selected, dict):
+        raise FastModeError("Fast mode reply is missing 'products'")
+
+    items = list(products_by_item.keys())
+    filtered = {}
+    for key, ids in selected.items():
+        item = _resolve_item(key, items)
+        if item is None or not isinstance(ids, list):
+            raise FastModeError(f"Fast mode reply has an invalid products entry: {key!r}")
+        chosen = []
+        for pid in ids:
+            entry = catalog.get(str(pid))
+            if entry and entry[0] == item and entry[1] not in chosen:
+                chosen.append(entry[1])
+        filtered[item] = chosen
+
+    missing = [
+        item for item, products in products_by_item.items()
+        if item not in filtered and any(p.get("title") for p in products)
+    ]
+    if missing:
+        raise FastModeError(f"Fast mode reply is missing items: {missing}")
+
+    # العناصر التي فشل جلبها تحتفظ برسالة الخطأ كما في المسار العادي
+    for item, products in products_by_item.items():
+        if products and not any(p.get("title") for p in products):
+            filtered[item] = products
+
+    return filtered, reply.strip(), {k: evaluation[k] for k in SCORE_KEYS}
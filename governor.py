@@ -0,0 +1,176 @@
+import threading
+import time
+
+# ---------------- Upstream Governor ----------------
+# لكل خدمة خارجية: token bucket حسب حصة الخطة، طابور انتظار محدود،
+# حد تزامن متكيف (AIMD) وقاطع دائرة (circuit breaker) يرفض فورًا أثناء تعافي الخدمة.
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+class UpstreamUnavailable(RuntimeError):
+    def __init__(self, name, reason, retry_after=None):
+        super().__init__(f"{name} unavailable: {reason}")
+        self.name = name
+        self.reason = reason
+        self.retry_after = retry_after
+
+class TokenBucket:
+    # rate = 0 يعني بلا حد
+    def __init__(self, rate, burst, clock=time.monotonic):
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self.clock = clock
+        self.tokens = self.burst
+        self.updated = clock()
+        self.not_before = 0.0
+
+    def _refill(self, now):
+        if self.rate > 0:
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    # يعيد 0 إذا أُخذ token، وإلا عدد الثواني حتى يتوفر
+    def try_take(self):
+        now = self.clock()
+        if now < self.not_before:
+            return self.not_before - now
+        if self.rate <= 0:
+            return 0.0
+        self._refill(now)
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    # Retry-After من الخادم يوقف الإرسال حتى ذلك الوقت
+    def pause(self, seconds):
+        self.not_before = max(self.not_before, self.clock() + seconds)
+
+class Governor:
+    def __init__(self, name, rate=0.0, burst=10, max_concurrency=32, min_concurrency=1, initial_concurrency=None,
+                 max_queue=64, max_wait=10.0, failure_threshold=5, open_seconds=30.0, clock=time.monotonic):
+        self.name = name
+        self.bucket = TokenBucket(rate, burst, clock)
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.limit = float(initial_concurrency or max_concurrency)
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.failure_threshold = failure_threshold
+        self.open_seconds = open_seconds
+        self.clock = clock
+
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self.consecutive_failures = 0
+        self.probe_in_flight = False
+        self.in_flight = 0
+        self.waiting = 0
+        self.counters = {"admitted": 0, "ok": 0, "throttled": 0, "errors": 0, "opened": 0}
+        self.rejected = {}
+        self._cond = threading.Condition()
+
+    def _reject(self, reason, retry_after=None):
+        self.rejected[reason] = self.rejected.get(reason, 0) + 1
+        raise UpstreamUnavailable(self.name, reason, retry_after)
+
+    def _check_circuit(self):
+        if self.state == OPEN:
+            remaining = self.opened_at + self.open_seconds - self.clock()
+            if remaining > 0:
+                self._reject("circuit_open", remaining)
+            # انتهت مهلة الفتح: طلب تجريبي واحد يقرر الإغلاق أو إعادة الفتح
+            self.state = HALF_OPEN
+        if self.state == HALF_OPEN:
+            if self.probe_in_flight:
+                self._reject("circuit_half_open", self.open_seconds)
+            self.probe_in_flight = True
+
+    # None = الحد ممتلئ (ننتظر release)، 0 = قُبل، وإلا ثوانٍ حتى يتوفر token
+    def _try_admit(self):
+        if self.in_flight >= int(self.limit):
+            return None
+        return self.bucket.try_take()
+
+    def acquire(self):
+        with self._cond:
+            self._check_circuit()
+            wait = self._try_admit()
+            if wait != 0.0:
+                # لا مكان فوري: انتظار في طابور محدود حتى max_wait
+                if self.waiting >= self.max_queue:
+                    self._release_probe()
+                    self._reject("queue_full")
+                deadline = self.clock() + self.max_wait
+                self.waiting += 1
+                try:
+                    while wait != 0.0:
+                        remaining = deadline - self.clock()
+                        if remaining <= 0:
+                            self._release_probe()
+                            self._reject("wait_timeout")
+                        self._cond.wait(remaining if wait is None else min(wait, remaining))
+                        wait = self._try_admit()
+                finally:
+                    self.waiting -= 1
+            self.in_flight += 1
+            self.counters["admitted"] += 1
+
+    def _release_probe(self):
+        if self.state == HALF_OPEN:
+            self.probe_in_flight = False
+
+    def _trip(self):
+        self.state = OPEN
+        self.opened_at = self.clock()
+        self.probe_in_flight = False
+        self.counters["opened"] += 1
+
+    # outcome: ok | throttled (429) | error (5xx / انقطاع الاتصال)
+    def release(self, outcome, retry_after=None):
+        with self._cond:
+            self.in_flight -= 1
+            if outcome == "ok":
+                self.counters["ok"] += 1
+                # زيادة جمعية: ~+1 لكل "نافذة" كاملة من الطلبات الناجحة
+                self.limit = min(self.max_concurrency, self.limit + 1 / max(1.0, self.limit))
+                self.consecutive_failures = 0
+                if self.state == HALF_OPEN:
+                    self.state = CLOSED
+                    self.probe_in_flight = False
+            else:
+                self.counters["throttled" if outcome == "throttled" else "errors"] += 1
+                # تخفيض ضربي عند الضغط على الخدمة
+                self.limit = max(self.min_concurrency, self.limit / 2)
+                self.consecutive_failures += 1
+                if retry_after:
+                    self.bucket.pause(retry_after)
+                if self.state == HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+                    self._trip()
+            self._cond.notify_all()
+
+    def reset(self):
+        with self._cond:
+            self.state = CLOSED
+            self.consecutive_failures = 0
+            self.probe_in_flight = False
+            self.limit = float(self.max_concurrency)
+            self._cond.notify_all()
+
+    def stats(self):
+        with self._cond:
+            open_remaining = 0.0
+            if self.state == OPEN:
+                open_remaining = max(0.0, self.opened_at + self.open_seconds - self.clock())
+            return {
+                "state": self.state,
+                "open_remaining": round(open_remaining, 2),
+                "consecutive_failures": self.consecutive_failures,
+                "concurrency_limit": round(self.limit, 2),
+                "in_flight": self.in_flight,
+                "waiting": self.waiting,
+                "rate": self.bucket.rate,
+                "burst": self.bucket.burst,
+                "tokens": round(self.bucket.tokens, 2),
+                **self.counters,
+                "rejected": dict(self.rejected),
+            }
@@ -0,0 +1,242 @@
+import os
+import hmac
+import hashlib
+import ipaddress
+import socket
+import threading
+from collections import OrderedDict
+from io import BytesIO
+from urllib.parse import urlencode, urljoin, urlparse
+from PIL import Image, ImageOps
+
+from singleflight import SingleFlight
+
+# ---------------- Configuration ----------------
+# بطاقة المنتج بعرض 150px، والصورة المصغرة بضعف ذلك لشاشات الجوال عالية الدقة
+IMAGE_PROXY_SIZE = int(os.getenv("IMAGE_PROXY_SIZE", "300"))
+IMAGE_CACHE_DIR = os.getenv("IMAGE_CACHE_DIR", "image_cache")
+IMAGE_CACHE_MAX_BYTES = int(os.getenv("IMAGE_CACHE_MAX_BYTES", str(200 * 1024 * 1024)))
+IMAGE_MAX_SOURCE_BYTES = int(os.getenv("IMAGE_MAX_SOURCE_BYTES", str(10 * 1024 * 1024)))
+IMAGE_CACHE_MAX_AGE = int(os.getenv("IMAGE_CACHE_MAX_AGE", str(7 * 24 * 3600)))
+IMAGE_MAX_REDIRECTS = int(os.getenv("IMAGE_MAX_REDIRECTS", "3"))
+# روابط /img موقعة دائمًا حتى لا يُستخدم كبروكسي مفتوح. السر ثابت من الإعدادات (وليس عشوائيًا لكل عملية)
+# حتى تقبل كل عمليات uvicorn روابط بعضها وتبقى الروابط صالحة بعد إعادة التشغيل؛ بدونه لا يعمل البروكسي
+IMAGE_PROXY_SECRET = os.getenv("IMAGE_PROXY_SECRET", "")
+REDIRECT_STATUSES = {301, 302, 303, 307, 308}
+
+CONTENT_TYPES = {".jpg": "image/jpeg", ".png": "image/png"}
+
+class ImageProxyError(Exception):
+    def __init__(self, status_code, detail):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+# ---------------- Signed Proxy URLs ----------------
+def sign_url(url, secret=None):
+    secret = secret if secret is not None else IMAGE_PROXY_SECRET
+    if not secret:
+        return None
+    return hmac.new(secret.encode("utf-8"), url.encode("utf-8"), hashlib.sha256).hexdigest()[:32]
+
+# بدون سر لا يُقبل أي رابط
+def verify_signature(url, sig, secret=None):
+    expected = sign_url(url, secret)
+    return expected is not None and sig is not None and hmac.compare_digest(expected, sig)
+
+def proxy_url(url, secret=None):
+    if not url:
+        return None
+    params = {"url": url}
+    sig = sign_url(url, secret)
+    if sig:
+        params["sig"] = sig
+    return "/img?" + urlencode(params)
+
+def resolve_host(hostname, port):
+    return [info[4][0] for info in socket.getaddrinfo(hostname, port, proto=socket.IPPROTO_TCP)]
+
+# يُفحص العنوان بعد DNS وليس الاسم فقط: اسم يشير إلى 127.0.0.1 أو 169.254.169.254 مرفوض
+def is_allowed_url(url, allow_private=False, resolve=resolve_host):
+    parsed = urlparse(url)
+    if parsed.scheme not in ("http", "https") or not parsed.hostname:
+        return False
+    if allow_private:
+        return True
+    try:
+        port = parsed.port or (443 if parsed.scheme == "https" else 80)
+        addresses = resolve(parsed.hostname, port)
+    except (OSError, ValueError):
+        return False
+    # عنوان IPv6 قد يحمل نطاقًا ("fe80::1%eth0")
+    return bool(addresses) and all(ipaddress.ip_address(a.split("%")[0]).is_global for a in addresses)
+
+# ---------------- Thumbnails ----------------
+def make_thumbnail(data, size=IMAGE_PROXY_SIZE):
+    try:
+        image = Image.open(BytesIO(data))
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((size, size))
+    except Exception as e:
+        raise ImageProxyError(502, f"Invalid image: {e}")
+
+    out = BytesIO()
+    # الشفافية تحتاج PNG، وما عداها JPEG أصغر بكثير
+    if image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info):
+        image.save(out, format="PNG", optimize=True)
+        return out.getvalue(), ".png"
+    image.convert("RGB").save(out, format="JPEG", quality=80, optimize=True, progressive=True)
+    return out.getvalue(), ".jpg"
+
+# ---------------- Size-Bounded Disk Cache (LRU) ----------------
+class DiskImageCache:
+    def __init__(self, directory=IMAGE_CACHE_DIR, max_bytes=IMAGE_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # name -> size، الأقدم استخدامًا أولاً
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        os.makedirs(directory, exist_ok=True)
+        # ترتيب الاستخدام بعد إعادة التشغيل يُستعاد من mtime (يُحدَّث عند كل قراءة)
+        files = []
+        for name in os.listdir(directory):
+            if os.path.splitext(name)[1] in CONTENT_TYPES:
+                stat = os.stat(os.path.join(directory, name))
+                files.append((stat.st_mtime, name, stat.st_size))
+        for _, name, size in sorted(files):
+            self._entries[name] = size
+            self._bytes += size
+        with self._lock:
+            self._evict()
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def get(self, key):
+        with self._lock:
+            for ext in CONTENT_TYPES:
+                name = key + ext
+                if name in self._entries:
+                    self._entries.move_to_end(name)
+                    break
+            else:
+                self.misses += 1
+                return None
+        try:
+            with open(self._path(name), "rb") as f:
+                data = f.read()
+            os.utime(self._path(name))
+        except FileNotFoundError:
+            with self._lock:
+                self._bytes -= self._entries.pop(name, 0)
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return data, ext
+
+    def set(self, key, data, ext):
+        name = key + ext
+        tmp_path = self._path(name + ".tmp")
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, self._path(name))
+        with self._lock:
+            self._bytes -= self._entries.pop(name, 0)
+            self._entries[name] = len(data)
+            self._bytes += len(data)
+            self._evict()
+
+    def _evict(self):
+        while self._bytes > self.max_bytes and self._entries:
+            name, size = self._entries.popitem(last=False)
+            self._bytes -= size
+            self.evictions += 1
+            try:
+                os.remove(self._path(name))
+            except FileNotFoundError:
+                pass
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+# ---------------- Image Proxy ----------------
+class ImageProxy:
+    def __init__(self, client, cache, size=IMAGE_PROXY_SIZE, max_source_bytes=IMAGE_MAX_SOURCE_BYTES,
+                 allow_private=False, max_redirects=IMAGE_MAX_REDIRECTS, resolve=resolve_host):
+        self.client = client
+        self.max_redirects = max_redirects
+        self.resolve = resolve
+        self.cache = cache
+        self.size = size
+        self.max_source_bytes = max_source_bytes
+        self.allow_private = allow_private
+        self.flights = SingleFlight()
+
+    def cache_key(self, url):
+        return hashlib.sha256(f"{self.size}|{url}".encode("utf-8")).hexdigest()
+
+    def _check_url(self, url):
+        if not is_allowed_url(url, self.allow_private, self.resolve):
+            raise ImageProxyError(400, "Only public http(s) image URLs are allowed")
+
+    # التحويلات تُتبع يدويًا حتى يُفحص كل رابط قبل طلبه؛ تفاصيل رد الخادم لا تُعاد للعميل
+    def fetch(self, url):
+        for _ in range(self.max_redirects + 1):
+            response = self.client.get(url, stream=True, allow_redirects=False)
+            if response.status_code not in REDIRECT_STATUSES:
+                break
+            location = response.headers.get("Location")
+            response.close()
+            if not location:
+                raise ImageProxyError(502, "Image upstream error")
+            url = urljoin(url, location)
+            self._check_url(url)
+        else:
+            raise ImageProxyError(502, "Too many image redirects")
+        try:
+            if response.status_code != 200:
+                print(f"Image upstream returned {response.status_code} for {url}")
+                raise ImageProxyError(502, "Image upstream error")
+            chunks, total = [], 0
+            for chunk in response.iter_content(64 * 1024):
+                total += len(chunk)
+                if total > self.max_source_bytes:
+                    raise ImageProxyError(502, "Image too large")
+                chunks.append(chunk)
+            return b"".join(chunks)
+        finally:
+            response.close()
+
+    # يعيد (bytes, content_type, etag)؛ كل صورة تُجلب وتُصغَّر مرة واحدة فقط
+    def get(self, url):
+        self._check_url(url)
+
+        key = self.cache_key(url)
+        cached = self.cache.get(key)
+        if cached is None:
+            def load():
+                data, ext = make_thumbnail(self.fetch(url), self.size)
+                self.cache.set(key, data, ext)
+                return data, ext
+            try:
+                cached, _ = self.flights.do(key, load)
+            except (RuntimeError, OSError) as e:
+                print(f"Error fetching image {url}: {e}")
+                raise ImageProxyError(502, "Image upstream error")
+
+        data, ext = cached
+        etag = '"' + hashlib.sha256(data).hexdigest()[:32] + '"'
+        return data, CONTENT_TYPES[ext], etag
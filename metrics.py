@@ -0,0 +1,207 @@
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+# ---------------- Prometheus-Style Metrics ----------------
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+def _format_labels(labelnames, values, extra=None):
+    pairs = list(zip(labelnames, values)) + (extra or [])
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(n, "")) for n in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(tuple(str(labels.get(n, "")) for n in self.labelnames), 0)
+
+    def render(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, k)} {_format_value(v)}" for k, v in items]
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(n, "")) for n in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series["buckets"][i] += 1
+            series["sum"] += value
+            series["count"] += 1
+
+    def count(self, **labels):
+        series = self._series.get(tuple(str(labels.get(n, "")) for n in self.labelnames))
+        return series["count"] if series else 0
+
+    def render(self):
+        lines = []
+        with self._lock:
+            items = sorted((k, dict(v, buckets=list(v["buckets"]))) for k, v in self._series.items())
+        for key, series in items:
+            for bound, count in zip(self.buckets, series["buckets"]):
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, [('le', repr(bound))])} {count}")
+            lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, [('le', '+Inf')])} {series['count']}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {repr(series['sum'])}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {series['count']}")
+        return lines
+
+class Gauge:
+    kind = "gauge"
+
+    # القيم تُحسب عند العرض من دالة تعيد {(label values...): value}
+    def __init__(self, name, help_text, labelnames, collect):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.collect = collect
+
+    def render(self):
+        return [f"{self.name}{_format_labels(self.labelnames, k)} {_format_value(v)}"
+                for k, v in sorted(self.collect().items())]
+
+class Registry:
+    def __init__(self):
+        self._metrics = OrderedDict()
+
+    def _register(self, metric):
+        return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name, help_text, labelnames=()):
+        return self._register(Counter(name, help_text, labelnames))
+
+    def histogram(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, help_text, labelnames, buckets))
+
+    def gauge(self, name, help_text, labelnames, collect):
+        return self._register(Gauge(name, help_text, labelnames, collect))
+
+    def render(self):
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    "search_stage_duration_seconds", "Duration of each /search pipeline stage.", ["stage", "status", "lang"]
+)
+SEARCH_REQUESTS = REGISTRY.counter(
+    "search_requests_total", "Search requests by endpoint, outcome and language.", ["endpoint", "status", "lang"]
+)
+SEARCH_COALESCED = REGISTRY.counter(
+    "search_coalesced_total", "Searches that waited on an identical in-flight search.", ["endpoint", "lang"]
+)
+FAST_MODE_RESULTS = REGISTRY.counter(
+    "search_fast_mode_total", "Fast-mode searches by outcome (ok or fallback to the multi-call path).", ["outcome"]
+)
+CATALOG_LOOKUPS = REGISTRY.counter(
+    "catalog_lookups_total", "Local catalog lookups before SerpAPI (hit = answered locally).", ["result"]
+)
+UPSTREAM_SECONDS = REGISTRY.histogram(
+    "upstream_request_duration_seconds", "Upstream call duration including retries.", ["upstream", "status"]
+)
+UPSTREAM_REQUESTS = REGISTRY.counter(
+    "upstream_requests_total", "Upstream calls by final status.", ["upstream", "status"]
+)
+
+# ---------------- Per-Request Stage Timings ----------------
+class RequestTimings:
+    def __init__(self, lang="en"):
+        self.lang = lang
+        self.stages = OrderedDict()
+        self.started = time.perf_counter()
+        self._lock = threading.Lock()
+
+    # الزمن منذ بداية الطلب، لمن يحتاج "total" قبل أن تنتهي مرحلته (حفظ الجلسة)
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def record(self, name, seconds, status="ok"):
+        STAGE_SECONDS.observe(seconds, stage=name, status=status, lang=self.lang)
+        with self._lock:
+            self.stages.setdefault(name, []).append(seconds)
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        status = "ok"
+        try:
+            yield
+        except Exception:
+            status = "error"
+            raise
+        finally:
+            self.record(name, time.perf_counter() - start, status)
+
+    def snapshot(self):
+        with self._lock:
+            return {name: list(values) for name, values in self.stages.items()}
+
+    # مراحل نفّذها طلب آخر نيابةً عن هذا الطلب (single-flight): تُضاف للعرض والحفظ فقط،
+    # فالـ histogram سجّلها مرة واحدة عند تنفيذها
+    def merge(self, stages):
+        with self._lock:
+            for name, values in stages.items():
+                self.stages.setdefault(name, []).extend(values)
+
+    # المراحل المتوازية (عدة عناصر) تُعرض بأطولها لأنه يحدد زمن الطلب
+    def as_dict(self):
+        with self._lock:
+            return {name: round(max(values) * 1000, 2) for name, values in self.stages.items()}
+
+    def server_timing(self):
+        with self._lock:
+            parts = []
+            for name, values in self.stages.items():
+                entry = f"{name};dur={max(values) * 1000:.2f}"
+                if len(values) > 1:
+                    entry += f';desc="max of {len(values)}"'
+                parts.append(entry)
+        return ", ".join(parts)
+
+def parse_server_timing(header):
+    timings = {}
+    for entry in (header or "").split(","):
+        fields = [f.strip() for f in entry.split(";")]
+        if not fields[0]:
+            continue
+        for field in fields[1:]:
+            if field.startswith("dur="):
+                timings[fields[0]] = float(field[len("dur="):])
+    return timings
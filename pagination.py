@@ -0,0 +1,63 @@
+import os
+import json
+import base64
+
+# ---------------- Cursor Pagination ----------------
+# /search يعيد الصفحة الأولى فقط (SEARCH_PAGE_SIZE لكل عنصر) مع cursor لكل عنصر،
+# و/products?cursor= يكمل من نتائج SerpAPI المحفوظة، ويجلب الصفحة التالية (start) فقط عند الحاجة.
+# الـ cursor بلا حالة على الخادم: {q: نص الجلب، m: العنصر، s: start صفحة SerpAPI، k: عدد المطابقات المعروضة منها}
+SEARCH_PAGE_SIZE = int(os.getenv("SEARCH_PAGE_SIZE", "5"))
+PRODUCTS_PAGE_SIZE = int(os.getenv("PRODUCTS_PAGE_SIZE", "10"))
+PRODUCTS_MAX_SERP_PAGES = int(os.getenv("PRODUCTS_MAX_SERP_PAGES", "2"))  # صفحات SerpAPI لكل طلب /products
+
+class CursorError(ValueError):
+    pass
+
+def encode_cursor(query, item, start=0, skip=0):
+    payload = json.dumps({"q": query, "m": item, "s": start, "k": skip}, ensure_ascii=False, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        state = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")).decode("utf-8"))
+    except (ValueError, UnicodeError) as e:
+        raise CursorError(f"Invalid cursor: {e}")
+    if not (
+        isinstance(state, dict)
+        and isinstance(state.get("q"), str) and state["q"].strip()
+        and isinstance(state.get("m"), str)
+        and all(isinstance(state.get(k), int) and not isinstance(state.get(k), bool) and state[k] >= 0 for k in "sk")
+    ):
+        raise CursorError("Invalid cursor")
+    return state
+
+# الصفحة الأولى من /search عرضت أول SEARCH_PAGE_SIZE مطابقة من صفحة SerpAPI الأولى،
+# إلا إذا جاءت من الكتالوج المحلي (from_serpapi(fetch_query) = False): عندها لم يُعرض شيء منها فنبدأ من 0
+def first_page_cursors(plan, products_by_item, page_size=SEARCH_PAGE_SIZE, from_serpapi=None):
+    cursors = {}
+    for fetch in plan.get("fetches", []):
+        skip = page_size if from_serpapi is None or from_serpapi(fetch["query"]) else 0
+        for item in fetch["items"]:
+            products = products_by_item.get(item) or []
+            failed = products and "error" in products[0]
+            cursors[item] = None if failed else encode_cursor(fetch["query"], item, 0, skip)
+    return cursors
+
+# load_page(start) -> نتائج SerpAPI الخام لتلك الصفحة؛ match(results) -> المطابقات بالترتيب
+# يعيد (products, next_cursor)؛ next_cursor = None عندما تعيد SerpAPI صفحة فارغة
+def next_page(state, page_size, load_page, match, max_serp_pages=PRODUCTS_MAX_SERP_PAGES):
+    start, skip = state["s"], state["k"]
+    products = []
+    for _ in range(max(1, max_serp_pages)):
+        results = load_page(start)
+        matches = match(results)
+        taken = matches[skip:skip + page_size - len(products)]
+        products.extend(taken)
+        skip += len(taken)
+        if len(products) >= page_size:
+            return products, encode_cursor(state["q"], state["m"], start, skip)
+        if not results:
+            return products, None
+        start, skip = start + len(results), 0
+    return products, encode_cursor(state["q"], state["m"], start, skip)
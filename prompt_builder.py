@@ -0,0 +1,88 @@
+import os
+import math
+
+from textnorm import normalize_text
+
+# ---------------- Token Budgets ----------------
+# ميزانية المدخلات (الرسائل كاملة) والمخرجات (max_tokens) لكل نوع من الاستدعاءات
+PROMPT_INPUT_TOKENS = int(os.getenv("PROMPT_INPUT_TOKENS", "3000"))
+REPLY_MAX_TOKENS = int(os.getenv("REPLY_MAX_TOKENS", "1024"))
+FILTER_MAX_TOKENS = int(os.getenv("FILTER_MAX_TOKENS", "1024"))
+EVAL_MAX_TOKENS = int(os.getenv("EVAL_MAX_TOKENS", "256"))
+PROMPT_TITLE_MAX_CHARS = int(os.getenv("PROMPT_TITLE_MAX_CHARS", "90"))
+PROMPT_DEDUPE_THRESHOLD = float(os.getenv("PROMPT_DEDUPE_THRESHOLD", "0.85"))
+
+MESSAGE_OVERHEAD_TOKENS = 4
+# يوضع مكان السياق في القالب، ثم يُستبدل بسياق بحجم ما تبقى من الميزانية
+CONTEXT_SLOT = "\x00context\x00"
+
+# ---------------- Token Estimation ----------------
+# تقدير بدون tokenizer: الإنجليزية ~4 أحرف لكل token، والعربية ~2
+def estimate_tokens(text):
+    if not text:
+        return 0
+    ascii_chars = sum(1 for c in text if ord(c) < 128)
+    return math.ceil(ascii_chars / 4 + (len(text) - ascii_chars) / 2)
+
+def estimate_messages_tokens(messages):
+    return sum(estimate_tokens(m.get("content")) + MESSAGE_OVERHEAD_TOKENS for m in messages)
+
+# ---------------- Product Lines ----------------
+def truncate_title(title, max_chars=PROMPT_TITLE_MAX_CHARS):
+    title = " ".join(str(title or "").split())
+    if len(title) <= max_chars:
+        return title
+    cut = title[:max_chars].rsplit(" ", 1)[0] or title[:max_chars]
+    return cut + "…"
+
+def _title_tokens(product):
+    return set(normalize_text(product.get("title")).split())
+
+# العناوين المتقاربة جدًا (نفس المنتج من متجر آخر أو بلون مختلف) تُرسل مرة واحدة؛ يبقى الأول (الأعلى ترتيبًا)
+def dedupe_products(products, threshold=PROMPT_DEDUPE_THRESHOLD):
+    kept, kept_tokens = [], []
+    for p in products:
+        tokens = _title_tokens(p)
+        duplicate = tokens and any(
+            len(tokens & other) / len(tokens | other) >= threshold for other in kept_tokens if other
+        )
+        if not duplicate:
+            kept.append(p)
+            kept_tokens.append(tokens)
+    return kept
+
+def product_line(p, prefix="- ", title_max_chars=PROMPT_TITLE_MAX_CHARS):
+    return f"{prefix}{truncate_title(p.get('title'), title_max_chars)} | {p.get('price')} | {p.get('source')}\n"
+
+def build_context(products, budget_tokens, numbered=False, dedupe=True):
+    if dedupe:
+        products = dedupe_products(products)
+    text, used = "", 0
+    for idx, p in enumerate(products, 1):
+        line = product_line(p, prefix=f"{idx}. " if numbered else "- ")
+        cost = estimate_tokens(line)
+        if used + cost > budget_tokens:
+            break
+        text += line
+        used += cost
+    return text
+
+# الميزانية تُقسم بالتساوي بين العناصر حتى لا يستهلك عنصر واحد كل السياق
+def build_grouped_context(products_by_item, budget_tokens, header):
+    if not products_by_item:
+        return ""
+    text = ""
+    per_item = budget_tokens // len(products_by_item)
+    for name, products in products_by_item.items():
+        item_header = header.format(name=name)
+        text += item_header + build_context(products, max(0, per_item - estimate_tokens(item_header)))
+    return text
+
+# ما يتبقى من ميزانية المدخلات بعد النص الثابت للرسائل (بدون السياق)
+def context_budget(fixed_messages, input_budget=PROMPT_INPUT_TOKENS):
+    return max(0, input_budget - estimate_messages_tokens(fixed_messages))
+
+# render(budget) يبني نص السياق ضمن الميزانية المتبقية
+def fill_context(system_prompt, prompt, render, input_budget=PROMPT_INPUT_TOKENS):
+    fixed = [{"role": "system", "content": system_prompt}, {"role": "user", "content": prompt.replace(CONTEXT_SLOT, "")}]
+    return prompt.replace(CONTEXT_SLOT, render(context_budget(fixed, input_budget)))
@@ -0,0 +1,120 @@
+import re
+
+from textnorm import normalize_text
+
+# ---------------- Query Planner ----------------
+# يقسم سؤال المقارنة إلى عناصر على حدود الكلمات فقط (لا "sandals" ولا "android")،
+# ويحذف العناصر المكررة، ويجعل العناصر المتداخلة تتشارك نتيجة SerpAPI واحدة
+COMPARE_PHRASES = [
+    "what is the difference between", "difference between", "comparison between", "comparison of",
+    "compare between", "compare", "comparison", "between",
+    "ما الفرق بين", "الفرق بين", "مقارنة بين", "قارن بين", "قارن", "مقارنة", "بين",
+]
+
+# "or" والفاصلة و"+" ليست فواصل: "black or white" و"Galaxy S24+" و"laptop, 16gb" عنصر واحد
+SEPARATORS_RE = re.compile(r"\s+(?:and|vs\.?|versus|&|و|مقابل|ضد)\s+", re.IGNORECASE)
+# "و" الملتصقة ("ايفون 15 وسامسونج") تُفصل في أسئلة المقارنة فقط عندما يبدو الطرفان عنصرين:
+# ما بعدها علامة تجارية معروفة، أو اسم تكرر قبلها ("سماعات وايرلس وسماعات سلكية")، أو في الطرفين
+# رقم موديل أو كلمة لاتينية. غير ذلك لا تُفصل، فتبقى "وايرلس" و"واط" كلمات كاملة
+ATTACHED_WAW_RE = re.compile(r"\u0648([\u0621-\u064A]{2,})")
+MODEL_TOKEN_RE = re.compile(r"[0-9a-z]", re.IGNORECASE)
+KNOWN_ITEM_WORDS = frozenset(normalize_text(word) for word in (
+    "ايفون", "ايباد", "ماك", "ماكبوك", "ابل", "ايربودز", "سامسونج", "جالكسي", "جلاكسي", "هواوي", "هونر", "شاومي",
+    "ريدمي", "اوبو", "ريلمي", "فيفو", "نوكيا", "سوني", "بلايستيشن", "نينتندو", "جوجل", "قوقل", "بيكسل", "لينوفو",
+    "ديل", "ايسر", "ايسوس", "مايكروسوفت", "سيرفس", "كانون", "نيكون", "فيليبس", "بوز", "انكر", "باناسونيك",
+))
+
+COMPARE_PATTERNS = [
+    re.compile(r"(?<![\w\u0600-\u06FF])" + re.escape(phrase) + r"(?![\w\u0600-\u06FF])", re.IGNORECASE)
+    for phrase in COMPARE_PHRASES
+]
+
+def _strip_compare_phrases(query):
+    text = f" {query.strip()} "
+    for pattern in COMPARE_PATTERNS:
+        text, count = pattern.subn(" ", text)
+        if count:
+            return " ".join(text.split()), True
+    return " ".join(text.split()), False
+
+def _starts_item(word, seen, current, rest):
+    name = normalize_text(word)
+    if name in KNOWN_ITEM_WORDS or name in seen:
+        return True
+    return any(MODEL_TOKEN_RE.search(w) for w in current) and any(MODEL_TOKEN_RE.search(w) for w in rest)
+
+# seen: الكلمات الموحدة في العناصر السابقة من نفس السؤال
+def _split_attached_waw(part, seen):
+    words = part.split()
+    pieces, current = [], []
+    for i, word in enumerate(words):
+        match = ATTACHED_WAW_RE.fullmatch(word)
+        if match and current:
+            rest = [match.group(1)]
+            for w in words[i + 1:]:
+                if ATTACHED_WAW_RE.fullmatch(w):
+                    break
+                rest.append(w)
+            if _starts_item(match.group(1), seen | {normalize_text(w) for w in current}, current, rest):
+                pieces.append(" ".join(current))
+                seen = seen | {normalize_text(w) for w in current}
+                current = [match.group(1)]
+                continue
+        current.append(word)
+    pieces.append(" ".join(current))
+    return pieces
+
+def split_items(query):
+    text, is_comparison = _strip_compare_phrases(query)
+    parts = [p.strip(" ?؟.!") for p in SEPARATORS_RE.split(f" {text} ")]
+    if is_comparison:
+        split, seen = [], frozenset()
+        for part in parts:
+            split.extend(_split_attached_waw(part, seen))
+            seen = seen | {normalize_text(w) for w in part.split()}
+        parts = [p.strip(" ?؟.!") for p in split]
+    return [p for p in parts if p] or [query.strip()]
+
+# "+" يُكتب ككلمة "plus" حتى يتطابق "Galaxy S24+" و"Galaxy S24 Plus" (نفس المنتج)،
+# ويبقى كلاهما مختلفًا عن "Galaxy S24"
+PLUS_RE = re.compile(r"\+")
+
+def item_key(item):
+    return normalize_text(PLUS_RE.sub(" plus ", item))
+
+def _tokens(item):
+    return frozenset(item_key(item).split())
+
+def plan_query(query):
+    # 1) عناصر فريدة حسب النص الموحد (أول صيغة كتبها المستخدم تبقى)
+    items, seen = [], set()
+    for item in split_items(query):
+        key = item_key(item)
+        if key and key not in seen:
+            seen.add(key)
+            items.append(item)
+    if not items:
+        items = [query.strip()]
+
+    # 2) العنصر الذي كلماته جزء من كلمات عنصر آخر ("iphone 15" ⊂ "iphone 15 pro")
+    #    نتيجته تكفي للاثنين: جلب واحد للأعم، وكل عنصر يُصفّى على حدة
+    tokens = {item: _tokens(item) for item in items}
+    fetch_for = {}
+    for item in items:
+        broader = [
+            other for other in items
+            if other != item and tokens[other] and tokens[other] < tokens[item]
+        ]
+        fetch_for[item] = min(broader, key=lambda o: (len(tokens[o]), items.index(o))) if broader else item
+
+    fetches = {}
+    for item in items:
+        root = fetch_for[item]
+        while fetch_for[root] != root:
+            root = fetch_for[root]
+        fetches.setdefault(root, []).append(item)
+
+    return {
+        "items": items,
+        "fetches": [{"query": fetch_query, "items": group} for fetch_query, group in fetches.items()],
+    }
@@ -0,0 +1,86 @@
+import math
+import re
+import statistics
+
+# توحيد النص (العربية + الإنجليزية) في textnorm.py
+from textnorm import normalize_text, tokenize, ARABIC_TRANSLATION
+
+# ---------------- Product Features ----------------
+PRICE_NUMBER = re.compile(r"\d+(?:\.\d+)?")
+
+def parse_price(price):
+    if isinstance(price, (int, float)):
+        return float(price)
+    if not price:
+        return None
+    text = str(price).translate(ARABIC_TRANSLATION).replace(",", "").replace("٬", "")
+    match = PRICE_NUMBER.search(text)
+    return float(match.group()) if match else None
+
+def price_feature(price, median_price):
+    if price is None:
+        return 0.0
+    # أرخص بكثير من الوسيط = غالبًا إكسسوار (جراب، شاحن...) وليس المنتج نفسه
+    if median_price and price < 0.25 * median_price:
+        return 0.0
+    return 1.0
+
+def source_feature(source):
+    return 0.0 if not source or source == "N/A" else 1.0
+
+# ---------------- BM25 Relevance Ranking ----------------
+KEEP_THRESHOLD = 0.6
+DROP_THRESHOLD = 0.3
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+def bm25_scores(query_tokens, docs_tokens):
+    n_docs = len(docs_tokens)
+    avg_len = sum(len(d) for d in docs_tokens) / n_docs or 1.0
+    idf = {}
+    for term in set(query_tokens):
+        df = sum(1 for d in docs_tokens if term in d)
+        idf[term] = math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+
+    scores = []
+    for doc in docs_tokens:
+        score = 0.0
+        for term in set(query_tokens):
+            tf = doc.count(term)
+            if tf:
+                norm = tf + BM25_K1 * (1 - BM25_B + BM25_B * len(doc) / avg_len)
+                score += idf[term] * tf * (BM25_K1 + 1) / norm
+        scores.append(score)
+    return scores
+
+def rank_products(query, products):
+    query_tokens = tokenize(query)
+    if not products or not query_tokens:
+        return {"kept": list(products), "ambiguous": [], "dropped": [], "scored": []}
+
+    docs_tokens = [tokenize(p.get("title")) for p in products]
+    bm25 = bm25_scores(query_tokens, docs_tokens)
+    max_bm25 = max(bm25) or 1.0
+    prices = [parse_price(p.get("price")) for p in products]
+    known_prices = [x for x in prices if x is not None]
+    median_price = statistics.median(known_prices) if known_prices else None
+
+    scored = []
+    for product, doc, text_score, price in zip(products, docs_tokens, bm25, prices):
+        doc_terms = set(doc)
+        coverage = sum(1 for t in query_tokens if t in doc_terms) / len(query_tokens)
+        score = (
+            0.7 * coverage
+            + 0.15 * text_score / max_bm25
+            + 0.1 * price_feature(price, median_price)
+            + 0.05 * source_feature(product.get("source"))
+        )
+        scored.append((round(score, 4), product))
+
+    scored.sort(key=lambda pair: pair[0], reverse=True)
+    return {
+        "kept": [p for s, p in scored if s >= KEEP_THRESHOLD],
+        "ambiguous": [p for s, p in scored if DROP_THRESHOLD <= s < KEEP_THRESHOLD],
+        "dropped": [p for s, p in scored if s < DROP_THRESHOLD],
+        "scored": scored,
+    }
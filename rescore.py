@@ -0,0 +1,134 @@
+import argparse
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from session_store import SessionStore
+
+# ---------------- Rate Limiter ----------------
+class RateLimiter:
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate and rate > 0 else 0
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            wait = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if wait > 0:
+            time.sleep(wait)
+
+# ---------------- Checkpoint ----------------
+def load_checkpoint(path):
+    if not path or not os.path.exists(path):
+        return 0
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f).get("last_id", 0)
+
+def save_checkpoint(path, last_id, processed):
+    if not path:
+        return
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"last_id": last_id, "processed": processed, "updated_at": time.time()}, f)
+    os.replace(tmp_path, path)
+
+# ---------------- Batch Re-Scoring ----------------
+# الجلسات تُقرأ على دفعات من سجل الجلسات، وعدد الطلبات الجارية محدود بنافذة صغيرة،
+# والنتائج تُكتب بترتيب id حتى يكون آخر id مكتوب نقطة استئناف صحيحة.
+# evaluate_fn يجب أن يرفع استثناء عند الفشل: الجلسة الفاشلة لا يُكتب تقييمها في سجل الجلسات، ونقطة الاستئناف
+# تتوقف قبلها حتى تُعاد في التشغيل التالي.
+def rescore_sessions(store, evaluate_fn, output_path, checkpoint_path=None, concurrency=4,
+                     rate=1.0, write_back=False, limit=None, batch_size=500):
+    last_id = load_checkpoint(checkpoint_path)
+    failed_at = None  # أول id فشل في هذا التشغيل
+    limiter = RateLimiter(rate)
+    window = OrderedDict()
+    summary = {"start_id": last_id, "processed": 0, "failed": 0}
+
+    def score(session):
+        limiter.acquire()
+        return evaluate_fn(session["query"], session.get("products") or [], session.get("ai_reply") or "")
+
+    def write_head(out):
+        nonlocal last_id, failed_at
+        row_id, (session, future) = window.popitem(last=False)
+        record = {
+            "id": row_id,
+            "session_id": session.get("session_id"),
+            "query": session["query"],
+            "previous_score": session.get("evaluation_score"),
+        }
+        try:
+            record["evaluation_score"] = future.result()
+            if write_back:
+                store.update_evaluation_by_id(row_id, record["evaluation_score"])
+        except Exception as e:
+            record["error"] = str(e)
+            summary["failed"] += 1
+            if failed_at is None:
+                failed_at = row_id
+
+        out.write(json.dumps(record, ensure_ascii=False) + "\n")
+        out.flush()
+        summary["processed"] += 1
+        if failed_at is None:
+            last_id = row_id
+            save_checkpoint(checkpoint_path, last_id, summary["processed"])
+
+    with open(output_path, "a", encoding="utf-8") as out, \
+         ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for session in store.iter_sessions(after_id=last_id, batch_size=batch_size):
+            if limit is not None and summary["processed"] + len(window) >= limit:
+                break
+            window[session["id"]] = (session, pool.submit(score, session))
+            while len(window) >= concurrency * 2:
+                write_head(out)
+        while window:
+            write_head(out)
+
+    summary["last_id"] = last_id
+    return summary
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Re-run evaluate_accuracy_llm over logged sessions")
+    parser.add_argument("--db", default=os.getenv("SESSION_DB", "data_shopping.db"))
+    parser.add_argument("--output", default="rescore_results.jsonl")
+    parser.add_argument("--checkpoint", default="rescore.checkpoint.json")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--rate", type=float, default=1.0, help="max LLM calls per second (0 = unlimited)")
+    parser.add_argument("--limit", type=int, default=None)
+    parser.add_argument("--write-back", action="store_true", help="update evaluation_score in the session store")
+    parser.add_argument("--restart", action="store_true", help="ignore the checkpoint and start from the first session")
+    args = parser.parse_args(argv)
+
+    if args.restart and os.path.exists(args.checkpoint):
+        os.remove(args.checkpoint)
+
+    from app import evaluate_accuracy_llm
+
+    summary = rescore_sessions(
+        SessionStore(args.db),
+        # بدون كاش الردود (وإلا يُعاد التقييم القديم نفسه) وبدون درجة الحد الأدنى عند الفشل
+        lambda query, context, answer: evaluate_accuracy_llm(query, context, answer, strict=True, fresh=True),
+        args.output,
+        checkpoint_path=args.checkpoint,
+        concurrency=args.concurrency,
+        rate=args.rate,
+        write_back=args.write_back,
+        limit=args.limit,
+    )
+    print(f"Rescored {summary['processed']} sessions ({summary['failed']} failed), "
+          f"ids {summary['start_id'] + 1}..{summary['last_id']} -> {args.output}")
+    if summary["failed"]:
+        print(f"Checkpoint kept at id {summary['last_id']}; run again to retry the failed sessions")
+
+if __name__ == "__main__":
+    main()
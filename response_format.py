@@ -0,0 +1,97 @@
+import os
+import gzip
+import json
+
+# orjson و brotli اختياريان: بدونهما json القياسي و gzip
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# ---------------- Compact /search Responses ----------------
+# ?compact=true: المنتجات مرة واحدة (products_by_item فقط) بدون الحقول الفارغة،
+# وبدون evaluation_score والتوقيتات (متاحة في GET /evaluation/{session_id} وترويسة Server-Timing).
+# ?fields= يختار الحقول: "ai_reply,products_by_item.title,products_by_item.price"
+RESPONSE_COMPRESS_MIN_BYTES = int(os.getenv("RESPONSE_COMPRESS_MIN_BYTES", "1024"))
+RESPONSE_GZIP_LEVEL = int(os.getenv("RESPONSE_GZIP_LEVEL", "5"))
+RESPONSE_BROTLI_QUALITY = int(os.getenv("RESPONSE_BROTLI_QUALITY", "4"))
+
+COMPACT_FIELDS = ("session_id", "query", "ai_reply", "products_by_item", "cursors", "mode", "follow_up")
+RESPONSE_FIELDS = COMPACT_FIELDS + (
+    "products", "evaluation_score", "evaluation_status", "timings", "coalesced", "plan",
+)
+PRODUCT_LISTS = ("products", "products_by_item")
+
+class FieldSelectionError(ValueError):
+    pass
+
+def _compact_product(product):
+    return {k: v for k, v in product.items() if v is not None}
+
+def compact_session(data):
+    compact = {k: data[k] for k in COMPACT_FIELDS if k in data}
+    if "products_by_item" in compact:
+        compact["products_by_item"] = {
+            item: [_compact_product(p) for p in plist] for item, plist in compact["products_by_item"].items()
+        }
+    return compact
+
+def parse_fields(fields):
+    top, product_fields = [], {}
+    for field in (f.strip() for f in fields.split(",")):
+        if not field:
+            continue
+        name, _, sub = field.partition(".")
+        if name not in RESPONSE_FIELDS:
+            raise FieldSelectionError(f"Unknown field: {name}")
+        if sub and name not in PRODUCT_LISTS:
+            raise FieldSelectionError(f"Only {', '.join(PRODUCT_LISTS)} have sub-fields: {field}")
+        if name not in top:
+            top.append(name)
+        if sub:
+            product_fields.setdefault(name, []).append(sub)
+    if not top:
+        raise FieldSelectionError("fields is empty")
+    return top, product_fields
+
+# رسالة الخطأ لعنصر فشل جلبه تبقى مهما كانت الحقول المطلوبة
+def _pick(product, keys):
+    return {k: product[k] for k in (*keys, "error") if k in product}
+
+# الحقول غير الموجودة في هذا الرد (مثل products في الوضع المختصر) تُهمل
+def select_fields(data, fields):
+    top, product_fields = parse_fields(fields)
+    selected = {name: data[name] for name in top if name in data}
+    for name, keys in product_fields.items():
+        value = selected.get(name)
+        if value is None:
+            continue
+        if isinstance(value, dict):
+            selected[name] = {item: [_pick(p, keys) for p in plist] for item, plist in value.items()}
+        else:
+            selected[name] = [_pick(p, keys) for p in value]
+    return selected
+
+# ---------------- Serialization + Compression ----------------
+def dumps(data):
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+def _accepts(accept_encoding, coding):
+    return any(part.split(";")[0].strip() == coding for part in (accept_encoding or "").lower().split(","))
+
+# يعيد (body, headers)؛ الضغط فقط فوق الحد لأن الردود الصغيرة لا تستفيد منه
+def encode_body(body, accept_encoding, min_bytes=RESPONSE_COMPRESS_MIN_BYTES):
+    headers = {"Vary": "Accept-Encoding"}
+    if len(body) < min_bytes:
+        return body, headers
+    if brotli is not None and _accepts(accept_encoding, "br"):
+        return brotli.compress(body, quality=RESPONSE_BROTLI_QUALITY), dict(headers, **{"Content-Encoding": "br"})
+    if _accepts(accept_encoding, "gzip"):
+        return gzip.compress(body, compresslevel=RESPONSE_GZIP_LEVEL), dict(headers, **{"Content-Encoding": "gzip"})
+    return body, headers
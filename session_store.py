@@ -0,0 +1,180 @@
+import argparse
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# ---------------- Session Store (SQLite WAL) ----------------
+# سجل واحد لكل سؤال (query): السؤال المكرر يستبدل السجل القديم مع الحفاظ على رقمه،
+# وhits يعدّ مرات تكراره (شعبية السؤال لـ cache_warmer.py).
+# last_asked_at يتغير فقط عند طرح السؤال (save)، بخلاف updated_at الذي يتغير أيضًا عند كتابة التقييم.
+# WAL + busy_timeout يسمحان بعدة كتّاب (عدة عمليات uvicorn) بدون إفساد البيانات.
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    session_id TEXT,
+    query TEXT NOT NULL UNIQUE,
+    data TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 1,
+    last_asked_at REAL
+);
+CREATE INDEX IF NOT EXISTS idx_sessions_session_id ON sessions (session_id);
+"""
+
+class SessionStore:
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=30000")
+            conn.executescript(SCHEMA)
+            # قواعد البيانات القديمة بدون عمود hits
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(sessions)")}
+            if "hits" not in columns:
+                with conn:
+                    conn.execute("ALTER TABLE sessions ADD COLUMN hits INTEGER NOT NULL DEFAULT 1")
+            # قبل last_asked_at: updated_at أفضل تقدير متاح لآخر مرة طُرح فيها السؤال
+            if "last_asked_at" not in columns:
+                with conn:
+                    conn.execute("ALTER TABLE sessions ADD COLUMN last_asked_at REAL")
+                    conn.execute("UPDATE sessions SET last_asked_at = updated_at")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_sessions_last_asked_at ON sessions (last_asked_at)")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _row_to_session(row):
+        data = json.loads(row[1])
+        data["id"] = row[0]
+        return data
+
+    def save(self, data):
+        now = time.time()
+        payload = json.dumps({k: v for k, v in data.items() if k != "id"}, ensure_ascii=False)
+        conn = self._conn()
+        with conn:
+            row = conn.execute(
+                "INSERT INTO sessions (session_id, query, data, created_at, updated_at, last_asked_at)"
+                " VALUES (?, ?, ?, ?, ?, ?)"
+                " ON CONFLICT (query) DO UPDATE SET"
+                " session_id = excluded.session_id, data = excluded.data, updated_at = excluded.updated_at,"
+                " last_asked_at = excluded.last_asked_at, hits = sessions.hits + 1"
+                " RETURNING id",
+                (data.get("session_id"), data["query"], payload, now, now, now),
+            ).fetchone()
+        data["id"] = row[0]
+        return row[0]
+
+    def _update_evaluation(self, where, params, scores):
+        conn = self._conn()
+        with conn:
+            cur = conn.execute(
+                "UPDATE sessions SET"
+                " data = json_set(data, '$.evaluation_score', json(?), '$.evaluation_status', 'done'),"
+                f" updated_at = ? WHERE {where}",
+                (json.dumps(scores, ensure_ascii=False), time.time(), *params),
+            )
+        return cur.rowcount
+
+    # الجلسة الواحدة قد تضم عدة أسئلة (محادثة)؛ query يحدد أيها قُيّم
+    def update_evaluation(self, session_id, scores, query=None):
+        if query is None:
+            return self._update_evaluation("session_id = ?", (session_id,), scores)
+        return self._update_evaluation("session_id = ? AND query = ?", (session_id, query), scores)
+
+    def update_evaluation_by_id(self, row_id, scores):
+        return self._update_evaluation("id = ?", (row_id,), scores)
+
+    def get_by_query(self, query):
+        row = self._conn().execute(
+            "SELECT id, data FROM sessions WHERE query = ?", (query,)
+        ).fetchone()
+        return self._row_to_session(row) if row else None
+
+    def get_by_session_id(self, session_id):
+        row = self._conn().execute(
+            "SELECT id, data FROM sessions WHERE session_id = ? ORDER BY updated_at DESC LIMIT 1",
+            (session_id,),
+        ).fetchone()
+        return self._row_to_session(row) if row else None
+
+    # قراءة على دفعات حسب id حتى لا يُحمَّل السجل كاملًا في الذاكرة
+    # with_times: يضيف created_at/updated_at/last_asked_at (للتحليلات حسب اليوم)
+    def iter_sessions(self, after_id=0, batch_size=500, with_times=False):
+        while True:
+            rows = self._conn().execute(
+                "SELECT id, data, created_at, updated_at, last_asked_at FROM sessions WHERE id > ? ORDER BY id LIMIT ?",
+                (after_id, batch_size),
+            ).fetchall()
+            if not rows:
+                return
+            for row in rows:
+                session = self._row_to_session(row)
+                if with_times:
+                    session["created_at"], session["updated_at"], session["last_asked_at"] = row[2], row[3], row[4]
+                yield session
+            after_id = rows[-1][0]
+
+    # الأسئلة الأكثر شعبية: hits × اضمحلال أسي حسب آخر مرة سُئلت (نصف العمر half_life ثانية)
+    def top_queries(self, limit=20, half_life=86400, window=7 * 86400, scan_limit=5000, now=None):
+        now = now or time.time()
+        rows = self._conn().execute(
+            "SELECT query, hits, last_asked_at FROM sessions WHERE last_asked_at >= ?"
+            " ORDER BY last_asked_at DESC LIMIT ?",
+            (now - window, scan_limit),
+        ).fetchall()
+        scored = [
+            {"query": query, "hits": hits, "last_asked_at": asked_at,
+             "score": hits * 0.5 ** (max(0.0, now - asked_at) / half_life)}
+            for query, hits, asked_at in rows
+        ]
+        scored.sort(key=lambda r: r["score"], reverse=True)
+        return scored[:limit]
+
+    def count(self):
+        return self._conn().execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+    def close(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+# ---------------- One-Shot Migration from data_shopping.json ----------------
+def migrate_json(json_path, store):
+    if not os.path.exists(json_path):
+        raise RuntimeError(f"File not found: {json_path}")
+
+    with open(json_path, "r", encoding="utf-8") as f:
+        all_data = json.load(f)
+
+    # نفس ترتيب الملف: السؤال المكرر لاحقًا يستبدل السابق كما في السلوك القديم
+    for entry in all_data:
+        store.save(dict(entry))
+    return len(all_data)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Shopping session store tools")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    migrate = sub.add_parser("migrate", help="import a legacy data_shopping.json file")
+    migrate.add_argument("json_path", nargs="?", default="data_shopping.json")
+    migrate.add_argument("--db", default=os.getenv("SESSION_DB", "data_shopping.db"))
+
+    args = parser.parse_args(argv)
+    if args.command == "migrate":
+        store = SessionStore(args.db)
+        migrated = migrate_json(args.json_path, store)
+        print(f"Migrated {migrated} entries from {args.json_path} -> {args.db} ({store.count()} sessions)")
+
+if __name__ == "__main__":
+    main()
@@ -1,24 +1,35 @@
-import os
 import requests
 import streamlit as st
 from dotenv import load_dotenv
 import json
 import uuid
-from langdetect import detect
+from urllib.parse import parse_qs, urlparse
+from chat_store import ChatStore
+# نفس اكتشاف اللغة في الخادم (textnorm.py): سريع وثابت ومحفوظ في الذاكرة
+from textnorm import detect_language
 
 # ---------------- Load Environment ----------------
 load_dotenv(r"C:\Users\SarahAlqahtani\Documents\SerpAPI_Research\.env")
 BACKEND_URL = "http://127.0.0.1:8000"
-ALL_CHATS_FILE = "all_chats_unified.json"
+ALL_CHATS_FILE = "all_chats_unified.jsonl"
+LEGACY_CHATS_FILE = "all_chats_unified.json"  # يُستورد مرة واحدة إذا لم يوجد ملف JSONL
 ALL_CHATS_FILE_TEST = None
 
 
-# ---------------- Load existing chats ----------------
-if os.path.exists(ALL_CHATS_FILE):
-    with open(ALL_CHATS_FILE, "r", encoding="utf-8") as f:
-        all_chats = json.load(f)
-else:
-    all_chats = []
+# ---------------- Cached Resources ----------------
+# Streamlit يعيد تنفيذ الملف مع كل تفاعل، لذلك الجلسة والسجل يُنشآن مرة واحدة لكل عملية
+@st.cache_resource
+def get_http_session():
+    return requests.Session()
+
+@st.cache_resource
+def get_chat_store(path, legacy_path=None):
+    return ChatStore(path, legacy_path=legacy_path)
+
+def chat_store():
+    if ALL_CHATS_FILE_TEST:
+        return get_chat_store(str(ALL_CHATS_FILE_TEST))
+    return get_chat_store(ALL_CHATS_FILE, LEGACY_CHATS_FILE)
 
 # ---------------- Streamlit Setup ----------------
 st.set_page_config(page_title="🛒 Shopping Chat Assistant", layout="wide")
@@ -56,14 +67,9 @@ st.title("🛒✨ مساعد التسوق الذكي - Chat & Discover")
 # ---------------- Initialize session ----------------
 if "messages" not in st.session_state:
     st.session_state.messages = []
-
-# ---------------- Detect language ----------------
-def detect_language(text):
-    try:
-        lang = detect(text)
-        return "ar" if lang.startswith("ar") else "en"
-    except:
-        return "en"
+# نفس session_id لكل أسئلة المحادثة حتى يجيب الخادم أسئلة المتابعة من المنتجات السابقة
+if "session_id" not in st.session_state:
+    st.session_state.session_id = str(uuid.uuid4())
 
 # ---------------- Display Chat ----------------
 def show_chat():
@@ -75,24 +81,54 @@ def show_chat():
 
 # ---------------- Save chat ----------------
 def save_chat_unified(data):
-    file_path = ALL_CHATS_FILE_TEST or ALL_CHATS_FILE
-    for entry in all_chats:
-        if entry["query"] == data["query"]:
-            existing_titles = {p["title"] for p in entry["products"]}
-            for p in data["products"]:
-                if p["title"] not in existing_titles:
-                    entry["products"].append(p)
-            entry["ai_reply"] = data["ai_reply"]
-            entry["evaluation_score"] = data["evaluation_score"]
-            break
-    else:
-        all_chats.append(data)
-    
-    with open(file_path,"w",encoding="utf-8") as f:
-        json.dump(all_chats,f,ensure_ascii=False, indent=2)
-
-    # with open(ALL_CHATS_FILE,"w",encoding="utf-8") as f:
-    #     json.dump(all_chats,f,ensure_ascii=False, indent=2)
+    return chat_store().save(data)
+
+# روابط /img?url=...&sig=... موقعة بسر الخادم وقد تتغير؛ السجل يحتفظ برابط الصورة الأصلي
+def original_image_url(image):
+    if image and image.startswith("/img?"):
+        return parse_qs(urlparse(image).query).get("url", [None])[0]
+    return image
+
+def chat_log_products(products):
+    return [dict(p, image=original_image_url(p.get("image"))) for p in products]
+
+# ---------------- Streaming (SSE) ----------------
+def iter_sse_events(response):
+    event, data_lines = "message", []
+    for raw_line in response.iter_lines():
+        line = raw_line.decode("utf-8") if isinstance(raw_line, bytes) else raw_line
+        if not line:
+            if data_lines:
+                yield event, json.loads("\n".join(data_lines))
+            event, data_lines = "message", []
+        elif line.startswith("event:"):
+            event = line[len("event:"):].strip()
+        elif line.startswith("data:"):
+            data_lines.append(line[len("data:"):].lstrip())
+    if data_lines:
+        yield event, json.loads("\n".join(data_lines))
+
+# ---------------- Display Products ----------------
+def show_products(products_by_item, user_lang, limit=9):
+    with st.expander("🛍️ منتجات مرتبطة بالسؤال" if user_lang=="ar" else "🛍️ Related Products"):
+        for item_name, products in products_by_item.items():
+            st.markdown(f"### 🔎 {'منتجات مرتبطة بـ:' if user_lang=='ar' else 'Products related to:'} {item_name}")
+            for p in products[:limit]:
+                link = p.get("link") or p.get("product_link") or "#"
+                image = p.get("image")
+                if image and image.startswith("/"):
+                    image = BACKEND_URL + image  # صورة مصغرة من بروكسي /img في الخادم
+                img_html = f"<img src='{image}' class='product-img'>" if image else ""
+                link_html = f"<a href='{link}' target='_blank' class='product-link'>{'رابط المنتج' if user_lang=='ar' else 'Product Link'}</a>"
+                st.markdown(f"""
+                <div class='product-card'>
+                    {img_html}<br>
+                    <b>{p.get('title')}</b><br>
+                    السعر: {p.get('price')}<br>
+                    المصدر: {p.get('source')}<br>
+                    {link_html}
+                </div>
+                """, unsafe_allow_html=True)
 
 # ---------------- User Input ----------------
 user_query = st.text_input("💬 اكتب سؤالك هنا", key="unique_user_query_key")
@@ -104,46 +140,60 @@ if st.button(send_button_text) and user_query:
     st.session_state.messages.append({"role":"user","content":user_query})
 
     try:
-        # ---------------- GET request with max_tokens=1000 ----------------
-        res = requests.get(f"{BACKEND_URL}/search", params={"query":user_query, "max_tokens":1000}, timeout=20)
+        # ---------------- Streaming request with max_tokens=1000 ----------------
+        res = get_http_session().get(
+            f"{BACKEND_URL}/search/stream",
+            params={"query":user_query, "max_tokens":1000, "session_id":st.session_state.session_id},
+            stream=True,
+            timeout=20,
+        )
         if res.status_code == 200:
-            data = res.json()
-            ai_reply = data.get("ai_reply", "لا توجد إجابة من AI" if user_lang=="ar" else "No AI reply available")
-            
-            # أضف الرد مباشرة
-            st.session_state.messages.append({"role":"ai","content":ai_reply})
             show_chat()
+            reply_placeholder = st.empty()
+
+            data = {}
+            ai_reply = ""
+            products_by_item = {}
+            cursors = {}
+            stream_error = None
+
+            # ---------------- Render the reply as tokens arrive ----------------
+            for event, payload in iter_sse_events(res):
+                if event == "products":
+                    products_by_item = payload.get("products_by_item", {})
+                    cursors = payload.get("cursors") or {}
+                elif event == "token":
+                    ai_reply += payload.get("text", "")
+                    reply_placeholder.markdown(f"<div class='ai-msg'>{ai_reply}▌</div>", unsafe_allow_html=True)
+                elif event == "done":
+                    data = payload
+                elif event == "error":
+                    stream_error = payload.get("error")
+
+            ai_reply = data.get("ai_reply") or ai_reply or ("لا توجد إجابة من AI" if user_lang=="ar" else "No AI reply available")
+            reply_placeholder.markdown(f"<div class='ai-msg'>{ai_reply}</div>", unsafe_allow_html=True)
+            st.session_state.messages.append({"role":"ai","content":ai_reply})
+
+            if stream_error:
+                st.error(f"⚠️ Error fetching data: {stream_error}")
 
             # ---------------- Hide evaluation from frontend ----------------
             eval_scores = data.get("evaluation_score", {})  # still saved in JSON
 
             # ---------------- Display products ----------------
-            products_by_item = data.get("products_by_item", {})
+            products_by_item = data.get("products_by_item", products_by_item)
             flat_products = [p for plist in products_by_item.values() for p in plist]
 
             if products_by_item:
-                with st.expander("🛍️ منتجات مرتبطة بالسؤال" if user_lang=="ar" else "🛍️ Related Products"):
-                    for item_name, products in products_by_item.items():
-                        st.markdown(f"### 🔎 {'منتجات مرتبطة بـ:' if user_lang=='ar' else 'Products related to:'} {item_name}")
-                        for p in products[:9]:
-                            link = p.get("link") or p.get("product_link") or "#"
-                            img_html = f"<img src='{p.get('image')}' class='product-img'>" if p.get('image') else ""
-                            link_html = f"<a href='{link}' target='_blank' class='product-link'>{'رابط المنتج' if user_lang=='ar' else 'Product Link'}</a>"
-                            st.markdown(f"""
-                            <div class='product-card'>
-                                {img_html}<br>
-                                <b>{p.get('title')}</b><br>
-                                السعر: {p.get('price')}<br>
-                                المصدر: {p.get('source')}<br>
-                                {link_html}
-                            </div>
-                            """, unsafe_allow_html=True)
+                show_products(products_by_item, user_lang)
+            # الصفحات التالية تُطلب من /products فقط عندما يضغط المستخدم "عرض المزيد"
+            st.session_state.more_products = {"lang": user_lang, "cursors": cursors, "products": {}}
 
             # ---------------- Save chat ----------------
             chat_entry = {
-                "session_id": data.get("session_id") or str(uuid.uuid4()),
+                "session_id": data.get("session_id") or st.session_state.session_id,
                 "query": user_query,
-                "products": flat_products,
+                "products": chat_log_products(flat_products),
                 "ai_reply": ai_reply,
                 "evaluation_score": eval_scores,
             }
@@ -154,3 +204,25 @@ if st.button(send_button_text) and user_query:
 
     except Exception as e:
         st.error(f"⚠️ Error fetching data: {e}")
+
+# ---------------- More Products (cursor pagination) ----------------
+def load_more_products(item):
+    more = st.session_state.more_products
+    res = get_http_session().get(f"{BACKEND_URL}/products", params={"cursor": more["cursors"][item]}, timeout=20)
+    if res.status_code != 200:
+        st.error(f"Server Error: {res.status_code} - {res.text}")
+        return
+    page = res.json()
+    more["products"].setdefault(item, []).extend(page.get("products", []))
+    more["cursors"][item] = page.get("next_cursor")
+
+more_products = st.session_state.get("more_products")
+if more_products:
+    more_lang = more_products["lang"]
+    for item, cursor in list(more_products["cursors"].items()):
+        if more_products["products"].get(item):
+            show_products({item: more_products["products"][item]}, more_lang, limit=None)
+        label = f"➕ عرض المزيد: {item}" if more_lang=="ar" else f"➕ More results: {item}"
+        if cursor and st.button(label, key=f"more_{item}"):
+            load_more_products(item)
+            st.rerun()
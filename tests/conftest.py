@@ -0,0 +1,22 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# app.py يفتح SESSION_DB عند الاستيراد: قاعدة مؤقتة بدل data_shopping.db في مجلد العمل
+os.environ["SESSION_DB"] = os.path.join(tempfile.mkdtemp(prefix="shopping-tests-"), "sessions.db")
+os.environ.setdefault("IMAGE_PROXY_SECRET", "test-secret")
+
+# كل اختبار يكتب جلساته في قاعدة خاصة به داخل tmp_path
+@pytest.fixture(autouse=True)
+def isolated_session_store(tmp_path, monkeypatch):
+    app_module = sys.modules.get("app")
+    if app_module is None:
+        yield None
+        return
+    from session_store import SessionStore
+    store = SessionStore(str(tmp_path / "sessions.db"))
+    monkeypatch.setattr(app_module, "session_store", store)
+    yield store
+    store.close()
@@ -0,0 +1,117 @@
+import io
+import json
+import numpy as np
+import pytest
+from analytics import JSONStreamError, LogAggregator, analyze, iter_json_records, main
+from session_store import SessionStore
+
+def sessions(n, query="iphone 15", language_query="ايفون ١٥"):
+    return [
+        {
+            "session_id": f"s{i}",
+            "query": query if i % 2 else language_query,
+            "ai_reply": "reply",
+            "evaluation_score": {"faithfulness": 10 + i, "relevance": 50, "completeness": 90, "total": 40 + i},
+            "timings": {"total": 100.0 * (i + 1)},
+        }
+        for i in range(n)
+    ]
+
+def test_json_array_parsed_across_tiny_chunks():
+    records = sessions(7) + [{"query": "x", "nested": {"list": [1, 2, {"a": "b, ]"}]}}]
+    text = json.dumps(records, ensure_ascii=False, indent=2)
+    assert list(iter_json_records(io.StringIO(text), read_size=3)) == records
+
+def test_jsonl_and_bare_numbers_across_chunks():
+    text = "\n".join(json.dumps(r, ensure_ascii=False) for r in sessions(3)) + "\n"
+    assert list(iter_json_records(io.StringIO(text), read_size=5)) == sessions(3)
+    assert list(iter_json_records(io.StringIO("[12345, 678]"), read_size=2)) == [12345, 678]
+    assert list(iter_json_records(io.StringIO("  "))) == []
+
+def test_truncated_input_raises():
+    with pytest.raises(JSONStreamError):
+        list(iter_json_records(io.StringIO('[{"query": "a"}, {"que'), read_size=4))
+
+def test_histogram_percentiles_match_numpy_regardless_of_chunk_size():
+    data = sessions(50)
+    small, large = LogAggregator(chunk_rows=7), LogAggregator(chunk_rows=4096)
+    small.consume(iter(data), "log")
+    large.consume(iter(data), "log")
+    report = small.report()
+    assert report == large.report()
+
+    total = report["scores"]["source"]["log"]["total"]
+    values = np.array([40 + i for i in range(50)])
+    assert total["count"] == 50 and total["mean"] == values.mean()
+    assert total["p50"] == np.percentile(values, 50, method="inverted_cdf")
+    assert total["p99"] == np.percentile(values, 99, method="inverted_cdf")
+    assert set(report["scores"]["language"]) == {"ar", "en"}
+
+    latency = report["latency_ms"]["source"]["log"]
+    assert latency["count"] == 50 and latency["mean"] == 2550.0
+    # حدود لوغاريتمية: الخطأ النسبي صغير
+    assert abs(latency["p50"] - 2500) / 2500 < 0.05
+
+def test_missing_scores_and_top_queries():
+    aggregator = LogAggregator(chunk_rows=4)
+    aggregator.consume(iter([{"query": "Best iPhone 15?"}, {"query": "iphone 15"}, {"query": "kindle", "evaluation_score": None}]), "log")
+    report = aggregator.report(top=5)
+    assert report["records"] == 3
+    assert report["scores"]["source"]["log"]["total"] == {"count": 0}
+    assert report["top_queries"][0] == {"query": "iphone 15", "count": 2}
+
+def test_analyze_files_and_session_store_by_day(tmp_path, capsys):
+    legacy = tmp_path / "data_shopping.json"
+    legacy.write_text(json.dumps(sessions(4), ensure_ascii=False), encoding="utf-8")
+    chats = tmp_path / "all_chats_unified.jsonl"
+    chats.write_text("\n".join(json.dumps(r) for r in sessions(2, query="kindle")) + '\n{"query": "cut', encoding="utf-8")
+    store = SessionStore(str(tmp_path / "sessions.db"))
+    # السؤال المكرر يستبدل سجله: سجلان فقط
+    for record in sessions(3, query="ipad", language_query="ايباد"):
+        store.save(record)
+    store.close()
+
+    report = analyze([str(legacy), str(chats)], str(tmp_path / "sessions.db"), chunk_rows=2, read_size=16)
+    assert report["records"] == 8
+    assert {k: v["total"]["count"] for k, v in report["scores"]["source"].items()} == {
+        "all_chats_unified.jsonl": 2, "data_shopping.json": 4, "sessions.db": 2,
+    }
+    days = report["latency_ms"]["day"]
+    assert days["unknown"]["count"] == 6 and sum(v["count"] for v in days.values()) == 8
+    assert "Stopped reading" in capsys.readouterr().out
+
+    output = tmp_path / "report.json"
+    main([str(legacy), "--db", "", "--output", str(output)])
+    assert json.loads(output.read_text(encoding="utf-8"))["records"] == 4
+
+def test_days_follow_ask_time_not_evaluation_writes(tmp_path):
+    store = SessionStore(str(tmp_path / "sessions.db"))
+    store.save(sessions(1)[0])
+    conn = store._conn()
+    with conn:
+        conn.execute("UPDATE sessions SET created_at = 0, last_asked_at = 86400 * 3")
+    store.update_evaluation("s0", {"total": 90})  # يحدّث updated_at إلى الآن
+    store.close()
+
+    report = analyze([], str(tmp_path / "sessions.db"))
+    assert list(report["latency_ms"]["day"]) == ["1970-01-04"]
+
+def test_latency_from_sessions_saved_by_search(tmp_path):
+    from unittest.mock import patch
+    from fastapi.testclient import TestClient
+    import app as app_module
+
+    store = SessionStore(str(tmp_path / "sessions.db"))
+    products = {"tablet": [{"title": "Tab A", "price": "$1", "source": "S"}]}
+    with patch("app.session_store", store), \
+         patch("app.fetch_items_concurrently", return_value=products), \
+         patch("app.call_groq", return_value="reply"), \
+         patch("app.evaluation_queue.submit"):
+        client = TestClient(app_module.app)
+        client.get("/search", params={"query": "analytics latency tablet"})
+        client.get("/search", params={"query": "تابلت للتحليل"})
+    store.close()
+
+    report = analyze(db_path=str(tmp_path / "sessions.db"))
+    assert report["latency_ms"]["language"]["en"]["count"] == 1
+    assert report["latency_ms"]["language"]["ar"]["count"] == 1
@@ -112,8 +112,7 @@ def test_save_chat_unified_mocked():
 #         save_chat_unified.__globals__["ALL_CHATS_FILE_TEST"] = original_path
 
 def test_save_chat_unified_creates_file(tmp_path):
-    temp_file = tmp_path / "test_chats.json"
-    temp_file.write_text("[]", encoding="utf-8")
+    temp_file = tmp_path / "test_chats.jsonl"
 
     data = {
         "query": "laptop",
@@ -125,15 +124,15 @@ def test_save_chat_unified_creates_file(tmp_path):
     # Force function to use temp file
     save_chat_unified.__globals__["ALL_CHATS_FILE_TEST"] = str(temp_file)
 
-    # Reset in-memory list
-    save_chat_unified.__globals__["all_chats"] = []
-
     # Call function
-    save_chat_unified(data)
+    try:
+        save_chat_unified(data)
+    finally:
+        save_chat_unified.__globals__["ALL_CHATS_FILE_TEST"] = None
 
-    # Check file
+    # Check file (one JSON object per line)
     with open(temp_file, "r", encoding="utf-8") as f:
-        saved = json.load(f)
+        saved = [json.loads(line) for line in f]
 
     assert len(saved) == 1
     assert saved[0]["query"] == "laptop"
@@ -155,3 +154,770 @@ def test_search_endpoint_real_mocked():
         assert json_data["ai_reply"] == "This is a mocked AI reply"
         assert "evaluation_score" in json_data
         assert isinstance(json_data["products"], list)
+
+# ---------------- Concurrent Item Retrieval ----------------
+
+def test_fetch_items_concurrently_isolates_errors():
+    def fake_fetch(item, limit=5):
+        if item == "bad":
+            raise RuntimeError("SerpAPI error 500")
+        return [{"title": f"{item} product", "price": "$1", "source": "S"}]
+
+    with patch("app.fetch_products_serpapi", side_effect=fake_fetch), \
+         patch("app.filter_products_by_context_llm", side_effect=lambda q, p: p):
+        from app import fetch_items_concurrently
+        result = fetch_items_concurrently("good and bad", ["good", "bad"])
+
+    assert list(result) == ["good", "bad"]
+    assert result["good"][0]["title"] == "good product"
+    assert "SerpAPI error 500" in result["bad"][0]["error"]
+
+def test_fetch_items_concurrently_runs_in_parallel():
+    import threading
+    barrier = threading.Barrier(3, timeout=5)
+
+    def fake_fetch(item, limit=5):
+        barrier.wait()  # يفشل إذا لم تعمل العناصر الثلاثة في نفس الوقت
+        return [{"title": item}]
+
+    with patch("app.fetch_products_serpapi", side_effect=fake_fetch), \
+         patch("app.filter_products_by_context_llm", side_effect=lambda q, p: p):
+        from app import fetch_items_concurrently
+        result = fetch_items_concurrently("a and b and c", ["a", "b", "c"], max_concurrency=3)
+
+    assert all(result[item][0]["title"] == item for item in ["a", "b", "c"])
+
+# ---------------- SerpAPI Results Cache ----------------
+
+def test_fetch_products_serpapi_uses_cache():
+    import types
+    import app as app_module
+
+    fake = types.SimpleNamespace(
+        status_code=200,
+        text="",
+        json=lambda: {"shopping_results": [{"title": "iPhone 15", "price": "$799", "source": "Store",
+                                            "link": "https://store/iphone", "thumbnail": "//img/iphone.jpg"}]},
+    )
+    app_module.serp_cache.memory.clear()
+    with patch("app.SERPAPI_KEY", "test-key"), \
+         patch("app.serpapi_client.get", return_value=fake) as mock_get:
+        first = fetch_products_serpapi("iPhone 15")
+        second = fetch_products_serpapi("which is iphone   15")
+
+    assert mock_get.call_count == 1
+    assert first == second
+    assert first[0]["image"] == "https://img/iphone.jpg"
+    app_module.serp_cache.memory.clear()
+
+def test_serpapi_gets_original_text_and_plus_models_get_their_own_cache_entry():
+    import types
+    import app as app_module
+    from app import serpapi_query
+
+    assert serpapi_query("Which is the best Galaxy S24+?") == "galaxy s24+"
+    assert serpapi_query("MacBook Air 13.6") == "macbook air 13.6"
+    assert serpapi_query("ساعة ذكية") == "ساعة ذكية"
+
+    fake = types.SimpleNamespace(status_code=200, text="", json=lambda: {"shopping_results": []})
+    app_module.serp_cache.memory.clear()
+    with patch("app.SERPAPI_KEY", "test-key"), \
+         patch("app.catalog", None), \
+         patch("app.serpapi_client.get", return_value=fake) as mock_get:
+        fetch_products_serpapi("Galaxy S24+")
+        fetch_products_serpapi("galaxy s24")
+    assert [c.kwargs["params"]["q"] for c in mock_get.call_args_list] == ["galaxy s24+", "galaxy s24"]
+    app_module.serp_cache.memory.clear()
+
+# ---------------- Streaming (SSE) ----------------
+
+def parse_sse(text):
+    events = []
+    for block in text.strip().split("\n\n"):
+        lines = block.split("\n")
+        event = lines[0][len("event: "):]
+        events.append((event, json.loads(lines[1][len("data: "):])))
+    return events
+
+def test_call_groq_stream_parses_deltas():
+    import types
+    lines = [
+        b'data: {"choices":[{"delta":{"role":"assistant"}}]}',
+        b"",
+        b'data: {"choices":[{"delta":{"content":"Hel"}}]}',
+        b'data: {"choices":[{"delta":{"content":"lo"}}]}',
+        b"data: [DONE]",
+    ]
+    fake = types.SimpleNamespace(status_code=200, iter_lines=lambda: iter(lines), close=lambda: None)
+    with patch("app.GROQ_KEY", "k"), patch("app.GROQ_URL", "http://groq"), patch("app.GROQ_MODEL", "m"), \
+         patch("app.groq_client.post", return_value=fake) as mock_post:
+        from app import call_groq_stream
+        assert list(call_groq_stream([{"role": "user", "content": "hi"}])) == ["Hel", "lo"]
+    assert mock_post.call_args.kwargs["json"]["stream"] is True
+    assert mock_post.call_args.kwargs["stream"] is True
+
+def test_search_stream_endpoint_emits_products_tokens_done():
+    products = {"tablet": [{"title": "Tab A", "price": "$1", "source": "S", "link": "https://s", "image": None}]}
+    with patch("app.fetch_items_concurrently", return_value=products), \
+         patch("app.call_groq_stream", return_value=iter(["Best ", "tablet"])), \
+         patch("app.evaluation_queue.submit"), \
+         patch("app.save_session_unified") as mock_save:
+        response = client.get("/search/stream", params={"query": "tablet", "session_id": "sse-1"})
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = parse_sse(response.text)
+    assert [e for e, _ in events] == ["products", "token", "token", "done"]
+    assert events[0][1]["products_by_item"] == products
+    assert events[-1][1]["ai_reply"] == "Best tablet"
+    assert events[-1][1]["session_id"] == "sse-1"
+    mock_save.assert_called_once()
+
+def test_search_stream_endpoint_reports_llm_error():
+    def failing_stream(messages, fresh=False, max_tokens=None):
+        raise RuntimeError("GROQ API error 500")
+        yield
+
+    with patch("app.fetch_items_concurrently", return_value={"tablet": []}), \
+         patch("app.call_groq_stream", side_effect=failing_stream), \
+         patch("app.save_session_unified") as mock_save:
+        response = client.get("/search/stream", params={"query": "tablet"})
+
+    events = parse_sse(response.text)
+    assert [e for e, _ in events] == ["products", "error"]
+    assert "GROQ API error 500" in events[-1][1]["error"]
+    mock_save.assert_not_called()
+
+# ---------------- Background Evaluation ----------------
+
+def test_search_does_not_wait_for_evaluation(tmp_path):
+    from session_store import SessionStore
+    store = SessionStore(str(tmp_path / "sessions.db"))
+    products = {"tablet": [{"title": "Tab A", "price": "$1", "source": "S"}]}
+
+    with patch("app.session_store", store), \
+         patch("app.fetch_items_concurrently", return_value=products), \
+         patch("app.call_groq", return_value="reply"), \
+         patch("app.evaluation_queue.submit") as mock_submit:
+        response = client.get("/search", params={"query": "tablet", "session_id": "eval-1"})
+        data = response.json()
+        assert data["evaluation_score"] is None
+        assert data["evaluation_status"] == "pending"
+        mock_submit.assert_called_once_with("eval-1", "tablet", products["tablet"], "reply")
+
+        assert client.get("/evaluation/eval-1").json()["status"] == "pending"
+        store.update_evaluation("eval-1", {"total": 77})
+        status = client.get("/evaluation/eval-1").json()
+        assert status["status"] == "done"
+        assert status["evaluation_score"] == {"total": 77}
+
+def test_evaluation_endpoint_unknown_session():
+    response = client.get("/evaluation/does-not-exist")
+    assert response.status_code == 404
+
+# ---------------- Local / Hybrid Product Filter ----------------
+
+HYBRID_PRODUCTS = [
+    {"title": "Apple iPhone 15 128GB", "price": "$799", "source": "A", "link": "https://a", "image": "https://a.jpg"},
+    {"title": "iPhone 14", "price": "$600", "source": "B", "link": "https://b", "image": None},
+    {"title": "Samsung Galaxy S24", "price": "$700", "source": "C", "link": "https://c", "image": None},
+]
+
+def test_filter_products_local_mode_skips_llm():
+    from app import filter_products
+    with patch("app.call_groq") as mock_groq:
+        result = filter_products("iphone 15", "iphone 15", HYBRID_PRODUCTS, mode="local")
+    mock_groq.assert_not_called()
+    assert [p["title"] for p in result] == ["Apple iPhone 15 128GB"]
+
+def test_filter_products_hybrid_asks_llm_only_for_ambiguous():
+    from app import filter_products
+    with patch("app.call_groq", return_value='[{"title": "iPhone 14", "price": "$600"}]') as mock_groq:
+        result = filter_products("iphone 15", "iphone 15", HYBRID_PRODUCTS, mode="hybrid")
+
+    prompt = mock_groq.call_args.args[0][1]["content"]
+    assert "iPhone 14" in prompt and "Galaxy" not in prompt and "128GB" not in prompt
+    assert [p["title"] for p in result] == ["Apple iPhone 15 128GB", "iPhone 14"]
+    assert result[1]["link"] == "https://b"  # المنتج الأصلي وليس نص النموذج
+
+def test_filter_products_hybrid_falls_back_to_local_on_bad_json():
+    from app import filter_products
+    with patch("app.call_groq", return_value="Sure! Here are the products..."):
+        result = filter_products("iphone 15", "iphone 15", HYBRID_PRODUCTS, mode="hybrid")
+    assert [p["title"] for p in result] == ["Apple iPhone 15 128GB", "iPhone 14"]
+
+def test_search_rejects_unknown_filter_mode():
+    response = client.get("/search", params={"query": "tablet", "filter_mode": "magic"})
+    assert response.status_code == 422
+
+# ---------------- Groq Response Cache ----------------
+
+def groq_response(content):
+    import types
+    return types.SimpleNamespace(status_code=200, text="",
+                                 json=lambda: {"choices": [{"message": {"content": content}}]})
+
+def test_call_groq_caches_identical_prompts():
+    import app as app_module
+    from app import call_groq
+    app_module.groq_cache.clear()
+    messages = [{"role": "user", "content": "cache me"}]
+
+    with patch("app.GROQ_KEY", "k"), patch("app.GROQ_URL", "http://groq"), patch("app.GROQ_MODEL", "m"), \
+         patch("app.groq_client.post", side_effect=[groq_response("first"), groq_response("second")]) as mock_post:
+        assert call_groq(messages) == "first"
+        assert call_groq([dict(m) for m in messages]) == "first"
+        assert mock_post.call_count == 1
+
+        # fresh يتجاوز الكاش ويحدّثه
+        assert call_groq(messages, fresh=True) == "second"
+        assert call_groq(messages) == "second"
+        assert mock_post.call_count == 2
+
+    app_module.groq_cache.clear()
+
+def test_call_groq_cache_key_includes_model():
+    from app import groq_cache_key
+    messages = [{"role": "user", "content": "same"}]
+    with patch("app.GROQ_MODEL", "model-a"):
+        key_a = groq_cache_key(messages)
+    with patch("app.GROQ_MODEL", "model-b"):
+        key_b = groq_cache_key(messages)
+    assert key_a != key_b
+
+# ---------------- Stage Timings / Metrics ----------------
+
+def test_search_returns_server_timing_and_metrics():
+    products = {"tablet": [{"title": "Tab A", "price": "$1", "source": "S"}]}
+    with patch("app.fetch_products_serpapi", return_value=products["tablet"]), \
+         patch("app.call_groq", return_value="reply"), \
+         patch("app.save_session_unified"), \
+         patch("app.evaluation_queue.submit"):
+        response = client.get("/search", params={"query": "tablet", "filter_mode": "local"})
+
+    from metrics import parse_server_timing
+    stages = parse_server_timing(response.headers["Server-Timing"])
+    assert {"total", "retrieve", "serpapi", "filter", "reply", "save", "evaluate"} <= set(stages)
+
+    metrics_text = client.get("/metrics").text
+    assert 'search_stage_duration_seconds_count{stage="reply",status="ok",lang="en"}' in metrics_text
+    assert 'search_requests_total{endpoint="/search",status="ok",lang="en"}' in metrics_text
+    assert 'cache_events{cache="groq",event="hits"}' in metrics_text
+
+# ---------------- Single-Flight Coalescing ----------------
+
+def test_concurrent_identical_searches_share_one_pipeline():
+    import threading
+    import time
+    import app as app_module
+    from metrics import parse_server_timing
+    from singleflight import SingleFlight
+
+    release = threading.Event()
+    products = {"tablet": [{"title": "Tab A", "price": "$1", "source": "S"}]}
+
+    def slow_fetch(*args, **kwargs):
+        release.wait(2)
+        return products
+
+    flights = SingleFlight()
+    results, headers = [], []
+    with patch("app.search_flights", flights), \
+         patch("app.fetch_items_concurrently", side_effect=slow_fetch) as mock_fetch, \
+         patch("app.call_groq", return_value="reply") as mock_groq, \
+         patch("app.save_session_unified") as mock_save, \
+         patch("app.evaluation_queue.submit") as mock_submit:
+        def run(sid, query):
+            response = client.get("/search", params={"query": query, "session_id": sid})
+            results.append(response.json())
+            headers.append(response.headers["Server-Timing"])
+
+        threads = [threading.Thread(target=run, args=(f"s{i}", q))
+                   for i, q in enumerate(["tablet", "Tablet ", "TABLET"])]
+        for t in threads:
+            t.start()
+        while flights.stats()["coalesced"] < 2:
+            time.sleep(0.01)
+        release.set()
+        for t in threads:
+            t.join()
+
+    assert mock_fetch.call_count == 1 and mock_groq.call_count == 1
+    assert sorted(r["session_id"] for r in results) == ["s0", "s1", "s2"]
+    assert sorted(r["coalesced"] for r in results) == [False, True, True]
+    assert all(r["ai_reply"] == "reply" for r in results)
+    assert mock_save.call_count == 3 and mock_submit.call_count == 3
+    # المنتظرون يحصلون على مراحل التنفيذ المشترك في الجلسة المحفوظة وفي Server-Timing
+    for call in mock_save.call_args_list:
+        assert {"retrieve", "reply", "pipeline"} <= set(call.args[0]["timings"])
+    assert all({"retrieve", "reply", "total"} <= set(parse_server_timing(h)) for h in headers)
+    assert app_module.SEARCH_COALESCED.value(endpoint="/search", lang="en") >= 2
+
+def test_search_flight_key_separates_languages_and_modes():
+    from app import search_flight_key
+    assert search_flight_key("iPhone 15", "en") == search_flight_key("iphone  15", "en")
+    assert search_flight_key("iphone 15", "en") != search_flight_key("iphone 15", "ar")
+    assert search_flight_key("iphone 15", "en", filter_mode="llm") != search_flight_key("iphone 15", "en", filter_mode="local")
+
+# ---------------- Image Proxy ----------------
+
+def test_search_response_points_images_at_proxy():
+    products = {"tablet": [{"title": "Tab A", "price": "$1", "source": "S", "link": "https://s", "image": "https://img/a.jpg"}]}
+    with patch("app.fetch_items_concurrently", return_value=products), \
+         patch("app.call_groq", return_value="reply"), \
+         patch("app.save_session_unified") as mock_save, \
+         patch("app.evaluation_queue.submit"):
+        data = client.get("/search", params={"query": "tablet"}).json()
+
+    from image_proxy import proxy_url
+    assert data["products"][0]["image"].startswith("/img?url=https%3A%2F%2Fimg%2Fa.jpg&sig=")
+    assert data["products"][0]["image"] == proxy_url("https://img/a.jpg")
+    assert data["products_by_item"]["tablet"][0]["image"] == proxy_url("https://img/a.jpg")
+    # الجلسة المحفوظة تحتفظ بالرابط الأصلي
+    assert mock_save.call_args.args[0]["products"][0]["image"] == "https://img/a.jpg"
+
+def test_img_endpoint_serves_with_etag_and_304():
+    from image_proxy import proxy_url
+    with patch("app.image_proxy.get", return_value=(b"jpegdata", "image/jpeg", '"abc"')):
+        response = client.get("/img?" + proxy_url("https://img/a.jpg").split("?", 1)[1])
+        assert response.status_code == 200
+        assert response.content == b"jpegdata"
+        assert response.headers["ETag"] == '"abc"'
+        assert "max-age" in response.headers["Cache-Control"]
+
+        cached = client.get("/img?" + proxy_url("https://img/a.jpg").split("?", 1)[1], headers={"If-None-Match": '"abc"'})
+        assert cached.status_code == 304
+
+def test_img_endpoint_rejects_bad_signature_and_urls():
+    with patch("image_proxy.IMAGE_PROXY_SECRET", "s3cret"):
+        assert client.get("/img", params={"url": "https://img/a.jpg", "sig": "nope"}).status_code == 403
+    assert client.get("/img", params={"url": "https://img/a.jpg"}).status_code == 403
+    with patch("image_proxy.IMAGE_PROXY_SECRET", ""):
+        assert client.get("/img", params={"url": "https://img/a.jpg", "sig": "x"}).status_code == 403
+    from image_proxy import sign_url
+    bad = "file:///etc/passwd"
+    assert client.get("/img", params={"url": bad, "sig": sign_url(bad)}).status_code == 400
+
+def test_app_refuses_to_start_without_image_proxy_secret(tmp_path):
+    import os
+    import subprocess
+    import sys
+    env = dict(os.environ, IMAGE_PROXY_ENABLED="1", IMAGE_PROXY_SECRET="", SESSION_DB=str(tmp_path / "s.db"))
+    result = subprocess.run([sys.executable, "-c", "import app"], env=env, capture_output=True, text=True)
+    assert result.returncode != 0
+    assert "IMAGE_PROXY_SECRET is required" in result.stderr
+
+# ---------------- Token Budgets ----------------
+
+def test_search_passes_max_tokens_to_groq():
+    products = {"tablet": [{"title": "Tab A", "price": "$1", "source": "S"}]}
+    with patch("app.fetch_items_concurrently", return_value=products), \
+         patch("app.call_groq", return_value="reply") as mock_groq, \
+         patch("app.save_session_unified"), \
+         patch("app.evaluation_queue.submit"):
+        client.get("/search", params={"query": "tablet", "max_tokens": 300})
+        assert mock_groq.call_args.kwargs["max_tokens"] == 300
+        assert client.get("/search", params={"query": "tablet", "max_tokens": 0}).status_code == 422
+
+def test_call_groq_sends_max_tokens_in_payload():
+    import app as app_module
+    from app import call_groq
+    app_module.groq_cache.clear()
+    with patch("app.GROQ_KEY", "k"), patch("app.GROQ_URL", "http://groq"), patch("app.GROQ_MODEL", "m"), \
+         patch("app.groq_client.post", return_value=groq_response("ok")) as mock_post:
+        call_groq([{"role": "user", "content": "budget"}], max_tokens=128)
+    assert mock_post.call_args.kwargs["json"]["max_tokens"] == 128
+    app_module.groq_cache.clear()
+
+def test_reply_prompt_dedupes_and_respects_budget():
+    from app import build_reply_messages
+    from prompt_builder import estimate_messages_tokens, PROMPT_INPUT_TOKENS
+    products = {"laptop": [
+        {"title": f"Lenovo ThinkPad X1 Carbon Gen 11 14 inch laptop model {i} " + "extra words " * 20,
+         "price": "$1", "source": "S"}
+        for i in range(200)
+    ] + [{"title": "Lenovo ThinkPad X1 Carbon Gen 11", "price": "$2", "source": "A"},
+         {"title": "Lenovo ThinkPad X1 Carbon Gen 11", "price": "$2", "source": "B"}]}
+
+    messages = build_reply_messages("laptop", products)
+    assert estimate_messages_tokens(messages) <= PROMPT_INPUT_TOKENS
+    assert "extra words extra words extra words extra words extra words extra words extra words extra words extra words" not in messages[1]["content"]
+
+def test_match_llm_products_accepts_truncated_titles():
+    from app import match_llm_products
+    candidates = [{"title": "Apple iPhone 15 Pro Max 256GB Natural Titanium Unlocked", "link": "https://a"}]
+    matched = match_llm_products([{"title": "Apple iPhone 15 Pro Max 256GB…"}], candidates)
+    assert matched == candidates
+
+# ---------------- Fast Mode ----------------
+
+FAST_RAW = {"tablet": [
+    {"title": "Samsung Galaxy Tab S9", "price": "$799", "source": "A"},
+    {"title": "Tablet Sleeve", "price": "$9", "source": "B"},
+]}
+
+def test_fast_mode_makes_a_single_llm_call():
+    reply = json.dumps({
+        "products": {"tablet": ["1.1"]},
+        "reply": "Galaxy Tab S9 is a good pick.",
+        "evaluation": {"faithfulness": 90, "relevance": 80, "completeness": 70},
+    })
+    with patch("app.fetch_items_concurrently", return_value=FAST_RAW) as mock_fetch, \
+         patch("app.call_groq", return_value=reply) as mock_groq, \
+         patch("app.save_session_unified"), \
+         patch("app.evaluation_queue.submit") as mock_submit:
+        data = client.get("/search", params={"query": "tablet", "mode": "fast"}).json()
+
+    assert mock_fetch.call_args.args[3] == "none"  # المنتجات الخام بدون تصفية
+    assert mock_groq.call_count == 1
+    assert mock_groq.call_args.kwargs["json_mode"] is True
+    mock_submit.assert_not_called()
+    assert data["mode"] == "fast"
+    assert data["ai_reply"] == "Galaxy Tab S9 is a good pick."
+    assert [p["title"] for p in data["products"]] == ["Samsung Galaxy Tab S9"]
+    assert data["evaluation_status"] == "done"
+    assert data["evaluation_score"]["total"] == 81.0
+
+def test_fast_mode_falls_back_on_invalid_json():
+    with patch("app.fetch_items_concurrently", return_value=FAST_RAW), \
+         patch("app.call_groq", side_effect=["Sure! Here you go", "Standard reply"]) as mock_groq, \
+         patch("app.save_session_unified"), \
+         patch("app.evaluation_queue.submit") as mock_submit:
+        data = client.get("/search", params={"query": "tablet", "mode": "fast", "filter_mode": "local"}).json()
+
+    assert mock_groq.call_count == 2
+    assert data["ai_reply"] == "Standard reply"
+    assert data["evaluation_status"] == "pending"
+    mock_submit.assert_called_once()
+    from metrics import FAST_MODE_RESULTS
+    assert FAST_MODE_RESULTS.value(outcome="fallback") >= 1
+
+def test_fast_mode_does_not_cache_invalid_documents():
+    import types
+    import app as app_module
+    app_module.groq_cache.clear()
+    invalid = types.SimpleNamespace(status_code=200, text="", json=lambda: {"choices": [{"message": {"content": "Sure!"}}]})
+    with patch("app.GROQ_KEY", "k"), patch("app.GROQ_URL", "http://groq"), patch("app.GROQ_MODEL", "m"), \
+         patch("app.fetch_items_concurrently", return_value=FAST_RAW), \
+         patch("app.groq_client.post", return_value=invalid) as mock_post, \
+         patch("app.save_session_unified"), \
+         patch("app.evaluation_queue.submit"):
+        for _ in range(2):
+            client.get("/search", params={"query": "tablet uncached", "mode": "fast", "filter_mode": "local"})
+
+    # الاستدعاء السريع يتكرر في كل طلب، أما الرد العادي فيُخدم من الكاش في الطلب الثاني
+    fast_calls = [c for c in mock_post.call_args_list if "response_format" in c.kwargs["json"]]
+    assert len(fast_calls) == 2 and mock_post.call_count == 3
+    app_module.groq_cache.clear()
+
+# ---------------- Query Planner ----------------
+
+def test_search_plan_shares_one_fetch_for_overlapping_items():
+    def fake_fetch(item, limit=5):
+        return [{"title": "Apple iPhone 15 128GB", "price": "$799", "source": "A"},
+                {"title": "Apple iPhone 15 Pro 256GB", "price": "$999", "source": "B"}]
+
+    with patch("app.fetch_products_serpapi", side_effect=fake_fetch) as mock_fetch, \
+         patch("app.call_groq", return_value="reply"), \
+         patch("app.save_session_unified"), \
+         patch("app.evaluation_queue.submit"):
+        data = client.get("/search", params={"query": "compare iphone 15 and iphone 15 pro", "filter_mode": "local"}).json()
+
+    mock_fetch.assert_called_once_with("iphone 15")
+    assert data["plan"]["items"] == ["iphone 15", "iphone 15 pro"]
+    assert data["plan"]["fetches"] == [{"query": "iphone 15", "items": ["iphone 15", "iphone 15 pro"]}]
+    assert data["products_by_item"]["iphone 15 pro"][0]["title"] == "Apple iPhone 15 Pro 256GB"
+
+def test_narrower_item_is_matched_against_full_serpapi_page():
+    from app import fetch_and_filter_group
+    page = [{"title": f"Apple iPhone 15 {gb}GB", "price": "$799", "source": "A"} for gb in (64, 128, 256, 512, 1024)]
+    page += [{"title": "Apple iPhone 15 Pro 256GB", "price": "$999", "source": "B"},
+             {"title": "iPhone 15 Pro Max", "price": "$1199", "source": "C"}]
+    with patch("app.fetch_products_serpapi", return_value=[dict(p, link="", image=None) for p in page[:5]]), \
+         patch("app.serp_cache.get", return_value=page):
+        results = fetch_and_filter_group("iphone 15 vs iphone 15 pro", "iphone 15", ["iphone 15", "iphone 15 pro"], "none")
+
+    assert len(results["iphone 15"]) == 5
+    assert [p["title"] for p in results["iphone 15 pro"][:2]] == ["Apple iPhone 15 Pro 256GB", "iPhone 15 Pro Max"]
+
+# ---------------- Local Catalog ----------------
+
+def test_fetch_products_answers_variations_from_catalog(tmp_path):
+    import types
+    import app as app_module
+    from catalog import Catalog
+
+    fake = types.SimpleNamespace(status_code=200, text="", json=lambda: {"shopping_results": [
+        {"title": "Apple iPhone 15 128GB Black", "price": "$799", "source": "A", "link": "https://a/1"},
+        {"title": "Apple iPhone 15 256GB Black", "price": "$899", "source": "B", "link": "https://b/1"},
+        {"title": "Apple iPhone 15 Blue", "price": "$799", "source": "C", "link": "https://c/1"},
+    ]})
+    local_catalog = Catalog(str(tmp_path / "catalog.db"), min_results=2)
+    app_module.serp_cache.memory.clear()
+    with patch("app.SERPAPI_KEY", "k"), patch("app.catalog", local_catalog), \
+         patch("app.serpapi_client.get", return_value=fake) as mock_get:
+        fetch_products_serpapi("iphone 15")
+        variation = fetch_products_serpapi("iphone 15 black")
+        thin = fetch_products_serpapi("iphone 15 blue")
+
+    assert mock_get.call_count == 2  # "blue" has only one match in the catalog
+    assert {p["title"] for p in variation} == {"Apple iPhone 15 128GB Black", "Apple iPhone 15 256GB Black"}
+    assert "Apple iPhone 15 Blue" in {p["title"] for p in thin}
+    app_module.serp_cache.memory.clear()
+
+# ---------------- Upstream Governor ----------------
+
+def test_open_circuit_returns_503_with_retry_after():
+    from governor import UpstreamUnavailable
+    products = [{"title": "LED Desk Lamp", "price": "$20", "source": "A", "link": "https://a/lamp"}]
+    with patch("app.fetch_products_serpapi", return_value=products), \
+         patch("app.call_groq", side_effect=UpstreamUnavailable("groq", "circuit_open", 12.3)), \
+         patch("app.save_session_unified"):
+        response = client.get("/search", params={"query": "governor outage lamp", "filter_mode": "local"})
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "13"
+    assert "circuit_open" in response.json()["detail"]
+
+def test_open_circuit_serves_stale_catalog_products(tmp_path):
+    import time
+    import app as app_module
+    from catalog import Catalog
+    from governor import UpstreamUnavailable
+
+    local_catalog = Catalog(str(tmp_path / "catalog.db"), max_age=60)
+    local_catalog.ingest("desk lamp", [
+        {"title": "LED Desk Lamp", "price": "$20", "source": "A", "link": "https://a/lamp"},
+    ], fetched_at=time.time() - 3600)
+    app_module.serp_cache.memory.clear()
+    with patch("app.SERPAPI_KEY", "k"), patch("app.catalog", local_catalog), \
+         patch("app.serpapi_client.get", side_effect=UpstreamUnavailable("serpapi", "circuit_open", 5)):
+        products = fetch_products_serpapi("desk lamp")
+    assert [p["title"] for p in products] == ["LED Desk Lamp"]
+    app_module.serp_cache.memory.clear()
+
+def test_admin_upstreams_reports_and_resets_governors():
+    from upstream import serpapi_client
+    data = client.get("/admin/upstreams").json()
+    assert {"serpapi", "groq"} <= set(data)
+    assert data["serpapi"]["state"] == "closed"
+
+    serpapi_client.governor._trip()
+    assert client.get("/admin/upstreams").json()["serpapi"]["state"] == "open"
+    assert client.post("/admin/upstreams/serpapi/reset").json()["state"] == "closed"
+    assert client.post("/admin/upstreams/nope/reset").status_code == 404
+
+# ---------------- Conversation State ----------------
+
+def test_follow_up_reuses_session_products_without_serpapi():
+    import app as app_module
+    app_module.conversations.clear()
+    products = {"tablet": [
+        {"title": "Tab A", "price": "$100", "source": "S", "link": "https://s/a", "image": None},
+        {"title": "Tab B", "price": "$80", "source": "S", "link": "https://s/b", "image": None},
+    ]}
+    with patch("app.fetch_items_concurrently", return_value=products) as mock_fetch, \
+         patch("app.call_groq", side_effect=["Tab A and Tab B are good.", "Tab B is cheaper."]) as mock_groq, \
+         patch("app.save_session_unified"), \
+         patch("app.evaluation_queue.submit"):
+        first = client.get("/search", params={"query": "tablet", "session_id": "conv-1", "filter_mode": "local"}).json()
+        second = client.get("/search", params={"query": "which of these is cheaper?", "session_id": "conv-1"}).json()
+
+    mock_fetch.assert_called_once()
+    assert first["follow_up"] is False and second["follow_up"] is True
+    assert second["ai_reply"] == "Tab B is cheaper."
+    assert [p["title"] for p in second["products"]] == ["Tab A", "Tab B"]
+
+    # السؤال السابق ورده يُرسلان كرسائل قبل السؤال الجديد
+    messages = mock_groq.call_args_list[1].args[0]
+    assert [m["role"] for m in messages] == ["system", "user", "assistant", "user"]
+    assert messages[1]["content"] == "tablet" and messages[2]["content"] == "Tab A and Tab B are good."
+    assert "Tab B" in messages[3]["content"]
+    assert app_module.conversations.stats()["follow_ups"] == 1
+
+def test_follow_up_can_be_disabled_per_request():
+    import app as app_module
+    app_module.conversations.clear()
+    products = {"tablet": [{"title": "Tab A", "price": "$100", "source": "S", "link": "https://s/a", "image": None}]}
+    with patch("app.fetch_items_concurrently", return_value=products) as mock_fetch, \
+         patch("app.call_groq", return_value="reply"), \
+         patch("app.save_session_unified"), \
+         patch("app.evaluation_queue.submit"):
+        client.get("/search", params={"query": "tablet", "session_id": "conv-2"})
+        data = client.get("/search", params={
+            "query": "cheaper tablets", "session_id": "conv-2", "follow_up": "false",
+        }).json()
+    assert mock_fetch.call_count == 2 and data["follow_up"] is False
+
+def test_new_search_in_same_session_still_fetches():
+    import app as app_module
+    app_module.conversations.clear()
+    products = {"tablet": [{"title": "Tab A", "price": "$100", "source": "S", "link": "https://s/a", "image": None}]}
+    with patch("app.fetch_items_concurrently", return_value=products) as mock_fetch, \
+         patch("app.call_groq", return_value="reply"), \
+         patch("app.save_session_unified"), \
+         patch("app.evaluation_queue.submit"):
+        client.get("/search", params={"query": "tablet", "session_id": "conv-4"})
+        cheapest = client.get("/search", params={"query": "cheapest gaming laptop", "session_id": "conv-4"}).json()
+        arabic = client.get("/search", params={"query": "ارخص لابتوب للألعاب", "session_id": "conv-4"}).json()
+    assert mock_fetch.call_count == 3
+    assert cheapest["follow_up"] is False and arabic["follow_up"] is False
+
+def test_stream_follow_up_skips_retrieval():
+    import app as app_module
+    app_module.conversations.clear()
+    products = {"tablet": [{"title": "Tab A", "price": "$1", "source": "S", "link": "https://s", "image": None}]}
+    with patch("app.fetch_items_concurrently", return_value=products) as mock_fetch, \
+         patch("app.call_groq_stream", side_effect=lambda *a, **k: iter(["ok"])), \
+         patch("app.evaluation_queue.submit"), \
+         patch("app.save_session_unified"):
+        client.get("/search/stream", params={"query": "tablet", "session_id": "conv-3"})
+        response = client.get("/search/stream", params={"query": "أيهما أرخص؟", "session_id": "conv-3"})
+
+    mock_fetch.assert_called_once()
+    events = parse_sse(response.text)
+    assert events[0][1]["follow_up"] is True
+    assert events[0][1]["products_by_item"] == products
+
+# ---------------- Cursor Pagination ----------------
+
+def test_search_returns_cursor_and_products_endpoint_pages_on_demand():
+    import types
+    import app as app_module
+
+    def serp_page(start):
+        titles = [f"Tablet {start + i}" for i in range(8)] if start < 16 else []
+        return types.SimpleNamespace(status_code=200, text="", json=lambda: {"shopping_results": [
+            {"title": t, "price": "$1", "source": "S", "link": f"https://s/{t}"} for t in titles
+        ]})
+
+    calls = []
+    def fake_get(url, params=None):
+        calls.append(params.get("start", 0))
+        return serp_page(params.get("start", 0))
+
+    app_module.serp_cache.memory.clear()
+    with patch("app.SERPAPI_KEY", "k"), patch("app.catalog", None), \
+         patch("app.serpapi_client.get", side_effect=fake_get), \
+         patch("app.call_groq", return_value="reply"), \
+         patch("app.save_session_unified"), \
+         patch("app.evaluation_queue.submit"):
+        data = client.get("/search", params={"query": "tablet paging", "filter_mode": "local"}).json()
+        cursor = data["cursors"]["tablet paging"]
+        assert calls == [0]
+
+        page = client.get("/products", params={"cursor": cursor, "page_size": 3}).json()
+        assert [p["title"] for p in page["products"]] == ["Tablet 5", "Tablet 6", "Tablet 7"]
+        assert calls == [0]  # من نتائج الصفحة الأولى المحفوظة
+
+        page = client.get("/products", params={"cursor": page["next_cursor"], "page_size": 3}).json()
+        assert [p["title"] for p in page["products"]] == ["Tablet 8", "Tablet 9", "Tablet 10"]
+        assert calls == [0, 8]
+
+    assert client.get("/products", params={"cursor": "garbage"}).status_code == 400
+    app_module.serp_cache.memory.clear()
+
+def test_products_endpoint_pages_a_narrower_item_on_its_own_words():
+    import types
+    import app as app_module
+
+    titles = [f"Apple iPhone 15 {i} 128GB" for i in range(8)] + [f"Apple iPhone 15 Pro {i} 256GB" for i in range(8)]
+    def fake_get(url, params=None):
+        page = titles if params.get("start", 0) == 0 else []
+        return types.SimpleNamespace(status_code=200, text="", json=lambda: {"shopping_results": [
+            {"title": t, "price": "$1", "source": "S", "link": f"https://s/{t}"} for t in page
+        ]})
+
+    app_module.serp_cache.memory.clear()
+    with patch("app.SERPAPI_KEY", "k"), patch("app.catalog", None), \
+         patch("app.serpapi_client.get", side_effect=fake_get), \
+         patch("app.call_groq", return_value="reply"), \
+         patch("app.save_session_unified"), \
+         patch("app.evaluation_queue.submit"):
+        data = client.get("/search", params={"query": "compare iphone 15 and iphone 15 pro", "filter_mode": "local"}).json()
+        assert [p["title"] for p in data["products_by_item"]["iphone 15 pro"]] == titles[8:13]
+
+        page = client.get("/products", params={"cursor": data["cursors"]["iphone 15 pro"], "page_size": 3}).json()
+        # تكملة عناصر Pro بعد ما عُرض، لا نتائج "iphone 15" ولا تكرار للصفحة الأولى
+        assert [p["title"] for p in page["products"]] == titles[13:16]
+    app_module.serp_cache.memory.clear()
+
+def test_catalog_served_search_returns_cursor_from_the_start(tmp_path):
+    import app as app_module
+    from catalog import Catalog
+    from pagination import decode_cursor
+
+    local_catalog = Catalog(str(tmp_path / "catalog.db"), min_results=1)
+    local_catalog.ingest("tablet catalog", [{"title": "Tablet Catalog A", "price": "$1", "source": "S", "link": "https://s/a"}])
+    app_module.serp_cache.memory.clear()
+    with patch("app.SERPAPI_KEY", "k"), patch("app.catalog", local_catalog), \
+         patch("app.serpapi_client.get") as mock_get, \
+         patch("app.call_groq", return_value="reply"), \
+         patch("app.save_session_unified"), \
+         patch("app.evaluation_queue.submit"):
+        data = client.get("/search", params={"query": "tablet catalog", "filter_mode": "local"}).json()
+
+    mock_get.assert_not_called()
+    assert decode_cursor(data["cursors"]["tablet catalog"])["k"] == 0
+
+# ---------------- Cache Warmer ----------------
+
+def test_warm_query_refreshes_only_expiring_serpapi_entries():
+    import types
+    import app as app_module
+
+    fake = types.SimpleNamespace(status_code=200, text="", json=lambda: {"shopping_results": [
+        {"title": "Apple iPhone 15", "price": "$799", "source": "A", "link": "https://a/1"},
+    ]})
+    app_module.serp_cache.memory.clear()
+    with patch("app.SERPAPI_KEY", "k"), patch("app.catalog", None), \
+         patch("app.serpapi_client.get", return_value=fake) as mock_get:
+        assert app_module.warm_query("compare iphone 15 and galaxy s24", budget=1) == 1
+        assert app_module.warm_query("compare iphone 15 and galaxy s24", budget=5) == 1  # iphone 15 حديث
+        assert app_module.warm_query("compare iphone 15 and galaxy s24", budget=5) == 0
+        fetch_products_serpapi("iphone 15")
+    assert mock_get.call_count == 2
+    app_module.serp_cache.memory.clear()
+
+def test_warm_query_warms_replies_for_client_max_tokens():
+    import app as app_module
+    from prompt_builder import REPLY_MAX_TOKENS
+    products = {"iphone 15": [{"title": "Apple iPhone 15", "price": "$799", "source": "A", "link": "https://a/1"}]}
+    app_module.groq_cache.clear()
+    with patch("app.CACHE_WARMER_REPLIES", True), \
+         patch("app.serp_cache.ttl_remaining", return_value=3600), \
+         patch("app.fetch_items_concurrently", return_value=products), \
+         patch("app.call_groq", return_value="reply") as mock_groq:
+        assert app_module.warm_query("iphone 15", budget=5) == 2
+        assert app_module.warm_query("iphone 15", budget=1) == 1
+    assert [c.kwargs["max_tokens"] for c in mock_groq.call_args_list] == [REPLY_MAX_TOKENS, 1000, REPLY_MAX_TOKENS]
+
+# ---------------- Compact Responses ----------------
+
+def test_search_compact_mode_with_fields_and_gzip():
+    products = {"tablet": [
+        {"title": f"Tablet {i}", "price": "$1", "source": "S", "link": f"https://s/{i}", "image": None}
+        for i in range(30)
+    ]}
+    with patch("app.fetch_items_concurrently", return_value=products), \
+         patch("app.call_groq", return_value="reply " * 200), \
+         patch("app.save_session_unified"), \
+         patch("app.evaluation_queue.submit"):
+        full = client.get("/search", params={"query": "tablet compact"})
+        compact = client.get("/search", params={"query": "tablet compact", "compact": "true"},
+                             headers={"Accept-Encoding": "gzip"})
+        picked = client.get("/search", params={"query": "tablet compact", "fields": "ai_reply,products_by_item.title"})
+
+    assert compact.headers["content-encoding"] == "gzip"
+    assert int(compact.headers["content-length"]) < len(full.content) / 2
+    data = compact.json()
+    assert "products" not in data and "evaluation_score" not in data
+    assert "image" not in data["products_by_item"]["tablet"][0]
+    assert "serialize" in compact.headers["Server-Timing"]
+    assert picked.json()["products_by_item"]["tablet"][0] == {"title": "Tablet 0"}
+    assert set(picked.json()) == {"ai_reply", "products_by_item"}
+
+def test_search_rejects_unknown_fields_before_running_pipeline():
+    with patch("app.fetch_items_concurrently") as mock_fetch:
+        response = client.get("/search", params={"query": "tablet", "fields": "ai_reply,secret"})
+    assert response.status_code == 400
+    mock_fetch.assert_not_called()
@@ -0,0 +1,83 @@
+import json
+import random
+import requests
+import pytest
+from benchmarks.fake_upstreams import FakeUpstreams, parse_latency, chat_reply
+from benchmarks.bench_search import percentile, summarize, compare, run_benchmark
+
+# ---------------- Fake Upstreams ----------------
+def test_parse_latency_distributions():
+    rng = random.Random(1)
+    assert parse_latency("fixed:50")(rng) == 0.05
+    assert 0.02 <= parse_latency("uniform:20:80")(rng) <= 0.08
+    assert parse_latency("lognormal:50:0.5")(rng) > 0
+    with pytest.raises(ValueError):
+        parse_latency("pareto:1")
+
+def test_fake_upstreams_serve_canned_data():
+    fakes = FakeUpstreams(seed=1).start()
+    try:
+        serp = requests.get(fakes.serpapi_url, params={"q": "iphone 15"}, timeout=5).json()
+        assert len(serp["shopping_results"]) == 20
+        assert serp["shopping_results"][1]["title"] == "Iphone 15 Model 1"
+
+        chat = requests.post(fakes.groq_url, json={"messages": [
+            {"role": "system", "content": "Your role: accuracy evaluation."},
+            {"role": "user", "content": "..."},
+        ]}, timeout=5).json()
+        assert json.loads(chat["choices"][0]["message"]["content"])["relevance"] == 90
+    finally:
+        fakes.stop()
+    assert fakes.counts == {"serpapi": 1, "groq": 1, "errors": 0}
+
+def test_fake_upstreams_inject_errors():
+    fakes = FakeUpstreams(error_rate=1.0).start()
+    try:
+        assert requests.get(fakes.serpapi_url, params={"q": "x"}, timeout=5).status_code == 503
+    finally:
+        fakes.stop()
+
+def test_chat_reply_echoes_filter_titles():
+    messages = [{"role": "system", "content": "Your role: product filtering."},
+                {"role": "user", "content": "Retrieved products:\n- Phone A | $1 | S\n- Phone B | $2 | S\n"}]
+    assert json.loads(chat_reply(messages)) == [{"title": "Phone A"}, {"title": "Phone B"}]
+
+# ---------------- Report ----------------
+def test_percentiles_and_summary():
+    values = [i / 1000 for i in range(1, 101)]
+    assert percentile(values, 50) == 0.05
+    assert percentile(values, 99) == 0.099
+    assert summarize(values)["p95_ms"] == 95.0
+    assert summarize([]) == {"count": 0}
+
+def test_compare_against_baseline():
+    base = {"throughput_rps": 10, "stages": {"total": {"count": 5, "p50_ms": 100, "p95_ms": 200, "p99_ms": 300}}}
+    report = {"throughput_rps": 12, "stages": {"total": {"count": 5, "p50_ms": 50, "p95_ms": 200, "p99_ms": 330}}}
+    rows = compare(report, base)
+    assert ("total", "p50_ms", 100, 50, -50.0) in rows
+    assert ("throughput", "rps", 10, 12, 20.0) in rows
+
+def test_run_benchmark_end_to_end():
+    report = run_benchmark(requests_total=6, concurrency=2, serp_latency="fixed:0", groq_latency="fixed:0",
+                           queries=["iphone 15", "compare ipad and kindle"])
+    assert report["ok"] == 6 and report["errors"] == 0
+    assert report["stages"]["client_total"]["count"] == 6
+    assert {"total", "retrieve", "serpapi", "filter", "reply", "save"} <= set(report["stages"])
+    assert report["upstream_calls"]["serpapi"] >= 1
+    assert report["payload"]["body_bytes_avg"] > 0
+
+# ---------------- Text Normalization Benchmark ----------------
+def test_textnorm_benchmark_reports_timings_and_shared_keys():
+    from benchmarks.bench_textnorm import run_benchmark as run_textnorm_benchmark
+    report = run_textnorm_benchmark(size=500)
+    assert report["us_per_call"]["detect_language"]["textnorm_cached"] > 0
+    assert report["distinct_cache_keys"]["textnorm"] < report["distinct_cache_keys"]["legacy"]
+
+# ---------------- Payload Benchmark ----------------
+def test_payload_benchmark_reports_sizes():
+    from benchmarks.bench_payload import run_benchmark as run_payload_benchmark
+    report = run_payload_benchmark(per_item=5)
+    sizes = report["bytes"]
+    assert sizes["fields"]["json"] < sizes["compact"]["json"] < sizes["full"]["json"]
+    assert sizes["full"]["gzip"] < sizes["full"]["json"]
+    assert report["us_per_call"]["dumps"] > 0
@@ -0,0 +1,127 @@
+import pytest
+from unittest.mock import patch
+from cache import TTLCache, SqliteCache, TieredCache, make_cache_key, content_hash
+
+# ---------------- TTLCache ----------------
+def test_ttl_cache_hit_and_miss():
+    cache = TTLCache(max_entries=2, ttl=60)
+    assert cache.get("a") is None
+    cache.set("a", [1, 2])
+    assert cache.get("a") == [1, 2]
+    stats = cache.stats()
+    assert stats["hits"] == 1 and stats["misses"] == 1
+
+def test_ttl_cache_keeps_falsy_values():
+    cache = TTLCache(ttl=60)
+    cache.set("empty", [])
+    assert cache.get("empty", "missing") == []
+
+def test_ttl_cache_evicts_least_recently_used():
+    cache = TTLCache(max_entries=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")          # a أصبح الأحدث استخدامًا
+    cache.set("c", 3)       # يطرد b
+    assert cache.get("b") is None
+    assert cache.get("a") == 1 and cache.get("c") == 3
+    assert cache.stats()["evictions"] == 1
+
+def test_ttl_cache_expires_entries():
+    cache = TTLCache(ttl=10)
+    with patch("cache.time.time", return_value=1000):
+        cache.set("a", 1)
+    with patch("cache.time.time", return_value=1011):
+        assert cache.get("a") is None
+    assert cache.stats()["expirations"] == 1
+    assert len(cache) == 0
+
+def test_ttl_remaining_does_not_count_as_hit():
+    cache = TTLCache(ttl=10)
+    with patch("cache.time.time", return_value=1000):
+        cache.set("a", 1)
+    with patch("cache.time.time", return_value=1004):
+        assert cache.ttl_remaining("a") == 6
+        assert cache.ttl_remaining("missing") == 0
+    assert cache.stats()["hits"] == 0 and cache.stats()["misses"] == 0
+
+# ---------------- SqliteCache / TieredCache ----------------
+def test_sqlite_cache_survives_reopen(tmp_path):
+    path = str(tmp_path / "serp.db")
+    SqliteCache(path, ttl=60).set("k", [{"title": "iPhone 15"}])
+    assert SqliteCache(path, ttl=60).get("k") == [{"title": "iPhone 15"}]
+
+def test_sqlite_cache_expires_entries(tmp_path):
+    cache = SqliteCache(str(tmp_path / "serp.db"), ttl=10)
+    with patch("cache.time.time", return_value=1000):
+        cache.set("k", 1)
+    with patch("cache.time.time", return_value=1011):
+        assert cache.get("k") is None
+    assert cache.stats()["entries"] == 0
+
+def test_sqlite_cache_purges_expired_rows_periodically(tmp_path):
+    cache = SqliteCache(str(tmp_path / "serp.db"), ttl=10, purge_every=3)
+    with patch("cache.time.time", return_value=1000):
+        cache.set("one-off-1", 1)
+        cache.set("one-off-2", 2)
+    with patch("cache.time.time", return_value=1011):
+        cache.set("fresh", 3)
+        assert cache.get("fresh") == 3
+    # لا أحد يقرأ المفاتيح المنتهية مرة أخرى، ومع ذلك لا تبقى على القرص
+    stats = cache.stats()
+    assert stats["entries"] == 1
+    assert stats["expirations"] == 2
+
+def test_tiered_cache_promotes_disk_hits(tmp_path):
+    disk = SqliteCache(str(tmp_path / "serp.db"), ttl=60)
+    disk.set("k", "v")
+    tiered = TieredCache(TTLCache(ttl=60), disk)
+
+    assert tiered.get("k") == "v"
+    assert tiered.memory.get("k") == "v"
+    stats = tiered.stats()
+    assert stats["disk"]["hits"] == 1
+
+def test_tiered_cache_without_disk():
+    tiered = TieredCache(TTLCache(ttl=60))
+    tiered.set("k", "v")
+    assert tiered.get("k") == "v"
+    assert tiered.get("other") is None
+    assert tiered.stats()["disk"] is None
+
+# ---------------- Byte Budget ----------------
+def test_ttl_cache_enforces_byte_budget():
+    cache = TTLCache(max_entries=100, ttl=60, max_bytes=10)
+    cache.set("a", "12345")
+    cache.set("b", "12345")
+    assert cache.stats()["bytes"] == 10
+    cache.set("c", "123")          # يطرد a (الأقدم)
+    assert cache.get("a") is None
+    assert cache.get("b") == "12345" and cache.get("c") == "123"
+    assert cache.stats()["bytes"] == 8
+
+def test_ttl_cache_skips_values_larger_than_budget():
+    cache = TTLCache(ttl=60, max_bytes=4)
+    cache.set("big", "مرحبا")      # 10 bytes in UTF-8
+    assert cache.get("big") is None
+    assert cache.stats()["bytes"] == 0
+
+def test_ttl_cache_replacing_key_updates_bytes():
+    cache = TTLCache(ttl=60, max_bytes=100)
+    cache.set("a", "1234")
+    cache.set("a", "12")
+    assert cache.stats()["bytes"] == 2
+    cache.delete("a")
+    assert cache.stats()["bytes"] == 0
+
+def test_content_hash_is_order_independent_for_keys():
+    assert content_hash({"a": 1, "b": [1, 2]}) == content_hash({"b": [1, 2], "a": 1})
+    assert content_hash({"a": 1}) != content_hash({"a": 2})
+
+def test_make_cache_key():
+    assert make_cache_key("serpapi", "ar", "sa", "iphone 15") == "serpapi|ar|sa|iphone 15"
+
+def test_tiered_ttl_remaining_falls_back_to_disk(tmp_path):
+    cache = TieredCache(TTLCache(ttl=10), SqliteCache(str(tmp_path / "serp.db"), ttl=100))
+    cache.disk.set("k", [1])
+    assert 90 < cache.ttl_remaining("k") <= 100
+    assert cache.ttl_remaining("missing") == 0
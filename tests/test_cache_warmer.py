@@ -0,0 +1,48 @@
+from cache_warmer import CacheWarmer
+
+class FakeStore:
+    def __init__(self, queries):
+        self.queries = queries
+
+    def top_queries(self, limit=20, half_life=86400):
+        return [{"query": q, "hits": 1, "last_asked_at": 0, "score": 1.0} for q in self.queries][:limit]
+
+def test_run_once_warms_top_queries_within_budget():
+    calls = []
+    def warm(query, budget):
+        calls.append((query, budget))
+        return 0 if query == "fresh" else 2
+
+    warmer = CacheWarmer(FakeStore(["iphone 15", "fresh", "ps5", "kindle"]), warm, top_n=4, budget=4)
+    summary = warmer.run_once()
+
+    assert calls == [("iphone 15", 4), ("fresh", 2), ("ps5", 2)]
+    assert summary["warmed"] == ["iphone 15", "ps5"]
+    assert summary["already_fresh"] == 1
+    assert summary["skipped_over_budget"] == ["kindle"]
+    assert summary["upstream_calls"] == 4
+    assert warmer.stats()["runs"] == 1
+
+def test_follow_up_queries_are_not_warmed():
+    warmer = CacheWarmer(FakeStore(["which of these is cheaper?", "ipad"]), lambda q, b: 1, top_n=5)
+    assert [r["query"] for r in warmer.candidates()] == ["ipad"]
+
+def test_failures_do_not_stop_the_run():
+    def warm(query, budget):
+        if query == "bad":
+            raise RuntimeError("SerpAPI error 500")
+        return 1
+
+    summary = CacheWarmer(FakeStore(["bad", "good"]), warm, budget=5).run_once()
+    assert summary["failed"] == ["bad"] and summary["warmed"] == ["good"]
+
+def test_background_thread_runs_periodically():
+    import threading
+    ran = threading.Event()
+    warmer = CacheWarmer(FakeStore(["ipad"]), lambda q, b: ran.set() or 1, interval=0.01)
+    warmer.start()
+    try:
+        assert ran.wait(2)
+    finally:
+        warmer.stop()
+    assert not warmer.stats()["running"]
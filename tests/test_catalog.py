@@ -0,0 +1,57 @@
+import time
+import pytest
+from catalog import Catalog, fts_query, main
+
+def products(*titles, source="Store"):
+    return [{"title": t, "price": "$1", "source": source, "link": f"https://s/{i}-{t}", "image": None}
+            for i, t in enumerate(titles)]
+
+@pytest.fixture
+def catalog(tmp_path):
+    c = Catalog(str(tmp_path / "catalog.db"), max_age=3600, min_results=2, retention=7200, compact_every=0)
+    yield c
+    c.close()
+
+def test_fts_query_quotes_tokens_and_drops_stopwords():
+    assert fts_query('which is the "iPhone" 15 OR') == '"iphone" "15"'
+
+def test_search_matches_all_words(catalog):
+    catalog.ingest("iphone 15", products("Apple iPhone 15 128GB Black", "Apple iPhone 15 Pro", "iPhone 14"))
+    titles = [p["title"] for p in catalog.search("iphone 15 black")]
+    assert titles == ["Apple iPhone 15 128GB Black"]
+    assert len(catalog.search("IPHONE 15")) == 2
+
+def test_search_normalizes_arabic(catalog):
+    catalog.ingest("ايفون", products("آيفون ١٥ برو"))
+    assert [p["title"] for p in catalog.search("ايفون 15")] == ["آيفون ١٥ برو"]
+
+def test_lookup_needs_enough_fresh_matches(catalog):
+    old = time.time() - 7000
+    catalog.ingest("galaxy", products("Galaxy S24", "Galaxy S24 Ultra"), fetched_at=old)
+    assert catalog.lookup("galaxy s24") is None  # قديمة
+
+    catalog.ingest("galaxy", products("Galaxy S24", "Galaxy S24 Ultra"))
+    assert len(catalog.lookup("galaxy s24", limit=5)) == 2
+    assert catalog.lookup("galaxy s24 ultra") is None  # مطابقة واحدة فقط
+    assert catalog.stats()["hits"] == 1 and catalog.stats()["misses"] == 2
+
+def test_reingest_updates_instead_of_duplicating(catalog):
+    catalog.ingest("tv", products("Sony Bravia 55"))
+    catalog.ingest("tv", [dict(products("Sony Bravia 55")[0], price="$2")])
+    assert catalog.count() == 1
+    assert catalog.search("bravia")[0]["price"] == "$2"
+
+def test_compact_removes_expired_and_overflow(tmp_path):
+    catalog = Catalog(str(tmp_path / "c.db"), retention=100, max_products=2, compact_every=0)
+    catalog.ingest("old", products("Old Phone"), fetched_at=time.time() - 1000)
+    catalog.ingest("new", products("Phone A", "Phone B", "Phone C"))
+    result = catalog.compact()
+    assert result["expired"] == 1 and result["overflow"] == 1
+    assert catalog.count() == 2
+    assert catalog.search("old phone", max_age=10000) == []
+
+def test_cli_compact(tmp_path, capsys):
+    db = str(tmp_path / "c.db")
+    Catalog(db).ingest("x", products("Thing"))
+    main(["compact", "--db", db])
+    assert "1 left" in capsys.readouterr().out
@@ -0,0 +1,54 @@
+import json
+from chat_store import ChatStore
+
+def read_lines(path):
+    return [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines()]
+
+def test_save_appends_and_merges(tmp_path):
+    path = tmp_path / "chats.jsonl"
+    store = ChatStore(path)
+    store.save({"session_id": "1", "query": "laptop", "products": [{"title": "A"}], "ai_reply": "r1", "evaluation_score": {"total": 50}})
+    store.save({"session_id": "2", "query": "laptop", "products": [{"title": "A"}, {"title": "B"}], "ai_reply": "r2", "evaluation_score": {"total": 80}})
+
+    entry = store.get("laptop")
+    assert [p["title"] for p in entry["products"]] == ["A", "B"]
+    assert entry["ai_reply"] == "r2" and entry["session_id"] == "1"
+    assert len(read_lines(path)) == 2  # لا إعادة كتابة
+
+def test_reload_is_last_write_wins(tmp_path):
+    path = tmp_path / "chats.jsonl"
+    store = ChatStore(path)
+    store.save({"query": "phone", "products": [], "ai_reply": "old", "evaluation_score": None})
+    store.save({"query": "tv", "products": [], "ai_reply": "tv", "evaluation_score": None})
+    store.save({"query": "phone", "products": [], "ai_reply": "new", "evaluation_score": None})
+    with open(path, "a", encoding="utf-8") as f:
+        f.write('{"query": "trunc')
+
+    reloaded = ChatStore(path)
+    assert len(reloaded) == 2
+    assert reloaded.get("phone")["ai_reply"] == "new"
+
+def test_compaction_keeps_one_line_per_query(tmp_path):
+    path = tmp_path / "chats.jsonl"
+    store = ChatStore(path, compact_min_lines=4, compact_ratio=2)
+    for i in range(5):
+        store.save({"query": "same", "products": [{"title": f"P{i}"}], "ai_reply": str(i), "evaluation_score": None})
+
+    lines = read_lines(path)
+    assert len(lines) == 1
+    assert len(lines[0]["products"]) == 5
+    assert ChatStore(path).get("same")["ai_reply"] == "4"
+
+def test_imports_legacy_json_once(tmp_path):
+    legacy = tmp_path / "all_chats_unified.json"
+    legacy.write_text(json.dumps([
+        {"query": "a", "products": [], "ai_reply": "x", "evaluation_score": None},
+        {"query": "b", "products": [], "ai_reply": "y", "evaluation_score": None},
+    ]), encoding="utf-8")
+    path = tmp_path / "chats.jsonl"
+
+    store = ChatStore(path, legacy_path=legacy)
+    assert len(store) == 2 and len(read_lines(path)) == 2
+
+    legacy.write_text("[]", encoding="utf-8")
+    assert len(ChatStore(path, legacy_path=legacy)) == 2
@@ -0,0 +1,77 @@
+from conversation import ConversationStore, is_follow_up
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+PRODUCTS = {"tablet": [{"title": "Tab A", "price": "$100", "source": "S"}]}
+
+# ---------------- Follow-Up Detection ----------------
+def test_detects_follow_up_questions():
+    assert is_follow_up("Which of these is cheaper?")
+    assert is_follow_up("أيهما أرخص؟")
+    assert is_follow_up("هل الأول يدعم الشحن السريع")
+    assert not is_follow_up("iphone 15 pro 256gb")
+    assert not is_follow_up("سماعات لاسلكية")
+    assert not is_follow_up("laptop for both gaming and work")
+    assert is_follow_up("which one is cheaper")
+    assert is_follow_up("the cheapest?")
+
+def test_new_searches_with_comparative_words_are_not_follow_ups():
+    for query in [
+        "cheapest gaming laptop", "cheaper alternative to airpods pro", "which one is the best phone under 2000",
+        "ارخص لابتوب للألعاب", "the first iphone", "iphone 15 vs previous generation",
+    ]:
+        assert not is_follow_up(query), query
+
+# ---------------- Store ----------------
+def test_records_turns_and_keeps_products_of_last_search():
+    store = ConversationStore()
+    store.record("s1", "tablet", "Tab A is good", PRODUCTS)
+    conversation = store.record("s1", "which is cheaper?", "Tab A")
+    assert conversation.products_by_item == PRODUCTS
+    assert [t["query"] for t in conversation.turns] == ["tablet", "which is cheaper?"]
+    assert store.get("s1") is conversation
+    assert store.get("missing") is None and store.get(None) is None
+
+def test_lru_cap_evicts_least_recently_used():
+    store = ConversationStore(max_sessions=2)
+    store.record("a", "q", "r", PRODUCTS)
+    store.record("b", "q", "r", PRODUCTS)
+    store.get("a")
+    store.record("c", "q", "r", PRODUCTS)
+    assert store.get("b") is None
+    assert store.get("a") is not None and store.get("c") is not None
+    assert store.stats()["evicted"] == 1
+
+def test_idle_sessions_expire():
+    clock = FakeClock()
+    store = ConversationStore(idle_ttl=60, clock=clock)
+    store.record("a", "q", "r", PRODUCTS)
+    clock.now = 30
+    store.record("b", "q", "r", PRODUCTS)
+    clock.now = 61
+    assert store.get("a") is None
+    assert store.get("b") is not None
+    assert store.stats()["expired"] == 1
+
+def test_old_turns_are_compacted_into_a_summary():
+    store = ConversationStore(max_turns=2, summary_chars=200)
+    for i in range(4):
+        conversation = store.record("s", f"question {i}", f"answer {i}")
+    assert [t["query"] for t in conversation.turns] == ["question 2", "question 3"]
+    assert "question 0" in conversation.summary and "question 1" in conversation.summary
+
+    messages = conversation.history_messages(budget_tokens=1000)
+    assert messages[0]["role"] == "system" and "question 0" in messages[0]["content"]
+    assert [m["content"] for m in messages[1:]] == ["question 2", "answer 2", "question 3", "answer 3"]
+
+def test_history_respects_token_budget_keeping_newest_turns():
+    store = ConversationStore()
+    store.record("s", "old question", "x " * 400)
+    conversation = store.record("s", "new question", "short answer")
+    messages = conversation.history_messages(budget_tokens=30)
+    assert [m["content"] for m in messages] == ["new question", "short answer"]
@@ -0,0 +1,70 @@
+import threading
+from evaluation_worker import EvaluationQueue, DONE, FAILED, PENDING, SKIPPED
+
+def test_scores_are_written_back():
+    written = {}
+    q = EvaluationQueue(
+        evaluate_fn=lambda query, context, answer: {"total": len(answer)},
+        on_done=lambda session_id, scores, query: written.update({session_id: scores}),
+        workers=2,
+    )
+    q.submit("s1", "tablet", [], "abc")
+    q.submit("s2", "laptop", [], "abcdef")
+    q.join()
+
+    assert written == {"s1": {"total": 3}, "s2": {"total": 6}}
+    assert q.status("s1") == (DONE, {"total": 3})
+    assert q.stats()["completed"] == 2
+
+def test_status_is_pending_until_evaluated():
+    release = threading.Event()
+
+    def slow_evaluate(query, context, answer):
+        release.wait(5)
+        return {"total": 50}
+
+    q = EvaluationQueue(slow_evaluate, on_done=lambda *_: None, workers=1)
+    q.submit("s1", "tablet", [], "reply")
+    assert q.status("s1") == (PENDING, None)
+    release.set()
+    q.join()
+    assert q.status("s1")[0] == DONE
+
+def test_failures_are_isolated():
+    def evaluate(query, context, answer):
+        if query == "bad":
+            raise RuntimeError("boom")
+        return {"total": 10}
+
+    q = EvaluationQueue(evaluate, on_done=lambda *_: None, workers=1)
+    q.submit("bad-session", "bad", [], "x")
+    q.submit("good-session", "good", [], "x")
+    q.join()
+    assert q.status("bad-session")[0] == FAILED
+    assert q.status("good-session")[0] == DONE
+
+def test_full_queue_skips_instead_of_blocking():
+    release = threading.Event()
+    started = threading.Event()
+
+    def blocking_evaluate(query, context, answer):
+        started.set()
+        release.wait(5)
+        return {}
+
+    q = EvaluationQueue(blocking_evaluate, on_done=lambda *_: None, workers=1, max_pending=1)
+    q.submit("s1", "q", [], "x")
+    started.wait(5)                       # s1 قيد التنفيذ
+    assert q.submit("s2", "q", [], "x")   # يملأ الطابور
+    assert not q.submit("s3", "q", [], "x")
+    assert q.status("s3") == (SKIPPED, None)
+    release.set()
+    q.join()
+
+def test_tracked_statuses_are_bounded():
+    q = EvaluationQueue(lambda *a: {}, on_done=lambda *_: None, workers=1, max_tracked=3)
+    for i in range(5):
+        q.submit(f"s{i}", "q", [], "x")
+    q.join()
+    assert q.status("s0") is None
+    assert q.status("s4")[0] == DONE
@@ -0,0 +1,57 @@
+import json
+import pytest
+from fast_mode import FastModeError, build_fast_messages, parse_fast_response
+
+PRODUCTS = {
+    "iphone 15": [
+        {"title": "Apple iPhone 15 128GB", "price": "$799", "source": "A"},
+        {"title": "iPhone 15 Silicone Case", "price": "$9", "source": "B"},
+    ],
+    "galaxy s24": [{"title": "Samsung Galaxy S24", "price": "$700", "source": "C"}],
+}
+
+def build():
+    return build_fast_messages("compare iphone 15 and galaxy s24", PRODUCTS, "system")
+
+def test_prompt_lists_products_with_ids():
+    messages, catalog = build()
+    prompt = messages[1]["content"]
+    assert "1.1 | Apple iPhone 15 128GB | $799 | A" in prompt
+    assert "2.1 | Samsung Galaxy S24" in prompt
+    assert catalog["1.2"] == ("iphone 15", PRODUCTS["iphone 15"][1])
+
+def test_parse_maps_ids_back_to_products():
+    _, catalog = build()
+    reply = json.dumps({
+        "products": {"iphone 15": ["1.1", "2.1", "9.9"], "2": ["2.1"]},
+        "reply": "The iPhone is pricier.",
+        "evaluation": {"faithfulness": 90, "relevance": 85, "completeness": 80},
+    })
+    products, text, evaluation = parse_fast_response(f"```json\n{reply}\n```", PRODUCTS, catalog)
+    assert products == {"iphone 15": [PRODUCTS["iphone 15"][0]], "galaxy s24": PRODUCTS["galaxy s24"]}
+    assert text == "The iPhone is pricier."
+    assert evaluation == {"faithfulness": 90, "relevance": 85, "completeness": 80}
+
+@pytest.mark.parametrize("payload", [
+    "not json",
+    json.dumps(["a list"]),
+    json.dumps({"products": {"iphone 15": [], "galaxy s24": []}, "evaluation": {"faithfulness": 1, "relevance": 1, "completeness": 1}}),
+    json.dumps({"products": {"iphone 15": []}, "reply": "x", "evaluation": {"faithfulness": 1, "relevance": 1, "completeness": 1}}),
+    json.dumps({"products": {"iphone 15": [], "galaxy s24": []}, "reply": "x", "evaluation": {"faithfulness": "high"}}),
+    json.dumps({"products": {"pixel": []}, "reply": "x", "evaluation": {"faithfulness": 1, "relevance": 1, "completeness": 1}}),
+])
+def test_parse_rejects_documents_that_break_the_schema(payload):
+    _, catalog = build()
+    with pytest.raises(FastModeError):
+        parse_fast_response(payload, PRODUCTS, catalog)
+
+def test_failed_items_keep_their_error():
+    products = dict(PRODUCTS, tv=[{"error": "SerpAPI error 500"}])
+    messages, catalog = build_fast_messages("q", products, "system")
+    reply = json.dumps({
+        "products": {"iphone 15": ["1.1"], "galaxy s24": []},
+        "reply": "ok",
+        "evaluation": {"faithfulness": 50, "relevance": 50, "completeness": 50},
+    })
+    parsed, _, _ = parse_fast_response(reply, products, catalog)
+    assert parsed["tv"] == [{"error": "SerpAPI error 500"}]
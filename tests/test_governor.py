@@ -0,0 +1,138 @@
+import threading
+import pytest
+from governor import Governor, TokenBucket, UpstreamUnavailable, CLOSED, OPEN, HALF_OPEN
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+# ---------------- Token Bucket ----------------
+def test_token_bucket_limits_rate_and_refills(clock):
+    bucket = TokenBucket(rate=2, burst=2, clock=clock)
+    assert bucket.try_take() == 0 and bucket.try_take() == 0
+    assert bucket.try_take() == pytest.approx(0.5)
+    clock.advance(0.5)
+    assert bucket.try_take() == 0
+
+def test_token_bucket_zero_rate_is_unlimited(clock):
+    bucket = TokenBucket(rate=0, burst=1, clock=clock)
+    assert all(bucket.try_take() == 0 for _ in range(100))
+
+def test_token_bucket_pause_honours_retry_after(clock):
+    bucket = TokenBucket(rate=0, burst=1, clock=clock)
+    bucket.pause(3)
+    assert bucket.try_take() == pytest.approx(3)
+    clock.advance(3)
+    assert bucket.try_take() == 0
+
+# ---------------- Admission ----------------
+def test_wait_timeout_when_quota_exhausted(clock):
+    governor = Governor("g", rate=1, burst=1, max_wait=0, clock=clock)
+    governor.acquire()
+    with pytest.raises(UpstreamUnavailable) as exc:
+        governor.acquire()
+    assert exc.value.reason == "wait_timeout"
+    assert governor.stats()["rejected"] == {"wait_timeout": 1}
+
+def test_queue_full_rejects_immediately(clock):
+    governor = Governor("g", max_concurrency=1, max_queue=0, clock=clock)
+    governor.acquire()
+    with pytest.raises(UpstreamUnavailable) as exc:
+        governor.acquire()
+    assert exc.value.reason == "queue_full"
+
+def test_waiter_is_admitted_when_slot_frees():
+    governor = Governor("g", max_concurrency=1, max_wait=5)
+    governor.acquire()
+    admitted = threading.Event()
+
+    def waiter():
+        governor.acquire()
+        admitted.set()
+
+    thread = threading.Thread(target=waiter)
+    thread.start()
+    assert not admitted.wait(0.1)
+    governor.release("ok")
+    assert admitted.wait(2)
+    thread.join()
+    assert governor.stats()["in_flight"] == 1
+
+# ---------------- Adaptive Concurrency (AIMD) ----------------
+def test_limit_halves_on_throttle_and_grows_additively(clock):
+    governor = Governor("g", max_concurrency=8, failure_threshold=100, clock=clock)
+    governor.acquire()
+    governor.release("throttled")
+    assert governor.limit == 4
+    governor.acquire()
+    governor.release("error")
+    assert governor.limit == 2
+    for _ in range(4):
+        governor.acquire()
+        governor.release("ok")
+    assert 3 < governor.limit < 4
+    assert governor.stats()["throttled"] == 1 and governor.stats()["errors"] == 1
+
+def test_limit_never_drops_below_minimum(clock):
+    governor = Governor("g", max_concurrency=4, min_concurrency=1, failure_threshold=100, clock=clock)
+    for _ in range(10):
+        governor.acquire()
+        governor.release("error")
+    assert governor.limit == 1
+
+# ---------------- Circuit Breaker ----------------
+def trip(governor):
+    for _ in range(governor.failure_threshold):
+        governor.acquire()
+        governor.release("error")
+
+def test_breaker_opens_and_fails_fast(clock):
+    governor = Governor("g", failure_threshold=3, open_seconds=30, clock=clock)
+    trip(governor)
+    assert governor.state == OPEN
+    clock.advance(10)
+    with pytest.raises(UpstreamUnavailable) as exc:
+        governor.acquire()
+    assert exc.value.reason == "circuit_open"
+    assert exc.value.retry_after == pytest.approx(20)
+
+def test_half_open_probe_closes_on_success(clock):
+    governor = Governor("g", failure_threshold=2, open_seconds=5, clock=clock)
+    trip(governor)
+    clock.advance(5)
+    governor.acquire()
+    assert governor.state == HALF_OPEN
+    # طلب تجريبي واحد فقط أثناء نصف الفتح
+    with pytest.raises(UpstreamUnavailable) as exc:
+        governor.acquire()
+    assert exc.value.reason == "circuit_half_open"
+    governor.release("ok")
+    assert governor.state == CLOSED
+    governor.acquire()
+
+def test_half_open_probe_failure_reopens(clock):
+    governor = Governor("g", failure_threshold=2, open_seconds=5, clock=clock)
+    trip(governor)
+    clock.advance(5)
+    governor.acquire()
+    governor.release("error")
+    assert governor.state == OPEN
+    assert governor.stats()["opened"] == 2
+
+def test_reset_closes_breaker_and_restores_limit(clock):
+    governor = Governor("g", max_concurrency=8, failure_threshold=2, clock=clock)
+    trip(governor)
+    governor.reset()
+    stats = governor.stats()
+    assert stats["state"] == CLOSED and stats["concurrency_limit"] == 8
+    governor.acquire()
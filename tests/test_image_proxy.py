@@ -0,0 +1,159 @@
+import os
+import types
+from io import BytesIO
+from unittest.mock import patch
+import pytest
+from PIL import Image
+from image_proxy import (
+    DiskImageCache, ImageProxy, ImageProxyError, is_allowed_url, make_thumbnail, proxy_url, verify_signature,
+)
+
+def image_bytes(size=(1200, 800), mode="RGB", fmt="JPEG"):
+    out = BytesIO()
+    Image.new(mode, size, (200, 100, 50) if mode == "RGB" else (200, 100, 50, 128)).save(out, format=fmt)
+    return out.getvalue()
+
+# cdn.example.com عنوان عام، وinternal.example.com يشير إلى عنوان داخلي
+HOSTS = {"cdn.example.com": ["93.184.216.34"], "internal.example.com": ["169.254.169.254"]}
+
+def fake_resolve(hostname, port):
+    if hostname in HOSTS:
+        return HOSTS[hostname]
+    if hostname.replace(".", "").isdigit():
+        return [hostname]
+    raise OSError("unknown host")
+
+class FakeClient:
+    def __init__(self, data, status_code=200, redirects=None):
+        self.data = data
+        self.status_code = status_code
+        self.redirects = dict(redirects or {})
+        self.calls = 0
+        self.urls = []
+
+    def get(self, url, **kwargs):
+        assert kwargs.get("allow_redirects") is False
+        self.calls += 1
+        self.urls.append(url)
+        if url in self.redirects:
+            return types.SimpleNamespace(status_code=302, headers={"Location": self.redirects[url]}, close=lambda: None)
+        return types.SimpleNamespace(
+            status_code=self.status_code,
+            headers={},
+            iter_content=lambda size: iter([self.data[i:i + size] for i in range(0, len(self.data), size)]),
+            close=lambda: None,
+        )
+
+# ---------------- Thumbnails ----------------
+def test_make_thumbnail_resizes_and_keeps_aspect():
+    data, ext = make_thumbnail(image_bytes(), size=300)
+    assert ext == ".jpg"
+    assert Image.open(BytesIO(data)).size == (300, 200)
+
+def test_make_thumbnail_keeps_transparency_as_png():
+    data, ext = make_thumbnail(image_bytes(mode="RGBA", fmt="PNG"), size=100)
+    assert ext == ".png"
+
+def test_make_thumbnail_rejects_non_images():
+    with pytest.raises(ImageProxyError):
+        make_thumbnail(b"<html>blocked</html>")
+
+# ---------------- URL checks / signatures ----------------
+def test_only_public_http_urls_are_allowed():
+    assert is_allowed_url("https://cdn.example.com/a.jpg", resolve=fake_resolve)
+    assert not is_allowed_url("file:///etc/passwd", resolve=fake_resolve)
+    assert not is_allowed_url("http://127.0.0.1/a.jpg", resolve=fake_resolve)
+    assert not is_allowed_url("http://10.0.0.5/a.jpg", resolve=fake_resolve)
+    assert not is_allowed_url("http://localhost/a.jpg")
+    assert is_allowed_url("http://127.0.0.1/a.jpg", allow_private=True)
+
+def test_hostnames_resolving_to_private_addresses_are_rejected():
+    assert not is_allowed_url("http://internal.example.com/latest/meta-data", resolve=fake_resolve)
+    assert not is_allowed_url("http://unknown.example.com/a.jpg", resolve=fake_resolve)
+
+def test_signed_proxy_urls():
+    url = "https://cdn.example.com/a.jpg"
+    assert proxy_url(url, secret="") == "/img?url=https%3A%2F%2Fcdn.example.com%2Fa.jpg"
+    signed = proxy_url(url, secret="s3cret")
+    sig = signed.split("sig=")[1]
+    assert verify_signature(url, sig, secret="s3cret")
+    assert not verify_signature(url, "bad", secret="s3cret")
+    assert not verify_signature(url, None, secret="s3cret")
+    # بدون سر لا يُقبل أي رابط، موقعًا كان أو لا
+    assert not verify_signature(url, None, secret="")
+    assert not verify_signature(url, sig, secret="")
+
+def test_urls_are_signed_with_the_configured_secret():
+    url = "https://cdn.example.com/a.jpg"
+    with patch("image_proxy.IMAGE_PROXY_SECRET", "shared"):
+        signed = proxy_url(url)
+        assert "sig=" in signed
+        assert not verify_signature(url, None)
+    # عملية أخرى بنفس IMAGE_PROXY_SECRET تقبل الرابط
+    assert verify_signature(url, signed.split("sig=")[1], secret="shared")
+# ---------------- Disk cache ----------------
+def test_disk_cache_evicts_least_recently_used(tmp_path):
+    cache = DiskImageCache(str(tmp_path), max_bytes=25)
+    cache.set("a", b"x" * 10, ".jpg")
+    cache.set("b", b"y" * 10, ".jpg")
+    assert cache.get("a") == (b"x" * 10, ".jpg")  # a أحدث استخدامًا الآن
+    cache.set("c", b"z" * 10, ".png")
+
+    assert cache.get("b") is None
+    assert cache.get("a") is not None and cache.get("c") == (b"z" * 10, ".png")
+    assert not os.path.exists(tmp_path / "b.jpg")
+    assert cache.stats()["evictions"] == 1 and cache.stats()["bytes"] == 20
+
+def test_disk_cache_survives_restart(tmp_path):
+    DiskImageCache(str(tmp_path), max_bytes=100).set("a", b"data", ".jpg")
+    reopened = DiskImageCache(str(tmp_path), max_bytes=100)
+    assert reopened.get("a") == (b"data", ".jpg")
+    assert reopened.stats()["bytes"] == 4
+
+# ---------------- Proxy ----------------
+def test_proxy_fetches_each_image_once(tmp_path):
+    client = FakeClient(image_bytes())
+    proxy = ImageProxy(client, DiskImageCache(str(tmp_path)), size=150, resolve=fake_resolve)
+    first = proxy.get("https://cdn.example.com/a.jpg")
+    second = proxy.get("https://cdn.example.com/a.jpg")
+
+    assert client.calls == 1
+    assert first == second
+    data, content_type, etag = first
+    assert content_type == "image/jpeg" and etag.startswith('"')
+    assert max(Image.open(BytesIO(data)).size) == 150
+
+def test_proxy_reports_upstream_errors(tmp_path):
+    proxy = ImageProxy(FakeClient(b"", status_code=404), DiskImageCache(str(tmp_path)), resolve=fake_resolve)
+    with pytest.raises(ImageProxyError) as info:
+        proxy.get("https://cdn.example.com/missing.jpg")
+    assert info.value.status_code == 502 and "404" not in info.value.detail
+
+def test_proxy_rejects_oversized_sources(tmp_path):
+    proxy = ImageProxy(FakeClient(image_bytes()), DiskImageCache(str(tmp_path)), max_source_bytes=100,
+                       resolve=fake_resolve)
+    with pytest.raises(ImageProxyError, match="too large"):
+        proxy.get("https://cdn.example.com/big.jpg")
+
+def test_proxy_follows_public_redirects_only(tmp_path):
+    client = FakeClient(image_bytes(), redirects={
+        "https://cdn.example.com/a.jpg": "/b.jpg",
+        "https://cdn.example.com/evil.jpg": "http://169.254.169.254/latest/meta-data",
+        "https://cdn.example.com/alias.jpg": "http://internal.example.com/x",
+    })
+    proxy = ImageProxy(client, DiskImageCache(str(tmp_path)), resolve=fake_resolve)
+    proxy.get("https://cdn.example.com/a.jpg")
+    assert client.urls == ["https://cdn.example.com/a.jpg", "https://cdn.example.com/b.jpg"]
+
+    for url in ("https://cdn.example.com/evil.jpg", "https://cdn.example.com/alias.jpg"):
+        with pytest.raises(ImageProxyError) as info:
+            proxy.get(url)
+        assert info.value.status_code == 400
+    assert len(client.urls) == 4
+
+def test_proxy_stops_redirect_loops(tmp_path):
+    client = FakeClient(image_bytes(), redirects={"https://cdn.example.com/loop.jpg": "/loop.jpg"})
+    proxy = ImageProxy(client, DiskImageCache(str(tmp_path)), max_redirects=2, resolve=fake_resolve)
+    with pytest.raises(ImageProxyError, match="redirects"):
+        proxy.get("https://cdn.example.com/loop.jpg")
+    assert client.calls == 3
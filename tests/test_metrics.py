@@ -0,0 +1,70 @@
+import pytest
+from metrics import Registry, RequestTimings, STAGE_SECONDS, parse_server_timing
+
+# ---------------- Counters / Histograms ----------------
+def test_counter_render_with_labels():
+    registry = Registry()
+    counter = registry.counter("requests_total", "Requests.", ["status", "lang"])
+    counter.inc(status="ok", lang="ar")
+    counter.inc(2, status="ok", lang="ar")
+    counter.inc(status="error", lang="en")
+
+    text = registry.render()
+    assert "# TYPE requests_total counter" in text
+    assert 'requests_total{status="ok",lang="ar"} 3' in text
+    assert 'requests_total{status="error",lang="en"} 1' in text
+
+def test_histogram_buckets_are_cumulative():
+    registry = Registry()
+    hist = registry.histogram("latency_seconds", "Latency.", ["stage"], buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 2.0):
+        hist.observe(value, stage="reply")
+
+    text = registry.render()
+    assert 'latency_seconds_bucket{stage="reply",le="0.1"} 1' in text
+    assert 'latency_seconds_bucket{stage="reply",le="1.0"} 2' in text
+    assert 'latency_seconds_bucket{stage="reply",le="+Inf"} 3' in text
+    assert 'latency_seconds_count{stage="reply"} 3' in text
+    assert 'latency_seconds_sum{stage="reply"} 2.55' in text
+
+def test_gauge_collects_at_render_time():
+    registry = Registry()
+    state = {"depth": 1}
+    registry.gauge("queue_depth", "Depth.", [], lambda: {(): state["depth"]})
+    state["depth"] = 7
+    assert "queue_depth 7" in registry.render()
+
+def test_label_values_are_escaped():
+    registry = Registry()
+    registry.counter("c", "C.", ["q"]).inc(q='say "hi"\n')
+    assert 'c{q="say \\"hi\\"\\n"} 1' in registry.render()
+
+# ---------------- Request Timings ----------------
+def test_request_timings_server_timing_header():
+    timings = RequestTimings(lang="ar")
+    timings.record("serpapi", 0.010)
+    timings.record("serpapi", 0.030)
+    timings.record("reply", 0.5)
+
+    header = timings.server_timing()
+    assert header == 'serpapi;dur=30.00;desc="max of 2", reply;dur=500.00'
+    assert parse_server_timing(header) == {"serpapi": 30.0, "reply": 500.0}
+    assert timings.as_dict() == {"serpapi": 30.0, "reply": 500.0}
+
+def test_request_timings_stage_records_errors():
+    timings = RequestTimings(lang="en")
+    before = STAGE_SECONDS.count(stage="unit-test-stage", status="error", lang="en")
+    with pytest.raises(ValueError):
+        with timings.stage("unit-test-stage"):
+            raise ValueError("boom")
+    assert STAGE_SECONDS.count(stage="unit-test-stage", status="error", lang="en") == before + 1
+    assert "unit-test-stage" in timings.as_dict()
+
+def test_request_timings_merge_skips_histogram():
+    leader = RequestTimings(lang="en")
+    leader.record("unit-test-merge", 0.2)
+    follower = RequestTimings(lang="en")
+    before = STAGE_SECONDS.count(stage="unit-test-merge", status="ok", lang="en")
+    follower.merge(leader.snapshot())
+    assert follower.as_dict() == {"unit-test-merge": 200.0}
+    assert STAGE_SECONDS.count(stage="unit-test-merge", status="ok", lang="en") == before
@@ -0,0 +1,52 @@
+import pytest
+from pagination import CursorError, decode_cursor, encode_cursor, first_page_cursors, next_page
+
+def test_cursor_round_trip_and_validation():
+    cursor = encode_cursor("ايفون 15", "ايفون 15 برو", 20, 3)
+    assert decode_cursor(cursor) == {"q": "ايفون 15", "m": "ايفون 15 برو", "s": 20, "k": 3}
+    for bad in ["not-a-cursor!", encode_cursor("", "x"), "eyJxIjoxfQ"]:
+        with pytest.raises(CursorError):
+            decode_cursor(bad)
+
+def test_first_page_cursors_follow_the_plan():
+    plan = {"fetches": [{"query": "iphone 15", "items": ["iphone 15", "iphone 15 pro"]}, {"query": "bad", "items": ["bad"]}]}
+    products = {"iphone 15": [{"title": "a"}], "iphone 15 pro": [], "bad": [{"error": "SerpAPI error 500"}]}
+    cursors = first_page_cursors(plan, products, page_size=5)
+    assert decode_cursor(cursors["iphone 15 pro"]) == {"q": "iphone 15", "m": "iphone 15 pro", "s": 0, "k": 5}
+    assert cursors["bad"] is None
+
+def test_first_page_cursors_start_fresh_for_catalog_served_fetches():
+    plan = {"fetches": [{"query": "tablet", "items": ["tablet"]}, {"query": "laptop", "items": ["laptop"]}]}
+    products = {"tablet": [{"title": "a"}], "laptop": [{"title": "b"}]}
+    cursors = first_page_cursors(plan, products, page_size=5, from_serpapi=lambda q: q == "tablet")
+    assert decode_cursor(cursors["tablet"])["k"] == 5
+    assert decode_cursor(cursors["laptop"])["k"] == 0
+
+def pages(*sizes):
+    data, start = {}, 0
+    for size in sizes:
+        data[start] = [f"p{start + i}" for i in range(size)]
+        start += size
+    return data
+
+def test_next_page_continues_within_loaded_page():
+    data = pages(20, 0)
+    loaded = []
+    load = lambda start: loaded.append(start) or data.get(start, [])
+    products, cursor = next_page({"q": "q", "m": "q", "s": 0, "k": 5}, 10, load, lambda r: r)
+    assert products == [f"p{i}" for i in range(5, 15)]
+    assert decode_cursor(cursor)["k"] == 15 and loaded == [0]
+
+def test_next_page_fetches_following_serp_page_only_when_needed():
+    data = pages(20, 20, 0)
+    loaded = []
+    load = lambda start: loaded.append(start) or data.get(start, [])
+    products, cursor = next_page({"q": "q", "m": "q", "s": 0, "k": 15}, 10, load, lambda r: r)
+    assert products == [f"p{i}" for i in range(15, 25)]
+    assert loaded == [0, 20]
+    assert decode_cursor(cursor) == {"q": "q", "m": "q", "s": 20, "k": 5}
+
+def test_next_page_ends_on_empty_serp_page():
+    data = pages(20)
+    products, cursor = next_page({"q": "q", "m": "q", "s": 0, "k": 18}, 10, lambda s: data.get(s, []), lambda r: r)
+    assert products == ["p18", "p19"] and cursor is None
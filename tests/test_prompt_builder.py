@@ -0,0 +1,45 @@
+from prompt_builder import (
+    CONTEXT_SLOT, build_context, build_grouped_context, dedupe_products, estimate_messages_tokens,
+    estimate_tokens, fill_context, truncate_title,
+)
+
+def test_estimate_tokens_counts_arabic_denser():
+    assert estimate_tokens("") == 0
+    assert estimate_tokens("abcd" * 10) == 10
+    assert estimate_tokens("مرحبا" * 4) == 10
+
+def test_truncate_title_on_word_boundary():
+    assert truncate_title("Short title") == "Short title"
+    assert truncate_title("Apple iPhone 15 Pro Max", max_chars=16) == "Apple iPhone 15…"
+    assert truncate_title(None) == ""
+
+def test_dedupe_products_keeps_first_of_near_duplicates():
+    products = [
+        {"title": "Apple iPhone 15 128GB Black", "price": "$799"},
+        {"title": "Apple iPhone 15 128GB - Black", "price": "$789"},
+        {"title": "Apple iPhone 15 Pro 256GB", "price": "$999"},
+        {"error": "SerpAPI error"},
+    ]
+    kept = dedupe_products(products)
+    assert [p.get("price") for p in kept] == ["$799", "$999", None]
+
+def test_build_context_stops_at_budget():
+    products = [{"title": f"Product number {i}", "price": "$1", "source": "S"} for i in range(50)]
+    text = build_context(products, budget_tokens=40, numbered=True)
+    assert text.startswith("1. Product number 0 | $1 | S\n")
+    assert estimate_tokens(text) <= 40
+    assert text.count("\n") < 50
+
+def test_grouped_context_splits_budget_between_items():
+    products = {name: [{"title": f"{name} {i}", "price": "$1", "source": "S"} for i in range(100)] for name in ("a", "b")}
+    text = build_grouped_context(products, 100, "\n[{name}]\n")
+    assert "[a]" in text and "[b]" in text
+    assert "b 0" in text
+
+def test_fill_context_respects_input_budget():
+    prompt = f"Question: what?\nData:\n{CONTEXT_SLOT}\n"
+    products = [{"title": f"Item {i}", "price": "$1", "source": "S"} for i in range(500)]
+    filled = fill_context("system", prompt, lambda budget: build_context(products, budget), input_budget=200)
+    messages = [{"role": "system", "content": "system"}, {"role": "user", "content": filled}]
+    assert CONTEXT_SLOT not in filled
+    assert estimate_messages_tokens(messages) <= 200
@@ -0,0 +1,45 @@
+import pytest
+from query_planner import plan_query, split_items
+
+@pytest.mark.parametrize("query,expected", [
+    ("compare iphone 15 and galaxy s24", ["iphone 15", "galaxy s24"]),
+    ("sandals for android users", ["sandals for android users"]),
+    ("Galaxy S24+ vs. Pixel 8", ["Galaxy S24+", "Pixel 8"]),
+    ("ps5 versus xbox series x", ["ps5", "xbox series x"]),
+    ("what is the difference between ps5 and xbox?", ["ps5", "xbox"]),
+    ("black or white iphone", ["black or white iphone"]),
+    ("AT&T phone", ["AT&T phone"]),
+    ("ايفون 15 و سامسونج s24", ["ايفون 15", "سامسونج s24"]),
+    ("قارن بين ايفون 15 وسامسونج s24", ["ايفون 15", "سامسونج s24"]),
+    ("سماعات وايرلس مقابل سلكية", ["سماعات وايرلس", "سلكية"]),
+    ("سماعات وايرلس", ["سماعات وايرلس"]),
+    ("قارن سماعات وايرلس", ["سماعات وايرلس"]),
+    ("مقارنة بين سماعات وايرلس وسماعات سلكية", ["سماعات وايرلس", "سماعات سلكية"]),
+    ("قارن شاحن 20 واط وشاحن 65 واط", ["شاحن 20 واط", "شاحن 65 واط"]),
+    ("قارن ايفون 15 وجالكسي s24 و بيكسل 8", ["ايفون 15", "جالكسي s24", "بيكسل 8"]),
+    ("قارن لابتوب 16gb وتابلت 8gb", ["لابتوب 16gb", "تابلت 8gb"]),
+])
+def test_split_items_on_word_boundaries(query, expected):
+    assert split_items(query) == expected
+
+def test_plan_dedupes_normalized_items():
+    plan = plan_query("iphone 15 and IPhone  15 and galaxy")
+    assert plan["items"] == ["iphone 15", "galaxy"]
+    assert len(plan["fetches"]) == 2
+
+def test_plan_keeps_plus_models_distinct():
+    plan = plan_query("Galaxy S24+ vs Galaxy S24")
+    assert plan["items"] == ["Galaxy S24+", "Galaxy S24"]
+    assert plan["fetches"] == [{"query": "Galaxy S24", "items": ["Galaxy S24+", "Galaxy S24"]}]
+    assert plan_query("galaxy s24+ and Galaxy S24 Plus")["items"] == ["galaxy s24+"]
+
+def test_plan_reuses_one_fetch_for_overlapping_items():
+    plan = plan_query("compare iphone 15 and iphone 15 pro and pixel 8")
+    assert plan["items"] == ["iphone 15", "iphone 15 pro", "pixel 8"]
+    assert plan["fetches"] == [
+        {"query": "iphone 15", "items": ["iphone 15", "iphone 15 pro"]},
+        {"query": "pixel 8", "items": ["pixel 8"]},
+    ]
+
+def test_plan_for_single_item():
+    assert plan_query("laptop") == {"items": ["laptop"], "fetches": [{"query": "laptop", "items": ["laptop"]}]}
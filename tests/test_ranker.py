@@ -0,0 +1,64 @@
+import pytest
+from ranker import normalize_text, tokenize, parse_price, rank_products
+
+# ---------------- Normalization ----------------
+@pytest.mark.parametrize("text,expected", [
+    ("Apple iPhone-15, 128GB!", "apple iphone 15 128gb"),
+    ("أَيْفُون", "ايفون"),
+    ("إيفون", "ايفون"),
+    ("سماعـــة", "سماعه"),
+    ("مستشفى", "مستشفي"),
+    ("١٥ برو", "15 برو"),
+    ("", ""),
+    (None, ""),
+])
+def test_normalize_text(text, expected):
+    assert normalize_text(text) == expected
+
+def test_tokenize_drops_bilingual_stopwords():
+    assert tokenize("compare the iPhone 15 and Galaxy") == ["iphone", "15", "galaxy"]
+    assert tokenize("قارن بين ايفون و سامسونج") == ["ايفون", "سامسونج"]
+
+@pytest.mark.parametrize("price,expected", [
+    ("$799.00", 799.0),
+    ("SAR 3,499", 3499.0),
+    ("٣٬٤٩٩ ر.س", 3499.0),
+    (120, 120.0),
+    ("N/A", None),
+    (None, None),
+])
+def test_parse_price(price, expected):
+    assert parse_price(price) == expected
+
+# ---------------- Ranking ----------------
+PRODUCTS = [
+    {"title": "Samsung Galaxy S24", "price": "$700", "source": "Store C"},
+    {"title": "Apple iPhone 15 128GB", "price": "$799", "source": "Store A"},
+    {"title": "iPhone 14", "price": "$600", "source": "Store B"},
+    {"title": "Apple iPhone 15 Pro", "price": "$999", "source": "N/A"},
+]
+
+def test_rank_products_keeps_ambiguous_and_drops():
+    ranking = rank_products("iphone 15", PRODUCTS)
+    kept_titles = [p["title"] for p in ranking["kept"]]
+    assert kept_titles[0] == "Apple iPhone 15 128GB"
+    assert "Apple iPhone 15 Pro" in kept_titles
+    assert [p["title"] for p in ranking["ambiguous"]] == ["iPhone 14"]
+    assert [p["title"] for p in ranking["dropped"]] == ["Samsung Galaxy S24"]
+
+def test_rank_products_arabic_query_matches_variants():
+    products = [{"title": "آيفون ١٥ برو", "price": "4,999 ر.س", "source": "جرير"},
+                {"title": "سامسونج جالكسي", "price": "3,000 ر.س", "source": "اكسترا"}]
+    ranking = rank_products("ايفون 15", products)
+    assert [p["title"] for p in ranking["kept"]] == ["آيفون ١٥ برو"]
+
+def test_rank_products_penalizes_cheap_accessories():
+    products = [{"title": "iPhone 15 case", "price": "$9", "source": "S"},
+                {"title": "iPhone 15", "price": "$799", "source": "S"},
+                {"title": "iPhone 15", "price": "$780", "source": "S"}]
+    ranking = rank_products("iphone 15", products)
+    assert ranking["kept"][-1]["title"] == "iPhone 15 case"
+
+def test_rank_products_without_query_terms_keeps_everything():
+    assert rank_products("the and or", PRODUCTS)["kept"] == PRODUCTS
+    assert rank_products("iphone", [])["kept"] == []
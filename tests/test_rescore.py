@@ -0,0 +1,112 @@
+import json
+import threading
+import pytest
+from session_store import SessionStore
+from rescore import RateLimiter, rescore_sessions, load_checkpoint
+
+@pytest.fixture
+def store(tmp_path):
+    store = SessionStore(str(tmp_path / "sessions.db"))
+    for i in range(10):
+        store.save({"session_id": f"s{i}", "query": f"q{i}", "products": [{"title": f"P{i}"}],
+                    "ai_reply": f"reply {i}", "evaluation_score": {"total": 10}})
+    return store
+
+def read_jsonl(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+def test_rescore_writes_results_in_order(store, tmp_path):
+    output = tmp_path / "out.jsonl"
+    summary = rescore_sessions(store, lambda q, ctx, ans: {"total": int(q[1:]) * 10}, str(output),
+                               concurrency=3, rate=0)
+
+    records = read_jsonl(output)
+    assert summary["processed"] == 10
+    assert [r["id"] for r in records] == list(range(1, 11))
+    assert records[3]["evaluation_score"] == {"total": 30}
+    assert records[3]["previous_score"] == {"total": 10}
+
+def test_rescore_resumes_from_checkpoint(store, tmp_path):
+    output = tmp_path / "out.jsonl"
+    checkpoint = tmp_path / "ckpt.json"
+    evaluate = lambda q, ctx, ans: {"total": 50}
+
+    first = rescore_sessions(store, evaluate, str(output), str(checkpoint), concurrency=2, rate=0, limit=4)
+    assert first["processed"] == 4
+    assert load_checkpoint(str(checkpoint)) == 4
+
+    second = rescore_sessions(store, evaluate, str(output), str(checkpoint), concurrency=2, rate=0)
+    assert second["processed"] == 6
+    assert [r["id"] for r in read_jsonl(output)] == list(range(1, 11))
+
+def test_rescore_write_back_and_failures(store, tmp_path):
+    def evaluate(q, ctx, ans):
+        if q == "q2":
+            raise RuntimeError("rate limited")
+        return {"total": 90}
+
+    summary = rescore_sessions(store, evaluate, str(tmp_path / "out.jsonl"), rate=0, write_back=True)
+
+    assert summary["failed"] == 1
+    assert store.get_by_query("q1")["evaluation_score"] == {"total": 90}
+    assert store.get_by_query("q2")["evaluation_score"] == {"total": 10}
+
+def test_checkpoint_stops_before_first_failure(store, tmp_path):
+    checkpoint = tmp_path / "ckpt.json"
+    fail = {"q3"}
+
+    def evaluate(q, ctx, ans):
+        if q in fail:
+            raise RuntimeError("429")
+        return {"total": 70}
+
+    first = rescore_sessions(store, evaluate, str(tmp_path / "out.jsonl"), str(checkpoint), concurrency=2, rate=0)
+    assert first["processed"] == 10 and first["failed"] == 1
+    assert first["last_id"] == 3 and load_checkpoint(str(checkpoint)) == 3  # q3 هو id 4
+
+    fail.clear()
+    second = rescore_sessions(store, evaluate, str(tmp_path / "out.jsonl"), str(checkpoint), concurrency=2, rate=0)
+    assert second["start_id"] == 3 and second["processed"] == 7 and second["last_id"] == 10
+
+def test_strict_llm_evaluation_failures_are_not_written_back(store, tmp_path):
+    import app as app_module
+    from unittest.mock import patch
+    evaluate = lambda q, ctx, ans: app_module.evaluate_accuracy_llm(q, ctx, ans, strict=True, fresh=True)
+    with patch("app.call_groq", side_effect=RuntimeError("Groq API error 429")):
+        summary = rescore_sessions(store, evaluate, str(tmp_path / "out.jsonl"), str(tmp_path / "c.json"),
+                                   rate=0, write_back=True, limit=2)
+    assert summary["failed"] == 2 and summary["last_id"] == 0
+    assert store.get_by_query("q0")["evaluation_score"] == {"total": 10}
+    assert all("429" in r["error"] for r in read_jsonl(tmp_path / "out.jsonl"))
+
+    with patch("app.call_groq", return_value="not json"):
+        with pytest.raises(ValueError):
+            app_module.evaluate_accuracy_llm("q", [{"title": "P"}], "answer", strict=True)
+        assert app_module.evaluate_accuracy_llm("q", [{"title": "P"}], "answer")["total"] == 10
+
+def test_rescore_bounds_in_flight_calls(store, tmp_path):
+    lock = threading.Lock()
+    state = {"current": 0, "peak": 0}
+
+    def evaluate(q, ctx, ans):
+        with lock:
+            state["current"] += 1
+            state["peak"] = max(state["peak"], state["current"])
+        with lock:
+            state["current"] -= 1
+        return {}
+
+    rescore_sessions(store, evaluate, str(tmp_path / "out.jsonl"), concurrency=2, rate=0)
+    assert state["peak"] <= 2
+
+def test_rate_limiter_spaces_calls(monkeypatch):
+    clock = {"now": 100.0}
+    sleeps = []
+    monkeypatch.setattr("rescore.time.monotonic", lambda: clock["now"])
+    monkeypatch.setattr("rescore.time.sleep", lambda s: sleeps.append(s))
+
+    limiter = RateLimiter(rate=2)
+    for _ in range(3):
+        limiter.acquire()
+    assert sleeps == [0.5, 1.0]
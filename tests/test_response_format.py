@@ -0,0 +1,56 @@
+import gzip
+import json
+import pytest
+import response_format
+from response_format import FieldSelectionError, compact_session, dumps, encode_body, select_fields
+
+SESSION = {
+    "session_id": "s1",
+    "query": "tablet",
+    "products": [{"title": "Tab A", "price": "$1", "source": "S", "link": "https://s/a", "image": None}],
+    "products_by_item": {
+        "tablet": [{"title": "Tab A", "price": "$1", "source": "S", "link": "https://s/a", "image": None}],
+        "bad": [{"error": "SerpAPI error 500"}],
+    },
+    "ai_reply": "Tab A",
+    "evaluation_score": {"total": 80},
+    "evaluation_status": "done",
+    "timings": {"total": 1.2},
+    "cursors": {"tablet": "c1", "bad": None},
+    "mode": "standard",
+}
+
+def test_compact_drops_duplicates_and_empty_fields():
+    compact = compact_session(SESSION)
+    assert set(compact) == {"session_id", "query", "ai_reply", "products_by_item", "cursors", "mode"}
+    assert compact["products_by_item"]["tablet"] == [{"title": "Tab A", "price": "$1", "source": "S", "link": "https://s/a"}]
+
+def test_select_fields_with_product_subfields():
+    selected = select_fields(SESSION, "ai_reply, products_by_item.title,products_by_item.price")
+    assert selected == {
+        "ai_reply": "Tab A",
+        "products_by_item": {"tablet": [{"title": "Tab A", "price": "$1"}], "bad": [{"error": "SerpAPI error 500"}]},
+    }
+    assert select_fields(compact_session(SESSION), "products,ai_reply") == {"ai_reply": "Tab A"}
+
+@pytest.mark.parametrize("fields", ["nope", "ai_reply.title", " , "])
+def test_invalid_fields_are_rejected(fields):
+    with pytest.raises(FieldSelectionError):
+        select_fields(SESSION, fields)
+
+def test_dumps_falls_back_to_json(monkeypatch):
+    fast = dumps({"q": "ايفون"})
+    monkeypatch.setattr(response_format, "orjson", None)
+    assert json.loads(dumps({"q": "ايفون"})) == json.loads(fast) == {"q": "ايفون"}
+
+def test_encode_body_compresses_only_above_threshold(monkeypatch):
+    monkeypatch.setattr(response_format, "brotli", None)
+    small, headers = encode_body(b"{}", "gzip, br", min_bytes=100)
+    assert small == b"{}" and "Content-Encoding" not in headers
+
+    body = dumps(SESSION) * 20
+    compressed, headers = encode_body(body, "br;q=1.0, gzip", min_bytes=100)
+    assert headers["Content-Encoding"] == "gzip" and gzip.decompress(compressed) == body
+
+    plain, headers = encode_body(body, "identity", min_bytes=100)
+    assert plain == body and headers == {"Vary": "Accept-Encoding"}
@@ -0,0 +1,164 @@
+import json
+import threading
+import pytest
+from session_store import SessionStore, migrate_json, main
+
+@pytest.fixture
+def store(tmp_path):
+    store = SessionStore(str(tmp_path / "sessions.db"))
+    yield store
+    store.close()
+
+def make_session(query, session_id="s1", reply="reply"):
+    return {"session_id": session_id, "query": query, "products": [], "ai_reply": reply,
+            "evaluation_score": {"total": 50}}
+
+# ---------------- Save / Replace ----------------
+def test_save_assigns_incrementing_ids(store):
+    first = make_session("tablet")
+    second = make_session("laptop")
+    assert store.save(first) == 1
+    assert store.save(second) == 2
+    assert first["id"] == 1 and second["id"] == 2
+
+def test_same_query_replaces_entry_and_keeps_id(store):
+    store.save(make_session("tablet", session_id="s1", reply="old"))
+    store.save(make_session("laptop", session_id="s2"))
+    store.save(make_session("tablet", session_id="s3", reply="new"))
+
+    assert store.count() == 2
+    saved = store.get_by_query("tablet")
+    assert saved["id"] == 1
+    assert saved["ai_reply"] == "new"
+    assert saved["session_id"] == "s3"
+
+def test_get_by_session_id(store):
+    store.save(make_session("tablet", session_id="abc"))
+    assert store.get_by_session_id("abc")["query"] == "tablet"
+    assert store.get_by_session_id("missing") is None
+
+def test_iter_sessions_in_batches(store):
+    for i in range(7):
+        store.save(make_session(f"q{i}"))
+    queries = [s["query"] for s in store.iter_sessions(batch_size=3)]
+    assert queries == [f"q{i}" for i in range(7)]
+    assert [s["id"] for s in store.iter_sessions(after_id=5)] == [6, 7]
+
+# ---------------- Concurrent Writers ----------------
+def test_concurrent_writers_do_not_lose_data(tmp_path):
+    path = str(tmp_path / "sessions.db")
+    SessionStore(path).count()  # إنشاء الجدول
+
+    def writer(worker):
+        own = SessionStore(path)  # اتصال مستقل كما في عملية uvicorn منفصلة
+        for i in range(25):
+            own.save(make_session(f"w{worker}-q{i}", session_id=f"w{worker}"))
+            own.save(make_session("shared", session_id=f"w{worker}"))
+        own.close()
+
+    threads = [threading.Thread(target=writer, args=(w,)) for w in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    store = SessionStore(path)
+    assert store.count() == 4 * 25 + 1
+    assert store.get_by_query("shared") is not None
+
+# ---------------- Migration ----------------
+def test_migrate_json(tmp_path, store):
+    legacy = tmp_path / "data_shopping.json"
+    legacy.write_text(json.dumps([
+        {"id": 1, **make_session("tablet", reply="first")},
+        {"id": 2, **make_session("laptop")},
+        {**make_session("tablet", reply="replaced")},
+    ], ensure_ascii=False), encoding="utf-8")
+
+    assert migrate_json(str(legacy), store) == 3
+    assert store.count() == 2
+    assert store.get_by_query("tablet")["ai_reply"] == "replaced"
+
+def test_migrate_cli(tmp_path, capsys):
+    legacy = tmp_path / "data_shopping.json"
+    legacy.write_text(json.dumps([make_session("هاتف")], ensure_ascii=False), encoding="utf-8")
+    db = tmp_path / "out.db"
+
+    main(["migrate", str(legacy), "--db", str(db)])
+
+    assert "Migrated 1 entries" in capsys.readouterr().out
+    assert SessionStore(str(db)).get_by_query("هاتف")["query"] == "هاتف"
+
+def test_migrate_missing_file(tmp_path, store):
+    with pytest.raises(RuntimeError):
+        migrate_json(str(tmp_path / "missing.json"), store)
+
+# ---------------- Evaluation Write-Back ----------------
+def test_update_evaluation(store):
+    session = make_session("tablet", session_id="abc")
+    session["evaluation_score"] = None
+    store.save(session)
+
+    assert store.update_evaluation("abc", {"total": 88}) == 1
+    saved = store.get_by_session_id("abc")
+    assert saved["evaluation_score"] == {"total": 88}
+    assert saved["evaluation_status"] == "done"
+    assert store.update_evaluation("missing", {"total": 1}) == 0
+
+def test_update_evaluation_scoped_to_one_turn_of_a_conversation(store):
+    store.save(make_session("tablet", session_id="conv"))
+    store.save(make_session("which is cheaper?", session_id="conv"))
+
+    assert store.update_evaluation("conv", {"total": 70}, query="tablet") == 1
+    assert store.get_by_query("tablet")["evaluation_score"] == {"total": 70}
+    assert store.get_by_query("which is cheaper?")["evaluation_score"] != {"total": 70}
+
+# ---------------- Query Popularity ----------------
+def test_repeated_queries_count_hits(store):
+    for _ in range(3):
+        store.save(make_session("iphone 15"))
+    row = store._conn().execute("SELECT hits FROM sessions WHERE query = 'iphone 15'").fetchone()
+    assert row[0] == 3
+
+def test_top_queries_weigh_frequency_by_recency(store):
+    conn = store._conn()
+    with conn:
+        conn.executemany(
+            "INSERT INTO sessions (session_id, query, data, created_at, updated_at, last_asked_at, hits)"
+            " VALUES (?, ?, '{}', ?, 1000, ?, ?)",
+            [("s", "old favourite", 0, 1000 - 86400 * 2, 10),   # 10 × 0.25 = 2.5
+             ("s", "hot today", 0, 1000 - 3600, 3),              # ~2.9
+             ("s", "one-off", 0, 1000, 1),
+             ("s", "ancient", 0, 1000 - 86400 * 30, 500)],       # خارج النافذة
+        )
+    top = store.top_queries(limit=2, half_life=86400, now=1000)
+    assert [r["query"] for r in top] == ["hot today", "old favourite"]
+
+def test_evaluation_write_back_does_not_make_queries_recent(store):
+    store.save(make_session("iphone 15", session_id="s1"))
+    store._conn().execute("UPDATE sessions SET last_asked_at = 1000, updated_at = 1000")
+    store._conn().commit()
+    store.update_evaluation("s1", {"total": 90})
+    assert store.top_queries(now=1000 + 86400 * 30) == []
+    assert store.top_queries(now=2000)[0]["last_asked_at"] == 1000
+
+def test_old_database_gains_hits_and_last_asked_columns(tmp_path):
+    import sqlite3
+    path = str(tmp_path / "old.db")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE sessions (id INTEGER PRIMARY KEY AUTOINCREMENT, session_id TEXT,"
+                 " query TEXT NOT NULL UNIQUE, data TEXT NOT NULL, created_at REAL NOT NULL, updated_at REAL NOT NULL)")
+    conn.commit()
+    conn.close()
+
+    conn = sqlite3.connect(path)
+    conn.execute("INSERT INTO sessions (session_id, query, data, created_at, updated_at) VALUES ('s', 'old', '{}', 5, 7)")
+    conn.commit()
+    conn.close()
+
+    store = SessionStore(path)
+    store.save(make_session("tablet"))
+    store.save(make_session("tablet"))
+    assert store.top_queries(limit=1)[0]["hits"] == 2
+    assert store._conn().execute("SELECT last_asked_at FROM sessions WHERE query = 'old'").fetchone()[0] == 7
+    store.close()
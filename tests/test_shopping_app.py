@@ -6,16 +6,21 @@ from unittest.mock import patch, mock_open
 import shopping_app
 from shopping_app import show_chat, save_chat_unified, BACKEND_URL
 
-# ---------------- Fixture لإنشاء ملف JSON مؤقت ----------------
+# ---------------- Fixture لإنشاء ملف JSONL مؤقت ----------------
 @pytest.fixture
 def temp_json(tmp_path):
-    file_path = tmp_path / "all_chats.json"
-    file_path.write_text("[]", encoding="utf-8")
+    file_path = tmp_path / "all_chats.jsonl"
     shopping_app.ALL_CHATS_FILE_TEST = file_path
-    shopping_app.all_chats = []
     yield file_path
     shopping_app.ALL_CHATS_FILE_TEST = None
-    shopping_app.all_chats = []
+
+def read_chats(file_path):
+    # آخر سطر لكل سؤال هو النسخة الحالية
+    chats = {}
+    for line in file_path.read_text(encoding="utf-8").splitlines():
+        entry = json.loads(line)
+        chats[entry["query"]] = entry
+    return list(chats.values())
 
 # ---------------- Test detect_language ----------------
 @pytest.mark.parametrize("text,expected", [
@@ -26,6 +31,12 @@ def temp_json(tmp_path):
 def test_detect_language(text, expected):
     assert shopping_app.detect_language(text) == expected
 
+def test_detect_language_is_cached():
+    shopping_app.detect_language.cache_clear()
+    shopping_app.detect_language("Hello there")
+    shopping_app.detect_language("Hello there")
+    assert shopping_app.detect_language.cache_info().hits == 1
+
 def test_detect_language_exception(monkeypatch):
     def raise_exc(text): raise Exception("fail")
     monkeypatch.setattr(shopping_app, "detect_language", raise_exc)
@@ -54,8 +65,7 @@ def test_show_chat_empty(monkeypatch):
 def test_save_chat_unified_with_file(temp_json):
     entry = {"session_id":"1","query":"phone","products":[],"ai_reply":"reply","evaluation_score":{"total":50}}
     save_chat_unified(entry)
-    with open(temp_json, "r", encoding="utf-8") as f:
-        saved = json.load(f)
+    saved = read_chats(temp_json)
     assert saved[0]["query"] == "phone"
 
 def test_update_existing_chat(temp_json):
@@ -63,12 +73,31 @@ def test_update_existing_chat(temp_json):
     entry2 = {"session_id":"2","query":"laptop","products":[{"title":"Laptop B"}],"ai_reply":"reply2","evaluation_score":{"total":80}}
     save_chat_unified(entry1)
     save_chat_unified(entry2)
-    with open(temp_json, "r", encoding="utf-8") as f:
-        saved = json.load(f)
+    saved = read_chats(temp_json)
+    assert len(saved) == 1
     titles = [p["title"] for p in saved[0]["products"]]
     assert "Laptop A" in titles and "Laptop B" in titles
     assert saved[0]["ai_reply"] == "reply2"
 
+# ---------------- Test SSE parsing ----------------
+def test_iter_sse_events():
+    lines = [
+        b'event: products',
+        b'data: {"products_by_item": {"tablet": []}}',
+        b'',
+        'event: token'.encode("utf-8"),
+        'data: {"text": "مرحبا"}'.encode("utf-8"),
+        b'',
+        b': keep-alive comment',
+        b'event: done',
+        rb'data: {"ai_reply": "\u0645\u0631\u062d\u0628\u0627"}',
+    ]
+    response = types.SimpleNamespace(iter_lines=lambda: iter(lines))
+    events = list(shopping_app.iter_sse_events(response))
+    assert [e for e, _ in events] == ["products", "token", "done"]
+    assert events[1][1]["text"] == "مرحبا"
+    assert events[2][1]["ai_reply"] == "مرحبا"
+
 # ---------------- Test product extraction ----------------
 def test_product_data_structure():
     products_data = {"laptop":[{"title":"Test Laptop","price":"$999","link":"http://example.com/product","image":"http://example.com/image.jpg"}]}
@@ -165,9 +194,7 @@ def test_full_user_flow(monkeypatch, temp_json):
     assert messages[1]["role"] == "ai" and messages[1]["content"] == "AI Reply"
     assert any("P1" in o for o in outputs)
 
-    with open(temp_json, "r", encoding="utf-8") as f:
-        saved = shopping_app.all_chats if hasattr(shopping_app, "all_chats") else []
-        if not saved: saved = json.load(f)
+    saved = read_chats(temp_json)
     assert saved[0]["query"] == "Test Query"
     assert saved[0]["ai_reply"] == "AI Reply"
     assert saved[0]["products"][0]["title"] == "P1"
@@ -186,3 +213,27 @@ def test_css_styles():
 # ---------------- Test environment ----------------
 def test_backend_url():
     assert BACKEND_URL.startswith("http")
+
+# ---------------- Test load_more_products ----------------
+def test_load_more_products_appends_page_and_advances_cursor(monkeypatch):
+    state = types.SimpleNamespace(more_products={"lang": "en", "cursors": {"tablet": "c1"}, "products": {}})
+    monkeypatch.setattr(shopping_app.st, "session_state", state)
+    page = {"products": [{"title": "Tab 6"}], "next_cursor": "c2"}
+    fake = types.SimpleNamespace(status_code=200, json=lambda: page)
+    session = types.SimpleNamespace(get=lambda url, params=None, timeout=None: calls.append(params) or fake)
+    calls = []
+    with patch("shopping_app.get_http_session", return_value=session):
+        shopping_app.load_more_products("tablet")
+    assert calls == [{"cursor": "c1"}]
+    assert state.more_products["products"]["tablet"] == [{"title": "Tab 6"}]
+    assert state.more_products["cursors"]["tablet"] == "c2"
+
+def test_chat_log_keeps_original_image_urls():
+    from image_proxy import proxy_url
+    products = [
+        {"title": "P1", "image": proxy_url("https://img.example.com/a.jpg", secret="s")},
+        {"title": "P2", "image": "https://img.example.com/b.jpg"},
+        {"title": "P3", "image": None},
+    ]
+    images = [p["image"] for p in shopping_app.chat_log_products(products)]
+    assert images == ["https://img.example.com/a.jpg", "https://img.example.com/b.jpg", None]
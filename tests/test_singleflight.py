@@ -0,0 +1,69 @@
+import threading
+import time
+import pytest
+from singleflight import SingleFlight
+
+def test_concurrent_calls_share_one_execution():
+    flights = SingleFlight()
+    calls = []
+    release = threading.Event()
+
+    def work():
+        calls.append(1)
+        release.wait(2)
+        return "result"
+
+    results = []
+    def run():
+        results.append(flights.do("k", work))
+
+    threads = [threading.Thread(target=run) for _ in range(5)]
+    for t in threads:
+        t.start()
+    while flights.stats()["coalesced"] < 4:
+        time.sleep(0.01)
+    release.set()
+    for t in threads:
+        t.join()
+
+    assert len(calls) == 1
+    assert sorted(shared for _, shared in results) == [False, True, True, True, True]
+    assert all(value == "result" for value, _ in results)
+    assert flights.stats() == {"in_flight": 0, "executions": 1, "coalesced": 4}
+
+def test_errors_propagate_to_waiters_and_key_is_released():
+    flights = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+
+    def failing():
+        started.set()
+        release.wait(2)
+        raise RuntimeError("upstream down")
+
+    errors = []
+    def run():
+        try:
+            flights.do("k", failing)
+        except RuntimeError as e:
+            errors.append(str(e))
+
+    leader = threading.Thread(target=run)
+    leader.start()
+    started.wait(2)
+    follower = threading.Thread(target=run)
+    follower.start()
+    while flights.stats()["coalesced"] < 1:
+        time.sleep(0.01)
+    release.set()
+    leader.join()
+    follower.join()
+
+    assert errors == ["upstream down", "upstream down"]
+    assert flights.do("k", lambda: 42) == (42, False)
+
+def test_sequential_calls_are_not_coalesced():
+    flights = SingleFlight()
+    assert flights.do("k", lambda: 1) == (1, False)
+    assert flights.do("k", lambda: 2) == (2, False)
+    assert flights.stats()["coalesced"] == 0
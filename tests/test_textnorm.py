@@ -0,0 +1,40 @@
+import pytest
+from textnorm import detect_language, detect_script, keywords, normalize_text, query_key, tokenize
+
+@pytest.mark.parametrize("text,script,lang", [
+    ("Hello world", "en", "en"),
+    ("مرحبا بالعالم", "ar", "ar"),
+    ("ايفون 15 pro", "mixed", "ar"),
+    ("؟ 15", "", "en"),
+    ("", "", "en"),
+])
+def test_script_and_language_detection(text, script, lang):
+    assert detect_script(text) == script
+    assert detect_language(text) == lang
+
+def test_arabic_normalization():
+    assert normalize_text("أيفونٌ ١٥ بـــرو") == "ايفون 15 برو"
+    assert normalize_text("مكيّف إل جي ذكيّة") == "مكيف ال جي ذكيه"
+    assert normalize_text("مستشفى") == "مستشفي"
+    assert normalize_text(None) == ""
+
+def test_model_number_punctuation_is_kept():
+    assert normalize_text("Galaxy S24+ vs. Galaxy S24!") == "galaxy s24+ vs galaxy s24"
+    assert normalize_text("MacBook Air 13.6\" (2024)") == "macbook air 13.6 2024"
+    assert query_key("galaxy s24+") != query_key("galaxy s24")
+
+def test_bilingual_keywords_drop_stopwords_and_duplicates():
+    assert keywords("Which is the best iPhone 15 vs. iPhone 15?") == ("iphone", "15")
+    assert keywords("ما هو أفضل ايفون ١٥") == ("ايفون", "15")
+    assert keywords("which is best") == ("which", "is", "best")
+    assert tokenize("compare iphone and galaxy") == ["iphone", "galaxy"]
+
+def test_equivalent_queries_share_a_cache_key():
+    assert query_key("iPhone 15?") == query_key("which is the best iphone 15") == "iphone 15"
+    assert query_key("أيفون ١٥") == query_key("إيفون 15؟") == "ايفون 15"
+
+def test_results_are_memoized():
+    keywords.cache_clear()
+    keywords("galaxy s24 ultra")
+    keywords("galaxy s24 ultra")
+    assert keywords.cache_info().hits == 1
@@ -0,0 +1,160 @@
+import threading
+import types
+import pytest
+import requests
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import patch
+from upstream import UpstreamClient
+
+def fake_response(status, headers=None):
+    return types.SimpleNamespace(status_code=status, headers=headers or {}, close=lambda: None)
+
+@pytest.fixture
+def client():
+    return UpstreamClient("test", connect_timeout=1, read_timeout=2, pool_size=2,
+                          max_retries=2, backoff_base=0.1, backoff_max=1)
+
+# ---------------- Retry / Backoff ----------------
+def test_retries_retryable_status_then_succeeds(client):
+    responses = [fake_response(503), fake_response(429), fake_response(200)]
+    with patch.object(client.session, "request", side_effect=responses) as mock_request, \
+         patch("upstream.time.sleep") as mock_sleep:
+        response = client.get("http://upstream/x")
+
+    assert response.status_code == 200
+    assert mock_request.call_count == 3
+    assert mock_sleep.call_count == 2
+    stats = client.stats()
+    assert stats["retries"] == 2 and stats["attempts"] == 3 and stats["requests"] == 1
+    assert stats["statuses"] == {"503": 1, "429": 1, "200": 1}
+
+def test_returns_last_response_when_retries_exhausted(client):
+    with patch.object(client.session, "request", return_value=fake_response(500)), \
+         patch("upstream.time.sleep"):
+        response = client.get("http://upstream/x")
+    assert response.status_code == 500
+    assert client.stats()["attempts"] == 3
+
+def test_non_retryable_status_is_not_retried(client):
+    with patch.object(client.session, "request", return_value=fake_response(401)) as mock_request:
+        assert client.get("http://upstream/x").status_code == 401
+    assert mock_request.call_count == 1
+
+def test_connection_error_raises_runtime_error(client):
+    with patch.object(client.session, "request", side_effect=requests.ConnectionError("refused")), \
+         patch("upstream.time.sleep"):
+        with pytest.raises(RuntimeError, match="test request failed"):
+            client.get("http://upstream/x")
+    assert client.stats()["failures"] == 1
+    assert client.stats()["in_flight"] == 0
+
+def test_timeout_is_applied_by_default(client):
+    with patch.object(client.session, "request", return_value=fake_response(200)) as mock_request:
+        client.post("http://upstream/x", json={})
+    assert mock_request.call_args.kwargs["timeout"] == (1, 2)
+
+def test_backoff_honours_retry_after_and_cap(client):
+    assert client.backoff_delay(0, fake_response(429, {"Retry-After": "30"})) == 1
+    for attempt in range(5):
+        assert 0 <= client.backoff_delay(attempt) <= 1
+
+# ---------------- Connection Pooling ----------------
+class OkHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        body = b"{}"
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+def test_connections_are_reused(client):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), OkHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        url = f"http://127.0.0.1:{server.server_address[1]}/"
+        for _ in range(3):
+            assert client.get(url).status_code == 200
+    finally:
+        server.shutdown()
+
+    pools = client.stats()["pools"]
+    assert len(pools) == 1
+    assert pools[0]["connections_opened"] == 1
+    assert pools[0]["requests_sent"] == 3
+
+# ---------------- Metrics ----------------
+def test_upstream_calls_are_exported_as_metrics(client):
+    from metrics import UPSTREAM_REQUESTS, UPSTREAM_SECONDS
+    before = UPSTREAM_REQUESTS.value(upstream="test", status="200")
+    with patch.object(client.session, "request", side_effect=[fake_response(503), fake_response(200)]), \
+         patch("upstream.time.sleep"):
+        client.get("http://upstream/x")
+    assert UPSTREAM_REQUESTS.value(upstream="test", status="200") == before + 1
+    assert UPSTREAM_SECONDS.count(upstream="test", status="200") >= 1
+
+# ---------------- Governor ----------------
+def test_open_circuit_fails_fast_without_calling_upstream():
+    from governor import Governor, UpstreamUnavailable
+    governor = Governor("test", failure_threshold=2, open_seconds=30)
+    client = UpstreamClient("test", connect_timeout=1, read_timeout=2, max_retries=3,
+                            backoff_base=0.1, backoff_max=1, governor=governor)
+    with patch.object(client.session, "request", return_value=fake_response(503)) as mock_request, \
+         patch("upstream.time.sleep"):
+        with pytest.raises(UpstreamUnavailable) as exc:
+            client.get("http://upstream/x")
+        assert mock_request.call_count == 2  # القاطع فُتح بعد فشلين فلم تُرسل بقية المحاولات
+        with pytest.raises(UpstreamUnavailable):
+            client.get("http://upstream/x")
+        assert mock_request.call_count == 2
+
+    assert exc.value.reason == "circuit_open"
+    stats = client.stats()
+    assert stats["governor"]["state"] == "open"
+    assert stats["statuses"] == {"503": 2} and stats["failures"] == 2
+
+def test_throttled_response_lowers_concurrency_limit():
+    from governor import Governor
+    governor = Governor("test", max_concurrency=8, failure_threshold=100)
+    client = UpstreamClient("test", connect_timeout=1, read_timeout=2, max_retries=1,
+                            backoff_base=0.1, backoff_max=1, governor=governor)
+    with patch.object(client.session, "request", side_effect=[fake_response(429), fake_response(200)]), \
+         patch("upstream.time.sleep"):
+        assert client.get("http://upstream/x").status_code == 200
+    assert 4 < governor.limit < 5
+
+def test_unexpected_exception_releases_governor_slot():
+    from governor import Governor
+    governor = Governor("test", max_concurrency=2, max_wait=0.01, failure_threshold=100)
+    client = UpstreamClient("test", connect_timeout=1, read_timeout=2, max_retries=0,
+                            backoff_base=0.1, backoff_max=1, governor=governor)
+    with patch.object(client.session, "request", side_effect=requests.exceptions.ChunkedEncodingError("cut")):
+        for _ in range(2):
+            with pytest.raises(requests.exceptions.ChunkedEncodingError):
+                client.get("http://upstream/x")
+    assert governor.in_flight == 0 and client.stats()["failures"] == 2
+    with patch.object(client.session, "request", return_value=fake_response(200)):
+        assert client.get("http://upstream/x").status_code == 200
+
+def test_failed_half_open_probe_reopens_circuit_on_unexpected_exception():
+    from governor import Governor
+    now = [0.0]
+    governor = Governor("test", failure_threshold=1, open_seconds=10, clock=lambda: now[0])
+    client = UpstreamClient("test", connect_timeout=1, read_timeout=2, max_retries=0,
+                            backoff_base=0.1, backoff_max=1, governor=governor)
+    governor._trip()
+    now[0] = 11.0
+    with patch.object(client.session, "request", side_effect=requests.exceptions.InvalidURL("bad")):
+        with pytest.raises(requests.exceptions.InvalidURL):
+            client.get("http://upstream/x")
+    assert governor.state == "open" and not governor.probe_in_flight
+    now[0] = 22.0
+    with patch.object(client.session, "request", return_value=fake_response(200)):
+        assert client.get("http://upstream/x").status_code == 200
+    assert governor.state == "closed"
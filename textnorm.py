@@ -0,0 +1,69 @@
+import re
+from functools import lru_cache
+
+# ---------------- Shared Text Normalization (Arabic + English) ----------------
+# مصدر واحد لاكتشاف اللغة وتوحيد النص العربي والكلمات المفتاحية، تستخدمه الواجهتان والكاش والفلاتر،
+# حتى تصل الصيغ المتكافئة ("أيفون ١٥" و"ايفون 15") إلى نفس مدخل الكاش.
+ARABIC_LETTERS = re.compile(r"[\u0621-\u064A\u0671-\u06D3\u06FA-\u06FF]")
+LATIN_LETTERS = re.compile(r"[A-Za-z]")
+ARABIC_DIACRITICS = re.compile(r"[\u0610-\u061A\u064B-\u065F\u0670\u06D6-\u06ED]")
+TATWEEL = "\u0640"
+# علامات الترقيم تُحذف، عدا ما هو جزء من رقم الموديل: "+" بعد حرف/رقم ("s24+") و"." بين رقمين ("13.6")
+NON_WORD = re.compile(r"(?!(?<=\d)\.(?=\d))(?!(?<=\w)\+)[^\w]+", re.UNICODE)
+ARABIC_TRANSLATION = str.maketrans({
+    "أ": "ا", "إ": "ا", "آ": "ا", "ٱ": "ا",
+    "ى": "ي", "ة": "ه", "ؤ": "و", "ئ": "ي",
+    "٠": "0", "١": "1", "٢": "2", "٣": "3", "٤": "4",
+    "٥": "5", "٦": "6", "٧": "7", "٨": "8", "٩": "9",
+    "۰": "0", "۱": "1", "۲": "2", "۳": "3", "۴": "4",
+    "۵": "5", "۶": "6", "۷": "7", "۸": "8", "۹": "9",
+})
+
+# بالصيغة الموحدة (بعد normalize_text)
+STOPWORDS = frozenset({
+    "which", "is", "the", "or", "and", "vs", "versus", "compare", "a", "an", "for", "with", "of", "best", "to", "in",
+    "what", "between", "difference", "me", "show", "find", "please", "i", "want", "need",
+    "قارن", "مقارنه", "بين", "او", "و", "مع", "في", "من", "افضل", "اي", "ما", "هل", "على", "عن",
+    "الفرق", "هو", "هي", "ماهو", "ماهي", "اريد", "ابي", "ابغي", "لي", "عندي", "اعطني",
+})
+
+CACHE_SIZE = 8192
+
+# ---------------- Script / Language Detection ----------------
+# "ar" | "en" | "mixed" | "" (بدون حروف)
+@lru_cache(maxsize=CACHE_SIZE)
+def detect_script(text):
+    has_arabic = ARABIC_LETTERS.search(text or "") is not None
+    has_latin = LATIN_LETTERS.search(text or "") is not None
+    if has_arabic and has_latin:
+        return "mixed"
+    return "ar" if has_arabic else "en" if has_latin else ""
+
+# أي حرف عربي يعني أن المستخدم يكتب بالعربية ("ايفون 15 pro" → ar)
+@lru_cache(maxsize=CACHE_SIZE)
+def detect_language(text):
+    return "ar" if detect_script(text) in ("ar", "mixed") else "en"
+
+# ---------------- Normalization ----------------
+@lru_cache(maxsize=CACHE_SIZE)
+def normalize_text(text):
+    text = ARABIC_DIACRITICS.sub("", (text or "").lower().replace(TATWEEL, ""))
+    return NON_WORD.sub(" ", text.translate(ARABIC_TRANSLATION)).strip()
+
+def tokenize(text):
+    return [t for t in normalize_text(text).split() if t not in STOPWORDS]
+
+# ---------------- Keywords ----------------
+# كلمات فريدة بالترتيب بدون كلمات التوقف؛ إذا كان النص كله كلمات توقف نبقي الكلمات كما هي
+@lru_cache(maxsize=CACHE_SIZE)
+def keywords(text):
+    tokens = normalize_text(text).split()
+    kept = [t for t in tokens if t not in STOPWORDS] or tokens
+    return tuple(dict.fromkeys(kept))
+
+# نص موحد لمفاتيح الكاش وطلبات SerpAPI: "Which is the best iPhone 15?" و"ايفون ١٥" بصيغة واحدة لكل منهما
+def query_key(text):
+    return " ".join(keywords(text))
+
+def cache_info():
+    return {fn.__name__: fn.cache_info()._asdict() for fn in (detect_script, detect_language, normalize_text, keywords)}
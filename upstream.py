@@ -0,0 +1,224 @@
+import os
+import random
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+
+from governor import Governor, UpstreamUnavailable, CLOSED, HALF_OPEN, OPEN
+from metrics import REGISTRY, UPSTREAM_REQUESTS, UPSTREAM_SECONDS
+
+# ---------------- Configuration ----------------
+# حجم المجمع = عدد الخيوط التي قد تستدعي نفس الخدمة في نفس الوقت
+# (خيوط FastAPI الافتراضية = 40)
+UPSTREAM_POOL_SIZE = int(os.getenv("UPSTREAM_POOL_SIZE", "40"))
+UPSTREAM_MAX_RETRIES = int(os.getenv("UPSTREAM_MAX_RETRIES", "3"))
+UPSTREAM_BACKOFF_BASE = float(os.getenv("UPSTREAM_BACKOFF_BASE", "0.5"))
+UPSTREAM_BACKOFF_MAX = float(os.getenv("UPSTREAM_BACKOFF_MAX", "8"))
+
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+
+# حصة كل خدمة: <NAME>_RATE طلب/ثانية (0 = بلا حد) و<NAME>_BURST، مثلاً GROQ_RATE=0.5 لخطة 30 طلب/دقيقة
+def governor_from_env(name, max_concurrency=UPSTREAM_POOL_SIZE):
+    prefix = name.upper()
+    return Governor(
+        name,
+        rate=float(os.getenv(f"{prefix}_RATE", "0")),
+        burst=float(os.getenv(f"{prefix}_BURST", "10")),
+        max_concurrency=int(os.getenv(f"{prefix}_MAX_CONCURRENCY", str(max_concurrency))),
+        max_queue=int(os.getenv(f"{prefix}_MAX_QUEUE", "64")),
+        max_wait=float(os.getenv(f"{prefix}_MAX_WAIT", "10")),
+        failure_threshold=int(os.getenv(f"{prefix}_BREAKER_FAILURES", "5")),
+        open_seconds=float(os.getenv(f"{prefix}_BREAKER_OPEN_SECONDS", "30")),
+    )
+
+def attempt_outcome(status_code):
+    if status_code == 429:
+        return "throttled"
+    return "error" if status_code >= 500 else "ok"
+
+# ---------------- Pooled Upstream Client ----------------
+class UpstreamClient:
+    def __init__(self, name, connect_timeout, read_timeout, pool_size=UPSTREAM_POOL_SIZE,
+                 max_retries=UPSTREAM_MAX_RETRIES, backoff_base=UPSTREAM_BACKOFF_BASE,
+                 backoff_max=UPSTREAM_BACKOFF_MAX, governor=None):
+        self.name = name
+        self.governor = governor
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+        self.session = requests.Session()
+        self.adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+        self.session.mount("https://", self.adapter)
+        self.session.mount("http://", self.adapter)
+
+        self._lock = threading.Lock()
+        self._counters = {
+            "requests": 0,
+            "attempts": 0,
+            "retries": 0,
+            "failures": 0,
+            "in_flight": 0,
+            "max_in_flight": 0,
+        }
+        self._statuses = {}
+
+    def _count(self, key, delta=1):
+        with self._lock:
+            self._counters[key] += delta
+            if key == "in_flight":
+                self._counters["max_in_flight"] = max(
+                    self._counters["max_in_flight"], self._counters["in_flight"]
+                )
+
+    def _acquire(self):
+        if self.governor is not None:
+            self.governor.acquire()
+
+    def _release(self, outcome, retry_after=None):
+        if self.governor is not None:
+            self.governor.release(outcome, retry_after)
+
+    def _count_status(self, status):
+        with self._lock:
+            self._statuses[status] = self._statuses.get(status, 0) + 1
+
+    @staticmethod
+    def retry_after(response):
+        value = response.headers.get("Retry-After")
+        return float(value) if value and value.isdigit() else None
+
+    def backoff_delay(self, attempt, response=None):
+        # Retry-After من الخادم له الأولوية (بحد أقصى backoff_max)
+        if response is not None:
+            retry_after = self.retry_after(response)
+            if retry_after is not None:
+                return min(retry_after, self.backoff_max)
+        # Full jitter: عشوائي بين 0 والحد الأسي
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        self._count("requests")
+        self._count("in_flight")
+        started = time.perf_counter()
+        final_status = "error"
+        try:
+            for attempt in range(self.max_retries + 1):
+                last_attempt = attempt == self.max_retries
+                # كل محاولة (بما فيها إعادة المحاولة) تمر عبر الـ governor؛ الرفض فوري بدون إعادة
+                try:
+                    self._acquire()
+                except UpstreamUnavailable:
+                    final_status = "rejected"
+                    self._count("failures")
+                    raise
+                self._count("attempts")
+                try:
+                    response = self.session.request(method, url, **kwargs)
+                except (requests.ConnectionError, requests.Timeout) as e:
+                    self._release("error")
+                    if last_attempt:
+                        self._count("failures")
+                        raise RuntimeError(f"{self.name} request failed: {e}") from e
+                    self._count("retries")
+                    time.sleep(self.backoff_delay(attempt))
+                    continue
+                except BaseException:
+                    # أي استثناء آخر (ChunkedEncodingError، InvalidURL، ...) يجب أن يحرر المكان في الـ governor
+                    self._release("error")
+                    self._count("failures")
+                    raise
+
+                self._release(attempt_outcome(response.status_code), self.retry_after(response))
+                self._count_status(response.status_code)
+                if response.status_code not in RETRYABLE_STATUSES or last_attempt:
+                    final_status = str(response.status_code)
+                    return response
+
+                self._count("retries")
+                delay = self.backoff_delay(attempt, response)
+                response.close()
+                time.sleep(delay)
+        finally:
+            self._count("in_flight", -1)
+            UPSTREAM_SECONDS.observe(time.perf_counter() - started, upstream=self.name, status=final_status)
+            UPSTREAM_REQUESTS.inc(upstream=self.name, status=final_status)
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def pool_stats(self):
+        pools = []
+        manager = self.adapter.poolmanager
+        for key in list(manager.pools.keys()):
+            pool = manager.pools.get(key)
+            if pool is None:
+                continue
+            pools.append({
+                "host": f"{pool.scheme}://{pool.host}:{pool.port}",
+                "connections_opened": pool.num_connections,
+                "requests_sent": pool.num_requests,
+                "idle_connections": pool.pool.qsize() if pool.pool else 0,
+                "max_size": pool.pool.maxsize if pool.pool else 0,
+            })
+        return pools
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self._counters)
+            statuses = {str(k): v for k, v in self._statuses.items()}
+        return {
+            **counters,
+            "statuses": statuses,
+            "timeout": {"connect": self.timeout[0], "read": self.timeout[1]},
+            "pools": self.pool_stats(),
+            "governor": self.governor.stats() if self.governor else None,
+        }
+
+# ---------------- Shared Clients ----------------
+serpapi_client = UpstreamClient(
+    "serpapi",
+    connect_timeout=float(os.getenv("SERPAPI_CONNECT_TIMEOUT", "3.05")),
+    read_timeout=float(os.getenv("SERPAPI_READ_TIMEOUT", "15")),
+    governor=governor_from_env("serpapi"),
+)
+
+groq_client = UpstreamClient(
+    "groq",
+    connect_timeout=float(os.getenv("GROQ_CONNECT_TIMEOUT", "3.05")),
+    read_timeout=float(os.getenv("GROQ_READ_TIMEOUT", "60")),
+    governor=governor_from_env("groq"),
+)
+
+# صور المنتجات من مواقع التجار (بروكسي /img)؛ محاولة إعادة واحدة تكفي
+image_client = UpstreamClient(
+    "images",
+    connect_timeout=float(os.getenv("IMAGE_CONNECT_TIMEOUT", "3.05")),
+    read_timeout=float(os.getenv("IMAGE_READ_TIMEOUT", "10")),
+    max_retries=int(os.getenv("IMAGE_MAX_RETRIES", "1")),
+)
+
+CLIENTS = {client.name: client for client in (serpapi_client, groq_client, image_client)}
+
+def upstream_stats():
+    return {name: client.stats() for name, client in CLIENTS.items()}
+
+def governor_stats():
+    return {name: client.governor.stats() for name, client in CLIENTS.items() if client.governor}
+
+CIRCUIT_STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+REGISTRY.gauge(
+    "upstream_circuit_state", "Circuit breaker state per upstream (0 closed, 1 half-open, 2 open).", ["upstream"],
+    lambda: {(name,): CIRCUIT_STATE_VALUES[stats["state"]] for name, stats in governor_stats().items()},
+)
+REGISTRY.gauge(
+    "upstream_concurrency_limit", "Current adaptive (AIMD) concurrency limit per upstream.", ["upstream"],
+    lambda: {(name,): stats["concurrency_limit"] for name, stats in governor_stats().items()},
+)